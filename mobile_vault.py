@@ -12,7 +12,7 @@ from kivy.metrics import dp
 from kivy.core.window import Window
 import os
 import threading
-from vault_core import load_or_create_vault, save_vault
+from vault_core import VaultSession, entry_summaries, key_cache
 from password_generator import generate_password, check_password_strength
 from cloud_sync import LocalCloudSync
 
@@ -76,7 +76,7 @@ class LoginScreen(Screen):
             
         try:
             app = App.get_running_app()
-            app.vault_data, app.vault_key = load_or_create_vault(app.vault_file, password)
+            app.open_session(password)
             app.master_password = password
             app.root.current = 'main'
             app.root.get_screen('main').refresh_entries()
@@ -108,7 +108,7 @@ class LoginScreen(Screen):
                 else:
                     Clock.schedule_once(lambda dt: self.show_popup('Advertencia', 'No se pudo sincronizar'))
                 
-                app.vault_data, app.vault_key = load_or_create_vault(app.vault_file, password)
+                app.open_session(password)
                 app.master_password = password
                 Clock.schedule_once(lambda dt: setattr(app.root, 'current', 'main'))
                 Clock.schedule_once(lambda dt: app.root.get_screen('main').refresh_entries())
@@ -178,7 +178,7 @@ class MainScreen(Screen):
             self.entries_layout.add_widget(empty_label)
             return
         
-        for i, entry in enumerate(app.vault_data["entries"]):
+        for i, entry in enumerate(entry_summaries(app.vault_data["entries"])):
             entry_widget = self.create_entry_widget(entry, i)
             self.entries_layout.add_widget(entry_widget)
     
@@ -267,12 +267,13 @@ class MainScreen(Screen):
         def sync_thread():
             try:
                 app = App.get_running_app()
+                app.session.flush()
                 success = app.cloud_sync.sync_vault(app.vault_file)
                 
                 Clock.schedule_once(lambda dt: popup.dismiss())
                 
                 if success:
-                    app.vault_data, app.vault_key = load_or_create_vault(app.vault_file, app.master_password)
+                    app.open_session(app.master_password)
                     Clock.schedule_once(lambda dt: self.refresh_entries())
                     Clock.schedule_once(lambda dt: self.show_popup('Éxito', 'Sincronización completada'))
                 else:
@@ -286,9 +287,9 @@ class MainScreen(Screen):
     
     def logout(self, instance):
         app = App.get_running_app()
-        app.vault_data = None
-        app.vault_key = None
+        app.close_session()
         app.master_password = None
+        key_cache.forget()
         app.root.current = 'login'
     
     def show_popup(self, title, message):
@@ -418,11 +419,10 @@ class EntryFormScreen(Screen):
         }
         
         if self.edit_index is not None:
-            app.vault_data["entries"][self.edit_index] = entry_data
+            app.session.update_entry(self.edit_index, entry_data)
         else:
-            app.vault_data["entries"].append(entry_data)
+            app.session.add_entry(entry_data)
         
-        save_vault(app.vault_file, app.vault_data, app.vault_key)
         app.root.current = 'main'
         app.root.get_screen('main').refresh_entries()
     
@@ -447,10 +447,35 @@ class MobileVaultApp(App):
         super().__init__(**kwargs)
         self.vault_data = None
         self.vault_key = None
+        self.session = None
         self.vault_file = "mobile_vault.json"
         self.master_password = None
         self.cloud_sync = LocalCloudSync("mobile_cloud")
     
+    def open_session(self, password):
+        """Abre la bóveda con escritura diferida de los cambios."""
+        self.close_session()
+        self.session = VaultSession.open(self.vault_file, password)
+        self.vault_data = self.session.data
+        self.vault_key = self.session.key
+    
+    def close_session(self):
+        """Escribe los cambios pendientes y cierra la sesión actual."""
+        if self.session is not None:
+            self.session.close()
+        self.session = None
+        self.vault_data = None
+        self.vault_key = None
+    
+    def on_pause(self):
+        # El sistema puede terminar la app en pausa: escribir lo pendiente
+        if self.session is not None:
+            self.session.flush()
+        return True
+    
+    def on_stop(self):
+        self.close_session()
+    
     def build(self):
         sm = ScreenManager()
         
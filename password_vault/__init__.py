@@ -9,6 +9,22 @@ Estructura de módulos:
 - :mod:`core`: Funciones para cifrar, descifrar y gestionar el
   archivo de la bóveda. Separa la lógica criptográfica y de
   persistencia en unidades pequeñas para facilitar el testeo.
+- :mod:`serializers`: Codificación de las entradas de la bóveda (JSON
+  estándar, JSON compacto o binaria) seleccionable por archivo.
+- :mod:`aio`: Corrutinas ``asyncio`` que ejecutan la carga, el guardado,
+  la autenticación y la sincronización en un ejecutor con concurrencia
+  acotada.
+- :mod:`agent`: Agente local que mantiene bóvedas desbloqueadas y
+  atiende a la CLI por un socket Unix sin repetir el KDF.
+- :mod:`sharing`: Bóvedas compartidas con una ranura de clave por
+  miembro (usuarios de :mod:`auth`), altas y bajas sin volver a cifrar.
+- :mod:`migrate`: Migración masiva de bóvedas en paralelo, reanudable
+  mediante un punto de control (``python -m password_vault.migrate``).
+- :mod:`storage`: Backends de almacenamiento sobre los que se cargan y
+  guardan las bóvedas: el archivo cifrado (por defecto) o SQLite con
+  una fila cifrada por entrada.
+- :mod:`attachments`: Adjuntos cifrados por fragmentos deduplicados,
+  guardados junto a la bóveda y referenciados desde las entradas.
 - :mod:`password_utils`: Utilidades para generar contraseñas seguras y
   evaluar su fortaleza. Estas funciones no dependen de la interfaz
   gráfica y pueden reutilizarse en otros contextos.
@@ -25,7 +41,33 @@ Cada módulo está diseñado para ser autocontenido y con
 documentación en español para facilitar su comprensión.
 """
 
-from .core import derive_key, encrypt_data, decrypt_data, load_or_create_vault, save_vault  # noqa: F401
+from .core import (  # noqa: F401
+    derive_key,
+    calibrate,
+    encrypt_data,
+    decrypt_data,
+    SeekableCipher,
+    load_or_create_vault,
+    load_vaults_parallel,
+    VaultLoadResult,
+    save_vault,
+    iter_vault_entries,
+    search_vault,
+    change_password,
+    write_vault,
+    KeyCache,
+    key_cache,
+    VaultSession,
+    Vault,
+    VaultSnapshot,
+    VaultConflictError,
+    VaultIntegrityError,
+    vault_lock,
+    vault_version,
+    LazyEntries,
+    entry_summaries,
+    match_entries,
+)
 from .password_utils import generate_password, check_password_strength  # noqa: F401
 from .cloud import LocalCloudSync  # noqa: F401
 from .audit import SecurityAudit, SecureClipboard  # noqa: F401
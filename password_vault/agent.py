@@ -0,0 +1,387 @@
+"""
+Agente de desbloqueo al estilo de ``ssh-agent``.
+
+Cada invocación de la CLI pide las credenciales y paga PBKDF2 antes de
+poder leer una sola entrada.  El agente es un proceso local que guarda
+sesiones ya desbloqueadas (:class:`core.VaultSession`) y atiende
+peticiones por un socket Unix, de modo que los comandos posteriores
+responden en milisegundos::
+
+    python -m password_vault.cli agent &
+    python -m password_vault.cli unlock usuario_vault.json
+    python -m password_vault.cli get usuario_vault.json github
+
+El socket se crea con permisos ``0600`` y, donde el sistema lo permite,
+se rechazan las conexiones de otros usuarios (``SO_PEERCRED``).  Las
+sesiones que no se usan durante ``idle_timeout`` segundos se cierran y
+su clave se olvida.  El agente guarda la clave derivada, nunca la
+contraseña; si otro proceso modifica la bóveda, la sesión se vuelve a
+leer con esa clave (:meth:`core.VaultSession.reload`) y, si la bóveda
+cambió de contraseña, se da por bloqueada.
+
+Protocolo: cada mensaje es un ``u32`` big-endian con la longitud
+seguido de un objeto JSON compacto.  Las peticiones llevan ``op``
+(``ping``, ``unlock``, ``lock``, ``list``, ``get`` o ``add``) y, salvo
+``ping``, la ruta de la bóveda en ``vault``; las respuestas llevan
+``ok`` y, si falla, ``error`` y ``code``.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .core import VaultSession, entry_summaries, key_cache, match_entries, vault_version
+
+# Variable de entorno con la ruta del socket del agente
+SOCKET_ENV = "VAULTKEY_AGENT_SOCK"
+# Segundos sin uso tras los que una sesión se cierra
+DEFAULT_IDLE_TIMEOUT = 900.0
+# Tamaño máximo de un mensaje del protocolo
+MAX_MESSAGE = 16 * 1024 * 1024
+
+_LENGTH = struct.Struct(">I")
+
+
+class AgentError(ValueError):
+    """
+    Error devuelto por el agente.
+
+    :param code: ``"locked"`` si la bóveda no está desbloqueada en el
+        agente, ``"error"`` en cualquier otro caso.
+    """
+
+    def __init__(self, message: str, code: str = "error") -> None:
+        super().__init__(message)
+        self.code = code
+
+
+def default_socket_path() -> str:
+    """Ruta del socket: :data:`SOCKET_ENV`, ``$XDG_RUNTIME_DIR`` o el directorio temporal."""
+    path = os.environ.get(SOCKET_ENV)
+    if path:
+        return path
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        return os.path.join(runtime, "vaultkey-agent.sock")
+    return os.path.join(tempfile.gettempdir(), f"vaultkey-agent-{os.getuid()}.sock")
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(size - len(buffer))
+        if not chunk:
+            if buffer:
+                raise AgentError("Mensaje del agente truncado")
+            return None
+        buffer += chunk
+    return bytes(buffer)
+
+
+def send_message(sock: socket.socket, message: Dict[str, Any]) -> None:
+    """Envía un mensaje del protocolo del agente."""
+    payload = json.dumps(message, separators=(",", ":")).encode('utf-8')
+    if len(payload) > MAX_MESSAGE:
+        raise AgentError("Mensaje demasiado grande")
+    sock.sendall(_LENGTH.pack(len(payload)) + payload)
+
+
+def recv_message(sock: socket.socket) -> Optional[Dict[str, Any]]:
+    """Recibe un mensaje del protocolo, o ``None`` si el otro extremo cerró."""
+    prefix = _recv_exact(sock, _LENGTH.size)
+    if prefix is None:
+        return None
+    (size,) = _LENGTH.unpack(prefix)
+    if size > MAX_MESSAGE:
+        raise AgentError("Mensaje demasiado grande")
+    payload = _recv_exact(sock, size) if size else b""
+    if payload is None:
+        raise AgentError("Mensaje del agente truncado")
+    message = json.loads(payload.decode('utf-8'))
+    if not isinstance(message, dict):
+        raise AgentError("Mensaje del agente no válido")
+    return message
+
+
+def _peer_uid(sock: socket.socket) -> Optional[int]:
+    """UID del proceso conectado, o ``None`` si la plataforma no lo ofrece."""
+    option = getattr(socket, "SO_PEERCRED", None)
+    if option is None:  # pragma: no cover - depende de la plataforma
+        return None
+    creds = sock.getsockopt(socket.SOL_SOCKET, option, struct.calcsize("3i"))
+    return struct.unpack("3i", creds)[1]
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    server: "VaultAgent"
+
+    def handle(self) -> None:
+        uid = _peer_uid(self.request)
+        if uid is not None and uid != os.getuid():
+            return
+        while True:
+            try:
+                message = recv_message(self.request)
+            except (AgentError, ValueError, OSError):
+                return
+            if message is None:
+                return
+            send_message(self.request, self.server.dispatch(message))
+
+
+class VaultAgent(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Servidor del agente.
+
+    :param path: Ruta del socket; por defecto :func:`default_socket_path`.
+    :param idle_timeout: Segundos sin uso tras los que se cierra una sesión.
+    :raises AgentError: Si ya hay un agente escuchando en ``path``.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path: Optional[str] = None, idle_timeout: float = DEFAULT_IDLE_TIMEOUT) -> None:
+        self.path = path or default_socket_path()
+        self.idle_timeout = idle_timeout
+        self._sessions: Dict[str, Tuple[VaultSession, float]] = {}
+        self._vault_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            client = connect(self.path)
+            if client is not None:
+                client.close()
+                raise AgentError(f"Ya hay un agente escuchando en {self.path}")
+            os.remove(self.path)  # socket abandonado por un agente anterior
+        previous = os.umask(0o177)
+        try:
+            super().__init__(self.path, _Handler)
+        finally:
+            os.umask(previous)
+        os.chmod(self.path, 0o600)
+
+    def service_actions(self) -> None:
+        self.expire_idle()
+
+    def expire_idle(self, now: Optional[float] = None) -> int:
+        """Cierra las sesiones inactivas y devuelve cuántas se cerraron."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            candidates = [path for path, (_, used) in self._sessions.items() if now - used >= self.idle_timeout]
+        closed = 0
+        for path in candidates:
+            with self._vault_lock(path):
+                with self._lock:
+                    # Una petición pudo usarla mientras se esperaba su cerrojo
+                    entry = self._sessions.get(path)
+                    if entry is None or now - entry[1] < self.idle_timeout:
+                        continue
+                    del self._sessions[path]
+                self._close(entry[0])
+                closed += 1
+        return closed
+
+    def _vault_lock(self, path: str) -> threading.Lock:
+        """Cerrojo que serializa las peticiones sobre la bóveda ``path``."""
+        with self._lock:
+            return self._vault_locks.setdefault(path, threading.Lock())
+
+    def _pop(self, path: str) -> Optional[VaultSession]:
+        with self._lock:
+            entry = self._sessions.pop(path, None)
+        return None if entry is None else entry[0]
+
+    @staticmethod
+    def _close(session: VaultSession) -> None:
+        try:
+            session.close()
+        finally:
+            key_cache.forget(session.salt)
+
+    def _session(self, vault: str) -> VaultSession:
+        with self._lock:
+            entry = self._sessions.get(vault)
+        if entry is None:
+            raise AgentError("La bóveda no está desbloqueada en el agente", "locked")
+        session = entry[0]
+        if os.path.exists(vault) and vault_version(vault) != session.version:
+            try:
+                session.reload()
+            except ValueError:
+                self._pop(vault)
+                self._close(session)
+                raise AgentError("La bóveda cambió; vuelva a desbloquearla", "locked") from None
+        with self._lock:
+            self._sessions[vault] = (session, time.monotonic())
+        return session
+
+    def dispatch(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Atiende una petición y devuelve la respuesta.
+
+        El cerrojo general solo protege la tabla de sesiones; el KDF, las
+        recargas y los guardados se hacen con el cerrojo de cada bóveda,
+        así que una petición lenta no detiene las de otras bóvedas.
+        """
+        try:
+            return dict(self._dispatch(message), ok=True)
+        except AgentError as exc:
+            return {"ok": False, "error": str(exc), "code": exc.code}
+        except (ValueError, OSError, KeyError, TypeError, IndexError) as exc:
+            return {"ok": False, "error": str(exc) or type(exc).__name__, "code": "error"}
+
+    def _dispatch(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        op = message.get("op")
+        if op == "ping":
+            with self._lock:
+                return {"vaults": sorted(self._sessions)}
+        vault = message.get("vault")
+        if op == "lock" and vault is None:
+            with self._lock:
+                paths = list(self._sessions)
+            for path in paths:
+                with self._vault_lock(path):
+                    session = self._pop(path)
+                    if session is not None:
+                        self._close(session)
+            return {}
+        if not isinstance(vault, str):
+            raise AgentError("Falta la ruta de la bóveda")
+        vault = os.path.realpath(vault)
+        with self._vault_lock(vault):
+            return self._dispatch_vault(op, vault, message)
+
+    def _dispatch_vault(self, op: Any, vault: str, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Atiende una petición sobre ``vault`` con su cerrojo adquirido."""
+        if op == "unlock":
+            if not os.path.exists(vault):
+                raise AgentError(f"La bóveda no existe: {vault}")
+            previous = self._pop(vault)
+            if previous is not None:
+                self._close(previous)
+            session = VaultSession.open(vault, message["password"])
+            with self._lock:
+                self._sessions[vault] = (session, time.monotonic())
+            return {"entries": len(session.entries)}
+        if op == "lock":
+            session = self._pop(vault)
+            if session is not None:
+                self._close(session)
+            return {}
+        session = self._session(vault)
+        if op == "list":
+            return {"entries": entry_summaries(session.entries)}
+        if op == "get":
+            return {"entries": [session.entries[i] for i in match_entries(session.entries, message["query"])]}
+        if op == "add":
+            entry = dict(message["entry"])
+            index = session.add_entry(entry)
+            session.flush()
+            return {"index": index, "id": entry["id"]}
+        raise AgentError(f"Operación desconocida: {op}")
+
+    def server_close(self) -> None:
+        with self._lock:
+            sessions = [session for session, _ in self._sessions.values()]
+            self._sessions.clear()
+        for session in sessions:
+            self._close(session)
+        super().server_close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class AgentClient:
+    """
+    Conexión con un agente en marcha.
+
+    :param sock: Socket ya conectado (ver :func:`connect`).
+    """
+
+    def __init__(self, sock: socket.socket) -> None:
+        self._sock = sock
+
+    def request(self, op: str, **fields: Any) -> Dict[str, Any]:
+        """
+        Envía una petición y devuelve la respuesta.
+
+        :raises AgentError: Si el agente responde con un error.
+        """
+        send_message(self._sock, dict(fields, op=op))
+        reply = recv_message(self._sock)
+        if reply is None:
+            raise AgentError("El agente cerró la conexión")
+        if not reply.pop("ok", False):
+            raise AgentError(reply.get("error", "Error del agente"), reply.get("code", "error"))
+        return reply
+
+    def unlock(self, vault: str, password: str) -> int:
+        """Desbloquea ``vault`` en el agente y devuelve su número de entradas."""
+        return self.request("unlock", vault=vault, password=password)["entries"]
+
+    def lock(self, vault: Optional[str] = None) -> None:
+        """Cierra la sesión de ``vault`` o, si se omite, todas."""
+        self.request("lock", vault=vault)
+
+    def list(self, vault: str) -> List[Dict[str, Any]]:
+        """Resúmenes (sin contraseñas) de las entradas de ``vault``."""
+        return self.request("list", vault=vault)["entries"]
+
+    def get(self, vault: str, query: str) -> List[Dict[str, Any]]:
+        """Entradas completas de ``vault`` que coinciden con ``query``."""
+        return self.request("get", vault=vault, query=query)["entries"]
+
+    def add(self, vault: str, entry: Dict[str, Any]) -> str:
+        """Añade ``entry`` a ``vault``, la guarda y devuelve su identificador."""
+        return self.request("add", vault=vault, entry=entry)["id"]
+
+    def close(self) -> None:
+        self._sock.close()
+
+    def __enter__(self) -> "AgentClient":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+def connect(path: Optional[str] = None, timeout: float = 5.0) -> Optional[AgentClient]:
+    """
+    Conecta con el agente, o devuelve ``None`` si no hay ninguno en marcha.
+
+    :param path: Ruta del socket; por defecto :func:`default_socket_path`.
+    :param timeout: Segundos de espera de cada operación del socket.
+    """
+    if not hasattr(socket, "AF_UNIX"):  # pragma: no cover - Windows
+        return None
+    path = path or default_socket_path()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    return AgentClient(sock)
+
+
+def serve(path: Optional[str] = None, idle_timeout: float = DEFAULT_IDLE_TIMEOUT) -> None:
+    """Ejecuta el agente en primer plano hasta recibir una interrupción o ``SIGTERM``."""
+    agent = VaultAgent(path, idle_timeout)
+    print(f"{SOCKET_ENV}={agent.path}; export {SOCKET_ENV};", flush=True)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        agent.serve_forever(poll_interval=1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        agent.server_close()
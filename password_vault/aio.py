@@ -0,0 +1,124 @@
+"""
+API asíncrona (``asyncio``) para cargar, guardar y sincronizar bóvedas.
+
+Las funciones de :mod:`core`, :mod:`auth` y :mod:`cloud` son bloqueantes:
+PBKDF2 ocupa la CPU cientos de milisegundos y la lectura y escritura de
+archivos espera al disco.  Este módulo ofrece corrutinas equivalentes
+que ejecutan todo ese trabajo en un ejecutor, de modo que el bucle de
+eventos sigue atendiendo otras tareas::
+
+    data, key = await aload_vault("vault.json", password)
+    data["entries"].append(entry)
+    await asave_vault("vault.json", data, key)
+
+El ejecutor y el número máximo de operaciones simultáneas se ajustan con
+:func:`configure`.  Por defecto se usa un conjunto de hilos propio del
+módulo, que basta porque ``hashlib.pbkdf2_hmac`` libera el GIL; un ejecutor de
+procesos solo sirve para funciones cuyos argumentos y resultados puedan
+serializarse (no para bóvedas ``records``, cuyas entradas son una
+:class:`core.LazyEntries`).
+
+Cancelar una corrutina la interrumpe de inmediato, pero el trabajo ya
+enviado al ejecutor termina igualmente (PBKDF2 no puede detenerse a
+medias) y su resultado se descarta.  Las escrituras son atómicas, así
+que un guardado cancelado se completa entero o no llega a producirse.
+La plaza de concurrencia se libera cuando ese trabajo acaba, no al
+cancelar, para que el límite se respete siempre.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import weakref
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .auth import authenticate
+from .cloud import LocalCloudSync
+from .core import load_or_create_vault, save_vault
+
+# Operaciones simultáneas por defecto en cada bucle de eventos
+DEFAULT_CONCURRENCY = 4
+
+_executor: Optional[Executor] = None
+_default_executor: Optional[ThreadPoolExecutor] = None
+_concurrency = DEFAULT_CONCURRENCY
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def configure(executor: Optional[Executor] = None, max_concurrency: Optional[int] = None) -> None:
+    """
+    Ajusta dónde y cuántas operaciones bloqueantes se ejecutan a la vez.
+
+    :param executor: Ejecutor para el trabajo bloqueante; ``None`` usa el
+        conjunto de hilos propio del módulo.
+    :param max_concurrency: Operaciones simultáneas por bucle de eventos;
+        si se omite se conserva el valor actual.
+    """
+    global _executor, _concurrency
+    if max_concurrency is not None:
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency debe ser al menos 1")
+        _concurrency = max_concurrency
+        _semaphores.clear()
+    _executor = executor
+
+
+def _get_executor() -> Executor:
+    global _default_executor
+    if _executor is not None:
+        return _executor
+    if _default_executor is None:
+        _default_executor = ThreadPoolExecutor(thread_name_prefix="vaultkey-aio")
+    return _default_executor
+
+
+def _semaphore(loop: asyncio.AbstractEventLoop) -> asyncio.Semaphore:
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(_concurrency)
+    return semaphore
+
+
+async def _run(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Ejecuta ``func`` en el ejecutor respetando el límite de concurrencia."""
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphore(loop)
+    await semaphore.acquire()
+    try:
+        work = _get_executor().submit(functools.partial(func, *args, **kwargs))
+    except BaseException:
+        semaphore.release()
+        raise
+
+    def release(_: Any) -> None:
+        # La plaza se devuelve cuando el trabajo termina de verdad (o se
+        # cancela antes de empezar), no cuando se cancela la corrutina.
+        try:
+            loop.call_soon_threadsafe(semaphore.release)
+        except RuntimeError:  # pragma: no cover - el bucle ya se cerró
+            pass
+
+    work.add_done_callback(release)
+    return await asyncio.wrap_future(work)
+
+
+async def aload_vault(vault_file: str, password: str, **kwargs: Any) -> Tuple[Dict, bytes]:
+    """Versión asíncrona de :func:`core.load_or_create_vault`."""
+    return await _run(load_or_create_vault, vault_file, password, **kwargs)
+
+
+async def asave_vault(vault_file: str, vault_data: Dict, key: bytes, salt: Optional[bytes] = None, **kwargs: Any) -> None:
+    """Versión asíncrona de :func:`core.save_vault`."""
+    await _run(save_vault, vault_file, vault_data, key, salt, **kwargs)
+
+
+async def aauthenticate(username: str, password: str, db_file: str) -> bool:
+    """Versión asíncrona de :func:`auth.authenticate`."""
+    return await _run(authenticate, username, password, db_file)
+
+
+async def async_sync_vault(sync: LocalCloudSync, vault_file: str) -> bool:
+    """Versión asíncrona de :meth:`cloud.LocalCloudSync.sync_vault`."""
+    return await _run(sync.sync_vault, vault_file)
@@ -0,0 +1,219 @@
+"""
+Adjuntos cifrados guardados fuera de la bóveda.
+
+Las claves SSH, certificados y documentos pequeños no se guardan dentro
+del archivo de la bóveda, que se descifra entero al abrirla y se
+reescribe al guardarla, sino en un directorio junto a ella
+(:func:`chunk_dir`).  Cada adjunto se lee por fragmentos de
+:data:`ATTACHMENT_CHUNK_SIZE` bytes y cada fragmento se cifra y se guarda
+en su propio archivo, con un nombre derivado de su contenido.  La
+entrada solo guarda una referencia con el nombre del adjunto, su tamaño
+y, por cada fragmento, su identificador y su clave::
+
+    ref = store_attachment("vault.json", key, "id_ed25519")
+    entry.setdefault("attachments", []).append(ref)
+    save_vault("vault.json", data, key)
+    extract_attachment("vault.json", ref, "copia_id_ed25519")
+
+Cargar la bóveda no lee ningún adjunto, y guardarla no reescribe los
+fragmentos, que son inmutables.  La clave de cada fragmento es un HMAC
+de su texto plano con una subclave de la clave de datos (cifrado
+convergente).  Así, los fragmentos iguales de una misma bóveda producen
+el mismo archivo y se guardan una sola vez, mientras que otra bóveda no
+puede reconocerlos.  Como la referencia incluye las claves, los
+adjuntos siguen abriéndose tras cambiar la contraseña o rotar la clave
+de datos (ver :mod:`sharing`).
+
+:class:`cloud.LocalCloudSync` copia junto con la bóveda solo los
+fragmentos que faltan en el destino.  Los que ninguna entrada
+referencia se eliminan con :func:`prune_chunks`.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import os
+import tempfile
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Set, Union
+
+from .crypto import DEFAULT_SUITE, SeekableCipher, subkey, tag, verify_tag
+
+# Directorio de fragmentos de cada bóveda: ``<bóveda>.chunks``
+CHUNKS_SUFFIX = ".chunks"
+# Tamaño del texto plano de cada fragmento
+ATTACHMENT_CHUNK_SIZE = 256 * 1024
+# Archivo de fragmento: firma, etiqueta HMAC-SHA256 y ciphertext
+CHUNK_MAGIC = b"VKCH"
+_CHUNK_TAG_SIZE = 32
+# Como cada clave cifra un único contenido, el nonce puede ser fijo
+_CHUNK_NONCE = bytes(16)
+
+
+def chunk_dir(vault_file: str) -> str:
+    """Directorio de los fragmentos de adjuntos de ``vault_file``."""
+    return vault_file + CHUNKS_SUFFIX
+
+
+def chunk_path(vault_file: str, chunk_id: str) -> str:
+    """Ruta del fragmento ``chunk_id``, repartido en subdirectorios por sus dos primeros caracteres."""
+    return os.path.join(chunk_dir(vault_file), chunk_id[:2], chunk_id)
+
+
+def list_chunks(directory: str) -> Set[str]:
+    """Identificadores de los fragmentos guardados en ``directory``."""
+    found: Set[str] = set()
+    if not os.path.isdir(directory):
+        return found
+    for prefix in os.listdir(directory):
+        subdir = os.path.join(directory, prefix)
+        if os.path.isdir(subdir):
+            found.update(name for name in os.listdir(subdir) if name.startswith(prefix) and not name.startswith("."))
+    return found
+
+
+def _chunk_key(secret: bytes, plaintext: bytes) -> bytes:
+    """Clave convergente del fragmento: HMAC de su contenido con la subclave de adjuntos."""
+    return hmac.new(secret, plaintext, hashlib.sha256).digest()
+
+
+def _chunk_id(chunk_key: bytes) -> str:
+    """Nombre del archivo del fragmento; no revela su clave ni su contenido."""
+    return subkey(chunk_key, b"chunk-id").hex()
+
+
+def _write_chunk(path: str, data: bytes) -> None:
+    """Escribe el fragmento de forma atómica, creando su subdirectorio."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(prefix=".chunk.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_file, path)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
+def _store_chunk(vault_file: str, secret: bytes, plaintext: bytes) -> List[str]:
+    """Cifra y guarda un fragmento si no existe ya; devuelve ``[id, clave]``."""
+    chunk_key = _chunk_key(secret, plaintext)
+    chunk_id = _chunk_id(chunk_key)
+    path = chunk_path(vault_file, chunk_id)
+    if not os.path.exists(path):
+        ciphertext = SeekableCipher(chunk_key, _CHUNK_NONCE, suite=DEFAULT_SUITE).encrypt_range(0, plaintext)
+        _write_chunk(path, CHUNK_MAGIC + tag(subkey(chunk_key, b"mac"), ciphertext) + ciphertext)
+    return [chunk_id, chunk_key.hex()]
+
+
+def store_attachment(
+    vault_file: str,
+    key: bytes,
+    source: Union[str, BinaryIO],
+    name: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Cifra ``source`` por fragmentos y los guarda junto a la bóveda.
+
+    El contenido se lee de fragmento en fragmento, así que la memoria
+    usada no depende del tamaño del adjunto.  Los fragmentos que ya
+    existen no se vuelven a escribir.  La bóveda no se modifica: la
+    referencia devuelta debe añadirse a una entrada y guardarse.
+
+    :param key: Clave de datos de la bóveda.
+    :param source: Ruta del archivo o archivo binario abierto.
+    :param name: Nombre del adjunto; por defecto, el del archivo.
+    :return: Referencia ``{"name", "size", "chunks"}`` para la entrada.
+    """
+    if name is None:
+        name = os.path.basename(source if isinstance(source, str) else getattr(source, "name", "adjunto"))
+    secret = subkey(key, b"attachments")
+    chunks: List[List[str]] = []
+    size = 0
+    f = open(source, 'rb') if isinstance(source, str) else source
+    try:
+        while True:
+            plaintext = f.read(ATTACHMENT_CHUNK_SIZE)
+            if not plaintext:
+                break
+            size += len(plaintext)
+            chunks.append(_store_chunk(vault_file, secret, plaintext))
+    finally:
+        if isinstance(source, str):
+            f.close()
+    return {"name": name, "size": size, "chunks": chunks}
+
+
+def _read_chunk(vault_file: str, chunk_id: str, chunk_key: bytes) -> bytes:
+    """Lee, autentica y descifra un fragmento."""
+    with open(chunk_path(vault_file, chunk_id), 'rb') as f:
+        header = f.read(len(CHUNK_MAGIC) + _CHUNK_TAG_SIZE)
+        if len(header) != len(CHUNK_MAGIC) + _CHUNK_TAG_SIZE or header[:len(CHUNK_MAGIC)] != CHUNK_MAGIC:
+            raise ValueError("Fragmento de adjunto corrupto")
+        ciphertext = f.read()
+    verify_tag(subkey(chunk_key, b"mac"), header[len(CHUNK_MAGIC):], ciphertext)
+    return SeekableCipher(chunk_key, _CHUNK_NONCE, suite=DEFAULT_SUITE).decrypt(0, ciphertext)
+
+
+def iter_attachment(vault_file: str, ref: Dict[str, Any]) -> Iterator[bytes]:
+    """
+    Descifra el adjunto ``ref`` fragmento a fragmento.
+
+    :raises FileNotFoundError: Si falta algún fragmento.
+    :raises VaultIntegrityError: Si un fragmento fue manipulado.
+    """
+    try:
+        chunks = [(chunk_id, bytes.fromhex(chunk_key)) for chunk_id, chunk_key in ref["chunks"]]
+    except (KeyError, TypeError, ValueError) as exc:
+        raise ValueError("Referencia de adjunto no válida") from exc
+    for chunk_id, chunk_key in chunks:
+        yield _read_chunk(vault_file, chunk_id, chunk_key)
+
+
+def read_attachment(vault_file: str, ref: Dict[str, Any]) -> bytes:
+    """Contenido completo del adjunto ``ref`` (ver :func:`iter_attachment`)."""
+    return b"".join(iter_attachment(vault_file, ref))
+
+
+def extract_attachment(vault_file: str, ref: Dict[str, Any], destination: str) -> None:
+    """Descifra el adjunto ``ref`` en ``destination``, sustituyéndolo de forma atómica."""
+    directory, name = os.path.split(os.path.abspath(destination))
+    fd, tmp_file = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for plaintext in iter_attachment(vault_file, ref):
+                f.write(plaintext)
+        os.replace(tmp_file, destination)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
+def referenced_chunks(entries: Iterable[Dict[str, Any]]) -> Set[str]:
+    """Identificadores de los fragmentos que referencian los adjuntos de ``entries``."""
+    found: Set[str] = set()
+    for entry in entries:
+        for ref in entry.get("attachments") or ():
+            found.update(chunk[0] for chunk in ref.get("chunks", ()))
+    return found
+
+
+def prune_chunks(vault_file: str, entries: Iterable[Dict[str, Any]]) -> int:
+    """
+    Elimina los fragmentos que no referencia ninguna de ``entries``.
+
+    Debe recibir todas las entradas de la bóveda ya guardada (y de sus
+    copias que compartan el directorio); un fragmento que otra entrada
+    siga usando no debe borrarse.
+
+    :return: Número de fragmentos eliminados.
+    """
+    used = referenced_chunks(entries)
+    removed = 0
+    for chunk_id in list_chunks(chunk_dir(vault_file)) - used:
+        os.remove(chunk_path(vault_file, chunk_id))
+        removed += 1
+    return removed
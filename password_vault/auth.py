@@ -6,6 +6,14 @@ contraseñas se almacenan utilizando PBKDF2-HMAC con una sal
 individual por usuario y un número elevado de iteraciones para
 dificultar ataques de fuerza bruta. Los datos de los usuarios se
 persisten en un archivo JSON cuyo nombre se pasa como parámetro.
+
+Para compartir bóvedas (ver :mod:`sharing`) cada usuario necesita
+además un par de claves Diffie-Hellman (grupo de 2048 bits del RFC
+3526): la clave pública se guarda en claro y la privada envuelta con
+una clave derivada de su contraseña.  El par no se crea al registrarse,
+sino la primera vez que el usuario comparte o abre una bóveda
+compartida (:func:`ensure_user_keys`), de modo que quien nunca comparte
+no paga el segundo KDF ni la generación de las claves.
 """
 
 from __future__ import annotations
@@ -13,8 +21,27 @@ from __future__ import annotations
 import json
 import os
 import hashlib
+import secrets
 from typing import Dict, Any, Tuple
 
+from .crypto import unwrap_key, wrap_key
+
+# Grupo 14 del RFC 3526: primo seguro de 2048 bits y generador 2
+DH_PRIME = int(
+    "FFFFFFFFFFFFFFFFC90FDAA22168C234C4C6628B80DC1CD129024E088A67CC74"
+    "020BBEA63B139B22514A08798E3404DDEF9519B3CD3A431B302B0A6DF25F1437"
+    "4FE1356D6D51C245E485B576625E7EC6F44C42E9A637ED6B0BFF5CB6F406B7ED"
+    "EE386BFB5A899FA5AE9F24117C4B1FE649286651ECE45B3DC2007CB8A163BF05"
+    "98DA48361C55D39A69163FA8FD24CF5F83655D23DCA3AD961C62F356208552BB"
+    "9ED529077096966D670C354E4ABC9804F1746C08CA18217C32905E462E36CE3B"
+    "E39E772C180E86039B2783A2EC07A28FB5C55DF06F4C52C9DE2BCBF695581718"
+    "3995497CEA956AE515D2261898FA051015728E5A8AACAA68FFFFFFFFFFFFFFFF",
+    16,
+)
+DH_GENERATOR = 2
+# Bits de los exponentes secretos (el doble del nivel de seguridad del grupo)
+_DH_SECRET_BYTES = 32
+
 
 def _derive_password_hash(password: str, salt: bytes, iterations: int = 200_000, key_length: int = 32) -> bytes:
     """
@@ -29,6 +56,34 @@ def _derive_password_hash(password: str, salt: bytes, iterations: int = 200_000,
     return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations, dklen=key_length)
 
 
+def generate_keypair() -> Tuple[int, int]:
+    """Genera un par ``(privada, pública)`` en el grupo :data:`DH_PRIME`."""
+    private = secrets.randbits(8 * _DH_SECRET_BYTES) | 1 << (8 * _DH_SECRET_BYTES - 1)
+    return private, pow(DH_GENERATOR, private, DH_PRIME)
+
+
+def check_public_key(public: int) -> int:
+    """
+    Comprueba que ``public`` es un elemento válido del grupo.
+
+    :raises ValueError: Si es 0, 1, ``p - 1`` o está fuera del grupo.
+    """
+    if not 1 < public < DH_PRIME - 1:
+        raise ValueError("Clave pública no válida")
+    return public
+
+
+def _attach_keypair(record: Dict[str, Any], password: str) -> int:
+    """Añade a ``record`` un par de claves nuevo y devuelve la pública."""
+    private, public = generate_keypair()
+    salt = os.urandom(16)
+    wrap = _derive_password_hash(password, salt, record.get('iterations', 200_000), record.get('key_length', 32))
+    record['public_key'] = format(public, 'x')
+    record['key_salt'] = salt.hex()
+    record['private_key'] = wrap_key(wrap, private.to_bytes(_DH_SECRET_BYTES, 'big'))
+    return public
+
+
 def load_user_db(db_file: str) -> Dict[str, Any]:
     """Carga la base de datos de usuarios desde un archivo JSON.
 
@@ -94,3 +149,66 @@ def authenticate(username: str, password: str, db_file: str) -> bool:
     key_length = user.get('key_length', 32)
     pwd_hash = _derive_password_hash(password, salt, iterations=iterations, key_length=key_length)
     return pwd_hash.hex() == user['pwd_hash']
+
+
+def ensure_user_keys(username: str, password: str, db_file: str) -> int:
+    """
+    Devuelve la clave pública del usuario, creando su par si aún no lo tiene.
+
+    Los usuarios no tienen claves hasta que las necesitan; :mod:`sharing`
+    llama a esta función al compartir o abrir una bóveda compartida.  Si
+    el par ya existe se devuelve sin derivar nada.
+
+    :raises ValueError: Si hay que crear el par y las credenciales no son válidas.
+    """
+    record = load_user_db(db_file).get(username)
+    if record and 'public_key' in record:
+        return int(record['public_key'], 16)
+    if not authenticate(username, password, db_file):
+        raise ValueError("Usuario o contraseña incorrectos")
+    db = load_user_db(db_file)
+    record = db[username]
+    public = _attach_keypair(record, password)
+    save_user_db(db_file, db)
+    return public
+
+
+def user_public_key(username: str, db_file: str) -> int:
+    """
+    Clave pública con la que compartir una bóveda con ``username``.
+
+    :raises ValueError: Si el usuario no existe o aún no tiene claves.
+    """
+    record = load_user_db(db_file).get(username)
+    if not record:
+        raise ValueError(f"El usuario no existe: {username}")
+    if 'public_key' not in record:
+        raise ValueError(
+            f"El usuario {username} no tiene claves para compartir bóvedas: "
+            "se crean la primera vez que abre una bóveda compartida (ver ensure_user_keys)"
+        )
+    return check_public_key(int(record['public_key'], 16))
+
+
+def unlock_private_key(username: str, password: str, db_file: str) -> int:
+    """
+    Descifra la clave privada de ``username`` con su contraseña.
+
+    :raises ValueError: Si el usuario no existe, no tiene claves o la
+        contraseña no coincide.
+    """
+    record = load_user_db(db_file).get(username)
+    if not record or 'private_key' not in record:
+        raise ValueError(f"El usuario {username} no tiene claves para compartir bóvedas")
+    try:
+        salt = bytes.fromhex(record['key_salt'])
+    except (KeyError, TypeError, ValueError) as exc:
+        raise ValueError("Registro de usuario corrupto") from exc
+    wrap = _derive_password_hash(password, salt, record.get('iterations', 200_000), record.get('key_length', 32))
+    try:
+        private = int.from_bytes(unwrap_key(wrap, record['private_key']), 'big')
+    except ValueError:
+        raise ValueError("Usuario o contraseña incorrectos") from None
+    if pow(DH_GENERATOR, private, DH_PRIME) != int(record['public_key'], 16):
+        raise ValueError("Registro de usuario corrupto")
+    return private
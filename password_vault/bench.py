@@ -0,0 +1,322 @@
+"""
+Mediciones de rendimiento para el motor de cifrado de la bóveda.
+
+Este módulo compara la implementación actual del flujo pseudoaleatorio
+y del XOR de :mod:`core` con la implementación original (concatenación
+de ``bytes`` y XOR byte a byte mediante un generador), que se conserva
+aquí únicamente como referencia.  Los resultados se expresan en MB/s
+para poder compararlos entre máquinas.  Las suites de cifrado de
+:data:`core.CIPHER_SUITES` se comparan del mismo modo: generación del
+flujo y cifrado completo de un búfer, que es el criterio para elegir
+:data:`core.DEFAULT_SUITE`.
+
+También compara los compresores de :data:`core.CODECS`: tamaño del
+archivo, latencia de guardado y de carga, y el tiempo total de una
+sincronización (guardar, transferir con el ancho de banda indicado y
+cargar en el otro extremo), que es el criterio para elegir
+:data:`core.DEFAULT_CODEC`.  Por último, compara los serializadores de
+:mod:`serializers` (tiempo de codificación y decodificación y bytes
+por entrada) y la memoria máxima reservada por Python
+(``tracemalloc``) al abrir una bóveda v1 con la lectura y el descifrado en el sitio frente a la ruta original, que
+copiaba el archivo completo en cada paso.
+
+Ejemplo de uso::
+
+    python -m password_vault.bench --size 4
+    python -m password_vault.bench --suites --size 16
+    python -m password_vault.bench --codecs --entries 5000 --bandwidth 1
+    python -m password_vault.bench --serializers --entries 100000
+    python -m password_vault.bench --memory --size 2
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from .core import (
+    CODECS,
+    DEFAULT_KDF,
+    VaultReader,
+    derive_key,
+    encrypt_data,
+    key_cache,
+    load_or_create_vault,
+    write_vault,
+)
+from .crypto import CIPHER_SUITES, SeekableCipher, keystream, xor_bytes
+from .serializers import SERIALIZERS
+
+
+def _legacy_keystream(key: bytes, nonce: bytes, length: int) -> bytes:
+    """Implementación original del flujo (coste cuadrático)."""
+    stream = b''
+    counter = 0
+    while len(stream) < length:
+        counter_bytes = counter.to_bytes(4, 'big')
+        digest = hashlib.sha256(key + nonce + counter_bytes).digest()
+        stream += digest
+        counter += 1
+    return stream[:length]
+
+
+def _legacy_xor(data: bytes, stream: bytes) -> bytes:
+    """Implementación original del XOR byte a byte."""
+    return bytes(a ^ b for a, b in zip(data, stream))
+
+
+def _throughput(func: Callable[[], object], size: int, repeat: int) -> float:
+    """Ejecuta ``func`` ``repeat`` veces y devuelve el mejor resultado en MB/s."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return size / best / 1_000_000 if best > 0 else float('inf')
+
+
+def bench_cipher(size: int = 1_000_000, repeat: int = 3) -> Dict[str, Dict[str, float]]:
+    """
+    Mide el rendimiento del flujo y del XOR antes y después de la optimización.
+
+    :param size: Tamaño en bytes del texto a cifrar.
+    :param repeat: Número de repeticiones; se toma la más rápida.
+    :return: Diccionario ``{"keystream": {...}, "xor": {...}}`` con las
+        claves ``before`` y ``after`` en MB/s.
+    """
+    key = os.urandom(32)
+    nonce = os.urandom(16)
+    data = os.urandom(size)
+    stream = bytes(keystream(key, nonce, size))
+    return {
+        "keystream": {
+            "before": _throughput(lambda: _legacy_keystream(key, nonce, size), size, repeat),
+            "after": _throughput(lambda: keystream(key, nonce, size), size, repeat),
+        },
+        "xor": {
+            "before": _throughput(lambda: _legacy_xor(data, stream), size, repeat),
+            "after": _throughput(lambda: xor_bytes(data, stream), size, repeat),
+        },
+    }
+
+
+def bench_suites(size: int = 4_000_000, repeat: int = 3) -> Dict[str, Dict[str, float]]:
+    """
+    Mide cada suite de cifrado de :data:`core.CIPHER_SUITES`.
+
+    :return: Diccionario ``{suite: {"keystream", "encrypt"}}`` en MB/s.
+    """
+    key = os.urandom(32)
+    nonce = os.urandom(16)
+    data = os.urandom(size)
+    results: Dict[str, Dict[str, float]] = {}
+    for suite in CIPHER_SUITES:
+        cipher = SeekableCipher(key, nonce, suite=suite)
+        results[suite] = {
+            "keystream": _throughput(lambda: cipher.keystream(0, size), size, repeat),
+            "encrypt": _throughput(lambda: cipher.decrypt_into(0, bytearray(data)), size, repeat),
+        }
+    return results
+
+
+def _sample_entries(count: int) -> List[Dict[str, Any]]:
+    """Genera entradas con una forma parecida a las reales."""
+    return [
+        {
+            "title": f"Servicio {i}",
+            "username": f"usuario{i}@example.com",
+            "password": os.urandom(12).hex(),
+            "url": f"https://servicio{i}.example.com/login",
+            "notes": "Cuenta de prueba generada para el benchmark." if i % 3 == 0 else "",
+        }
+        for i in range(count)
+    ]
+
+
+def bench_codecs(entries: int = 2000, bandwidth: float = 1.0, repeat: int = 3) -> Dict[str, Dict[str, float]]:
+    """
+    Compara los compresores disponibles sobre una bóveda sintética.
+
+    :param entries: Número de entradas de la bóveda de prueba.
+    :param bandwidth: Ancho de banda de la sincronización en MB/s.
+    :param repeat: Número de repeticiones; se toma la más rápida.
+    :return: Diccionario ``{codec: {"size", "save", "load", "sync"}}`` con
+        el tamaño en bytes y los tiempos en segundos.
+    """
+    data = _sample_entries(entries)
+    key = os.urandom(32)
+    salt = os.urandom(16)
+    results: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for codec in CODECS:
+            path = os.path.join(directory, f"{codec}.vault")
+            save = load = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                write_vault(path, data, key, salt, codec=codec)
+                save = min(save, time.perf_counter() - start)
+                start = time.perf_counter()
+                with open(path, 'rb') as f:
+                    for _entry in VaultReader(f, key=key):
+                        pass
+                load = min(load, time.perf_counter() - start)
+            size = os.path.getsize(path)
+            results[codec] = {
+                "size": size,
+                "save": save,
+                "load": load,
+                "sync": save + size / (bandwidth * 1_000_000) + load,
+            }
+    return results
+
+
+def bench_serializers(entries: int = 10000, repeat: int = 3) -> Dict[str, Dict[str, float]]:
+    """
+    Compara los serializadores de entradas.
+
+    :param entries: Número de entradas a codificar.
+    :param repeat: Número de repeticiones; se toma la más rápida.
+    :return: Diccionario ``{serializador: {"encode", "decode", "bytes"}}``
+        con los tiempos en segundos y los bytes por entrada.
+    """
+    data = _sample_entries(entries)
+    results: Dict[str, Dict[str, float]] = {}
+    for name, serializer in SERIALIZERS.items():
+        encode = decode = float('inf')
+        chunk = b""
+        for _ in range(repeat):
+            start = time.perf_counter()
+            chunk = serializer.pack([serializer.dumps(entry) for entry in data])
+            encode = min(encode, time.perf_counter() - start)
+            start = time.perf_counter()
+            for item in serializer.unpack(chunk):
+                serializer.loads(item)
+            decode = min(decode, time.perf_counter() - start)
+        results[name] = {"encode": encode, "decode": decode, "bytes": len(chunk) / max(entries, 1)}
+    return results
+
+
+def _copying_decrypt(path: str, key: bytes) -> Dict[str, Any]:
+    """Ruta de descifrado v1 original: flujo y XOR originales, y cada paso crea una copia completa."""
+    with open(path, 'rb') as f:
+        encrypted = f.read()
+    nonce = encrypted[16:32]
+    ciphertext = encrypted[32:]
+    stream = _legacy_keystream(key, nonce, len(ciphertext))
+    return json.loads(_legacy_xor(ciphertext, stream).decode('utf-8'))
+
+
+def _peak_memory(func: Callable[[], object]) -> Dict[str, float]:
+    """Pico de memoria reservada por Python durante ``func`` (``tracemalloc``) y su tiempo."""
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"peak": peak, "seconds": seconds}
+
+
+def bench_decrypt_memory(size: int = 1_000_000) -> Dict[str, Dict[str, float]]:
+    """
+    Compara la memoria máxima al abrir una bóveda v1 de ``size`` bytes.
+
+    La memoria se mide con :mod:`tracemalloc` y no como pico de RSS:
+    ``ru_maxrss`` no puede reiniciarse entre una ruta y otra y, en un
+    proceso nuevo, Linux conserva el del proceso que lo lanzó.
+    ``tracemalloc`` cuenta los búferes, copias y objetos de Python, que
+    son lo que cambia entre las dos rutas, pero no la memoria del
+    intérprete ni la de bibliotecas nativas.
+
+    La clave se guarda antes en :data:`core.key_cache`, así que ninguna
+    ruta ejecuta el KDF y los tiempos son comparables.  La ruta original
+    usa el flujo y el XOR originales (:func:`_legacy_keystream` y
+    :func:`_legacy_xor`), cuyo tiempo crece de forma cuadrática con el
+    tamaño.
+
+    :return: Diccionario ``{"before": {...}, "after": {...}}`` con el pico
+        de memoria reservada por Python en bytes y el tiempo en segundos.
+    """
+    password = "medicion"
+    salt = os.urandom(16)
+    key = derive_key(password, salt)
+    key_cache.put(password, salt, key, **DEFAULT_KDF)
+    data = {"entries": [{"title": "Adjunto", "notes": "x" * size}]}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "v1.vault")
+        with open(path, 'wb') as f:
+            f.write(encrypt_data(data, key, salt))
+        del data
+        return {
+            "before": _peak_memory(lambda: _copying_decrypt(path, key)),
+            "after": _peak_memory(lambda: load_or_create_vault(path, password)),
+        }
+
+
+def main(argv: List[str] | None = None) -> None:
+    """Punto de entrada: imprime una tabla con los resultados."""
+    parser = argparse.ArgumentParser(description="Benchmarks del cifrado de la bóveda")
+    parser.add_argument("--size", type=float, default=1.0, help="Tamaño en MB (por defecto 1)")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones por medición")
+    parser.add_argument("--codecs", action="store_true", help="Comparar los compresores")
+    parser.add_argument("--serializers", action="store_true", help="Comparar los serializadores")
+    parser.add_argument("--entries", type=int, default=2000, help="Entradas de la bóveda de prueba")
+    parser.add_argument("--bandwidth", type=float, default=1.0, help="Ancho de banda en MB/s")
+    parser.add_argument("--memory", action="store_true", help="Comparar la memoria al abrir una bóveda v1")
+    parser.add_argument("--suites", action="store_true", help="Comparar las suites de cifrado")
+    args = parser.parse_args(argv)
+
+    if args.suites:
+        size = int(args.size * 1_000_000)
+        results = bench_suites(size, args.repeat)
+        print(f"Suites de cifrado ({size / 1_000_000:.1f} MB)")
+        print(f"{'suite':<12}{'flujo MB/s':>14}{'cifrado MB/s':>16}")
+        for suite, values in results.items():
+            print(f"{suite:<12}{values['keystream']:>14.2f}{values['encrypt']:>16.2f}")
+        return
+
+    if args.memory:
+        size = int(args.size * 1_000_000)
+        results = bench_decrypt_memory(size)
+        print(f"Apertura de bóveda v1 ({size / 1_000_000:.1f} MB)")
+        print(f"{'ruta':<8}{'pico MB':>12}{'x tamaño':>10}{'segundos':>10}")
+        for name, values in results.items():
+            print(f"{name:<8}{values['peak'] / 1_000_000:>12.1f}{values['peak'] / size:>10.2f}{values['seconds']:>10.2f}")
+        return
+
+    if args.serializers:
+        results = bench_serializers(args.entries, args.repeat)
+        print(f"Serializadores ({args.entries} entradas)")
+        print(f"{'formato':<10}{'codificar ms':>14}{'decodificar ms':>16}{'bytes/entrada':>15}")
+        for name, values in results.items():
+            print(f"{name:<10}{values['encode'] * 1000:>14.1f}{values['decode'] * 1000:>16.1f}{values['bytes']:>15.1f}")
+        return
+    if args.codecs:
+        results = bench_codecs(args.entries, args.bandwidth, args.repeat)
+        print(f"Compresores ({args.entries} entradas, {args.bandwidth:g} MB/s)")
+        print(f"{'codec':<8}{'tamaño KB':>12}{'guardar ms':>12}{'cargar ms':>12}{'sync ms':>12}")
+        for codec, values in sorted(results.items(), key=lambda item: item[1]["sync"]):
+            print(
+                f"{codec:<8}{values['size'] / 1000:>12.1f}{values['save'] * 1000:>12.1f}"
+                f"{values['load'] * 1000:>12.1f}{values['sync'] * 1000:>12.1f}"
+            )
+        return
+
+    size = int(args.size * 1_000_000)
+    results = bench_cipher(size, args.repeat)
+    print(f"Cifrado ({size / 1_000_000:.1f} MB)")
+    print(f"{'etapa':<12}{'antes MB/s':>14}{'después MB/s':>16}")
+    for stage, values in results.items():
+        print(f"{stage:<12}{values['before']:>14.2f}{values['after']:>16.2f}")
+
+
+if __name__ == "__main__":  # pragma: no cover - ejecución directa
+    main()
@@ -13,15 +13,60 @@ El flujo básico es el siguiente:
 2. Se presenta un menú con opciones para listar, agregar, eliminar,
    auditar o salir.
 3. Cada acción invoca funciones del módulo :mod:`core` y :mod:`audit`.
+
+Además, para tareas de administración la CLI acepta subcomandos no
+interactivos::
+
+    python -m password_vault.cli unlock-many vaults.tsv --workers 8
+
+donde ``vaults.tsv`` contiene una ruta por línea seguida, opcionalmente,
+de un tabulador y la contraseña maestra de esa bóveda, o::
+
+    python -m password_vault.cli bench-kdf --target-ms 250 --apply usuario_vault.json
+
+que mide PBKDF2 en esta máquina, propone el número de iteraciones para
+la latencia indicada y, con ``--apply``, lo aplica a la bóveda.  Tanto
+esto como ``passwd`` (cambiar la contraseña maestra) solo reescriben la
+cabecera de la bóveda (ver :func:`core.change_password`).
+
+Para uso desde scripts, ``agent`` arranca un agente de desbloqueo (ver
+:mod:`agent`) y ``list``, ``get`` y ``add`` lo usan automáticamente si
+está en marcha: la contraseña maestra solo se pide la primera vez que
+se accede a cada bóveda, y las siguientes llamadas no repiten el KDF::
+
+    python -m password_vault.cli agent &
+    python -m password_vault.cli get usuario_vault.json github
+
+Sin agente, estos subcomandos piden la contraseña y abren la bóveda en
+el propio proceso.  En ese caso ``get`` busca palabras completas con
+:func:`core.search_vault`, que en bóvedas con índice ciego solo
+descifra las entradas que coinciden.
 """
 
 from __future__ import annotations
 
+import argparse
 import getpass
 import os
-from typing import Dict, Any
+import sys
+import time
+from typing import Dict, Any, List, Optional, Tuple
 
-from .core import load_or_create_vault, save_vault
+from .core import (
+    VaultConflictError,
+    VaultSession,
+    calibrate,
+    change_password,
+    derive_key,
+    entry_summaries,
+    load_or_create_vault,
+    load_vaults_parallel,
+    save_vault,
+    search_vault,
+    vault_lock,
+    vault_version,
+)
+from .agent import DEFAULT_IDLE_TIMEOUT, AgentClient, AgentError, connect, serve
 from .audit import SecurityAudit
 from .auth import authenticate, create_user, load_user_db
 
@@ -34,7 +79,235 @@ def prompt_entry() -> Dict[str, str]:
     return {"title": title, "username": username, "password": password}
 
 
-def main() -> None:
+def _read_vault_list(list_file: str) -> List[Tuple[str, Optional[str]]]:
+    """Lee pares ``ruta<TAB>contraseña`` (la contraseña es opcional); ``-`` lee de stdin."""
+    handle = sys.stdin if list_file == "-" else open(list_file, 'r', encoding='utf-8')
+    try:
+        pairs: List[Tuple[str, Optional[str]]] = []
+        for line in handle:
+            line = line.rstrip("\r\n")
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            path, sep, password = line.partition("\t")
+            pairs.append((path.strip(), password if sep else None))
+        return pairs
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+
+def unlock_many(list_file: str, workers: Optional[int] = None) -> int:
+    """
+    Abre en paralelo las bóvedas listadas en ``list_file`` e informa de los tiempos.
+
+    Las líneas sin contraseña usan una contraseña común que se solicita
+    una sola vez.
+
+    :return: Número de bóvedas que no se pudieron abrir.
+    """
+    pairs = _read_vault_list(list_file)
+    shared: Optional[str] = None
+    if any(password is None for _, password in pairs):
+        shared = getpass.getpass("Contraseña maestra común: ")
+    jobs = [(path, shared if password is None else password) for path, password in pairs]
+
+    failures = 0
+    start = time.perf_counter()
+    for result in load_vaults_parallel(jobs, workers=workers):
+        if result.ok:
+            print(f"OK     {result.seconds:8.3f}s  {result.path} ({len(result.data['entries'])} entradas)")
+        else:
+            failures += 1
+            print(f"ERROR  {result.seconds:8.3f}s  {result.path}: {result.error}")
+    elapsed = time.perf_counter() - start
+    rate = len(jobs) / elapsed if elapsed > 0 else 0.0
+    print(f"{len(jobs) - failures}/{len(jobs)} bóvedas abiertas en {elapsed:.2f}s ({rate:.1f} bóvedas/s)")
+    return failures
+
+
+def bench_kdf(target_ms: float, algorithm: str = "sha256", apply_to: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Calibra PBKDF2 para ``target_ms`` y, opcionalmente, migra una bóveda.
+
+    :param apply_to: Ruta de una bóveda a la que aplicar los parámetros.
+    :return: Parámetros elegidos.
+    """
+    kdf = calibrate(target_ms, algorithm=algorithm)
+    start = time.perf_counter()
+    derive_key("medicion", os.urandom(16), **kdf)
+    measured = (time.perf_counter() - start) * 1000
+    print(f"Algoritmo: {kdf['algorithm']}  longitud: {kdf['key_length']} bytes")
+    print(f"Iteraciones: {kdf['iterations']}  (objetivo {target_ms:.0f} ms, medido {measured:.0f} ms)")
+    if apply_to:
+        password = getpass.getpass("Contraseña maestra de la bóveda: ")
+        with VaultSession.open(apply_to, password, kdf=kdf) as session:
+            changed = session.is_dirty
+        print("Bóveda actualizada." if changed else "La bóveda ya usaba estos parámetros.")
+    return kdf
+
+
+def _agent_client(vault_file: str, socket_path: Optional[str]) -> Optional[AgentClient]:
+    """
+    Conecta con el agente y se asegura de que ``vault_file`` está desbloqueada en él.
+
+    :return: El cliente, o ``None`` si no hay ningún agente en marcha.
+    """
+    client = connect(socket_path)
+    if client is None:
+        return None
+    try:
+        if os.path.realpath(vault_file) not in client.request("ping")["vaults"]:
+            client.unlock(vault_file, getpass.getpass("Contraseña maestra de la bóveda: "))
+    except BaseException:
+        client.close()
+        raise
+    return client
+
+
+def _open_locally(vault_file: str) -> VaultSession:
+    if not os.path.exists(vault_file):
+        raise ValueError(f"La bóveda no existe: {vault_file}")
+    return VaultSession.open(vault_file, getpass.getpass("Contraseña maestra de la bóveda: "))
+
+
+def list_entries(vault_file: str, socket_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Imprime título y usuario de cada entrada, usando el agente si está en marcha."""
+    client = _agent_client(vault_file, socket_path)
+    if client is not None:
+        with client:
+            summaries = client.list(vault_file)
+    else:
+        with _open_locally(vault_file) as session:
+            summaries = entry_summaries(session.entries)
+    for summary in summaries:
+        print(f"{summary['title']}\t{summary['username']}")
+    return summaries
+
+
+def get_entries(vault_file: str, query: str, socket_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Imprime ``título<TAB>usuario<TAB>contraseña`` de las entradas que coinciden con ``query``."""
+    client = _agent_client(vault_file, socket_path)
+    if client is not None:
+        with client:
+            entries = client.get(vault_file, query)
+    else:
+        if not os.path.exists(vault_file):
+            raise ValueError(f"La bóveda no existe: {vault_file}")
+        entries = search_vault(vault_file, getpass.getpass("Contraseña maestra de la bóveda: "), query)
+    for entry in entries:
+        print(f"{entry.get('title', '')}\t{entry.get('username', '')}\t{entry.get('password', '')}")
+    return entries
+
+
+def add_entry(vault_file: str, title: str, username: str = "", socket_path: Optional[str] = None) -> None:
+    """Añade una entrada (la contraseña se pide por teclado), usando el agente si está en marcha."""
+    client = _agent_client(vault_file, socket_path)
+    entry = {"title": title, "username": username, "password": getpass.getpass("Contraseña de la entrada: ")}
+    if client is not None:
+        with client:
+            client.add(vault_file, entry)
+    else:
+        with _open_locally(vault_file) as session:
+            session.add_entry(entry)
+    print("Entrada agregada.")
+
+
+def change_master_password(vault_file: str) -> None:
+    """Pide la contraseña actual y la nueva y reescribe solo la cabecera de la bóveda."""
+    password = getpass.getpass("Contraseña maestra actual: ")
+    new_password = getpass.getpass("Nueva contraseña maestra: ")
+    if getpass.getpass("Repita la nueva contraseña: ") != new_password:
+        raise ValueError("Las contraseñas no coinciden")
+    change_password(vault_file, password, new_password)
+    print("Contraseña cambiada.")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Punto de entrada: ejecuta un subcomando o, sin argumentos, el modo interactivo."""
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        interactive()
+        return
+    parser = argparse.ArgumentParser(prog="python -m password_vault.cli", description="Gestor de Contraseñas CLI")
+    commands = parser.add_subparsers(dest="command", required=True)
+    unlock = commands.add_parser("unlock-many", help="Abrir muchas bóvedas en paralelo")
+    unlock.add_argument("list_file", help="Archivo con 'ruta<TAB>contraseña' por línea ('-' para stdin)")
+    unlock.add_argument("--workers", type=int, default=None, help="Hilos a utilizar (por defecto, núcleos)")
+    kdf = commands.add_parser("bench-kdf", help="Calibrar las iteraciones de PBKDF2 para esta máquina")
+    kdf.add_argument("--target-ms", type=float, default=250.0, help="Latencia de desbloqueo deseada (ms)")
+    kdf.add_argument("--algorithm", default="sha256", help="Algoritmo hash de PBKDF2")
+    kdf.add_argument("--apply", metavar="VAULT", help="Aplicar los nuevos parámetros a esta bóveda")
+    passwd = commands.add_parser("passwd", help="Cambiar la contraseña maestra de una bóveda")
+    passwd.add_argument("vault", help="Archivo de la bóveda")
+    agent = commands.add_parser("agent", help="Ejecutar el agente de desbloqueo en primer plano")
+    agent.add_argument("--idle-timeout", type=float, default=DEFAULT_IDLE_TIMEOUT,
+                       help="Segundos sin uso tras los que se bloquea cada bóveda")
+    for name, help_text in (
+        ("unlock", "Desbloquear una bóveda en el agente"),
+        ("lock", "Bloquear una bóveda en el agente (todas si se omite)"),
+        ("list", "Listar las entradas de una bóveda"),
+        ("get", "Mostrar las entradas que contienen todas las palabras del texto"),
+        ("add", "Agregar una entrada a una bóveda"),
+    ):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("vault", nargs="?" if name == "lock" else None, help="Archivo de la bóveda")
+        if name == "get":
+            command.add_argument("query", help="Texto a buscar")
+        if name == "add":
+            command.add_argument("--title", required=True, help="Título de la entrada")
+            command.add_argument("--username", default="", help="Nombre de usuario")
+    for name in ("agent", "unlock", "lock", "list", "get", "add"):
+        commands.choices[name].add_argument("--socket", default=None, help="Socket del agente (por defecto $VAULTKEY_AGENT_SOCK)")
+    args = parser.parse_args(argv)
+    if args.command == "unlock-many":
+        sys.exit(1 if unlock_many(args.list_file, args.workers) else 0)
+    elif args.command == "bench-kdf":
+        try:
+            bench_kdf(args.target_ms, args.algorithm, args.apply)
+        except ValueError as exc:
+            print(f"Error: {exc}")
+            sys.exit(1)
+    elif args.command == "passwd":
+        try:
+            change_master_password(args.vault)
+        except ValueError as exc:
+            print(f"Error: {exc}")
+            sys.exit(1)
+    elif args.command == "agent":
+        try:
+            serve(args.socket, args.idle_timeout)
+        except AgentError as exc:
+            print(f"Error: {exc}")
+            sys.exit(1)
+    else:
+        try:
+            _run_vault_command(args)
+        except ValueError as exc:
+            print(f"Error: {exc}")
+            sys.exit(1)
+
+
+def _run_vault_command(args: argparse.Namespace) -> None:
+    if args.command in ("unlock", "lock"):
+        client = connect(args.socket)
+        if client is None:
+            raise ValueError("No hay ningún agente en marcha")
+        with client:
+            if args.command == "lock":
+                client.lock(args.vault)
+            else:
+                count = client.unlock(args.vault, getpass.getpass("Contraseña maestra de la bóveda: "))
+                print(f"Bóveda desbloqueada ({count} entradas).")
+    elif args.command == "list":
+        list_entries(args.vault, args.socket)
+    elif args.command == "get":
+        if not get_entries(args.vault, args.query, args.socket):
+            sys.exit(1)
+    elif args.command == "add":
+        add_entry(args.vault, args.title, args.username, args.socket)
+
+
+def interactive() -> None:
     """Función principal de la CLI con inicio de sesión de usuarios.
 
     Este flujo solicita primero las credenciales del usuario y almacena
@@ -88,8 +361,13 @@ def main() -> None:
     vault_file = vault_file_input or default_vault
 
     # Cargar o crear la bóveda usando la contraseña maestra
+    # y anotar su versión para no sobrescribir cambios de otros procesos
     try:
-        vault_data, key = load_or_create_vault(vault_file, master_password)
+        if not os.path.exists(vault_file):
+            load_or_create_vault(vault_file, master_password)
+        with vault_lock(vault_file):
+            vault_data, key = load_or_create_vault(vault_file, master_password)
+            version = vault_version(vault_file)
     except ValueError as exc:
         print(f"Error al abrir la bóveda: {exc}")
         return
@@ -107,8 +385,9 @@ def main() -> None:
             if not vault_data["entries"]:
                 print("No hay entradas guardadas.")
             else:
-                for idx, entry in enumerate(vault_data["entries"], start=1):
-                    print(f"{idx}. {entry.get('title', 'Sin título')} (usuario: {entry.get('username', '')})")
+                # Los resúmenes no descifran las entradas de bóvedas 'records'
+                for idx, summary in enumerate(entry_summaries(vault_data["entries"]), start=1):
+                    print(f"{idx}. {summary['title'] or 'Sin título'} (usuario: {summary['username']})")
         elif choice == "2":
             entry = prompt_entry()
             vault_data["entries"].append(entry)
@@ -135,7 +414,11 @@ def main() -> None:
                 for rec in report['recommendations']:
                     print(f" • {rec}")
         elif choice == "5":
-            save_vault(vault_file, vault_data, key)
+            try:
+                save_vault(vault_file, vault_data, key, expected_version=version)
+            except VaultConflictError as exc:
+                print(f"No se guardaron los cambios: {exc}")
+                continue
             print("Cambios guardados. Saliendo...")
             break
         else:
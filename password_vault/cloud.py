@@ -16,13 +16,115 @@ Las operaciones incluidas son:
 
 Todas las operaciones retornan un booleano indicando el éxito y
 lanzan excepciones cuando ocurre un error inesperado.
+
+Si la bóveda tiene un diario de cambios (ver
+:func:`password_vault.core.journal_path`), este se copia junto con el
+archivo principal y su fecha de modificación cuenta como la de la
+bóveda.  Las copias leen el origen bajo un bloqueo compartido y
+sustituyen el destino de forma atómica bajo un bloqueo exclusivo (ver
+:func:`password_vault.core.vault_lock`), de modo que nunca se copia ni
+se deja a la vista una bóveda a medio escribir.
+
+Los fragmentos de los adjuntos (ver :mod:`password_vault.attachments`)
+viajan también con la bóveda, antes que ella para que nunca referencie
+fragmentos ausentes.  Como son inmutables y su nombre depende de su
+contenido, solo se copian los que faltan en el destino.  Lo mismo
+ocurre con los fragmentos de una bóveda ``sharded`` (ver
+:func:`password_vault.core.shards_path`): cada guardado escribe con un
+nombre nuevo solo los que cambiaron, así que únicamente esos viajan, y
+los que el destino deja de usar se eliminan tras sustituir la bóveda.
+
+Las bóvedas del backend ``sqlite`` (ver :mod:`password_vault.storage`)
+se copian con la API de copia de seguridad de SQLite, que incluye lo
+pendiente en su WAL, y su fecha de modificación tiene en cuenta la de
+ese WAL.
 """
 
 from __future__ import annotations
 
 import os
 import shutil
-from typing import Optional
+import tempfile
+from contextlib import ExitStack
+from typing import Optional, Set
+
+from .attachments import chunk_dir, chunk_path, list_chunks
+from .core import journal_path, shards_path, vault_lock
+from .storage import WAL_SUFFIXES, SQLiteBackend, detect_backend
+
+
+def _replace_with_copy(source: str, destination: str) -> None:
+    """Copia ``source`` a un temporal junto a ``destination`` y lo sustituye atómicamente."""
+    directory, name = os.path.split(os.path.abspath(destination))
+    fd, tmp_file = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+    os.close(fd)
+    try:
+        shutil.copy2(source, tmp_file)
+        os.replace(tmp_file, destination)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
+def _copy_chunks(source: str, destination: str) -> int:
+    """Copia los fragmentos de adjuntos de ``source`` que faltan en ``destination``."""
+    missing = list_chunks(chunk_dir(source)) - list_chunks(chunk_dir(destination))
+    for chunk_id in sorted(missing):
+        target = chunk_path(destination, chunk_id)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        _replace_with_copy(chunk_path(source, chunk_id), target)
+    return len(missing)
+
+
+def _list_shards(vault_file: str) -> Set[str]:
+    """Nombres de los fragmentos de una bóveda ``sharded`` (vacío si no lo es)."""
+    directory = shards_path(vault_file)
+    if not os.path.isdir(directory):
+        return set()
+    return {name for name in os.listdir(directory) if not name.startswith(".")}
+
+
+def _copy_vault(source: str, destination: str) -> None:
+    """Copia la bóveda, sus fragmentos y su diario; elimina los fragmentos, el diario y el WAL obsoletos del destino."""
+    with ExitStack() as stack:
+        # Siempre en el mismo orden: una subida y una bajada simultáneas
+        # entre los mismos archivos no pueden esperarse mutuamente
+        locks = sorted([(source, False), (destination, True)], key=lambda item: os.path.realpath(item[0]))
+        for path, exclusive in locks:
+            stack.enter_context(vault_lock(path, exclusive=exclusive))
+        _copy_chunks(source, destination)
+        shards = _list_shards(source)
+        stale = _list_shards(destination) - shards
+        storage = detect_backend(source)
+        if isinstance(storage, SQLiteBackend):
+            storage.copy(source, destination)
+        else:
+            for name in sorted(shards - _list_shards(destination)):
+                os.makedirs(shards_path(destination), exist_ok=True)
+                _replace_with_copy(os.path.join(shards_path(source), name), os.path.join(shards_path(destination), name))
+            _replace_with_copy(source, destination)
+            # El WAL de un destino que era SQLite ya no corresponde al archivo
+            for suffix in WAL_SUFFIXES:
+                if os.path.exists(destination + suffix):
+                    os.remove(destination + suffix)
+        # Los fragmentos y el diario de un destino que era un archivo v2
+        # también se eliminan si el origen es SQLite
+        for name in stale:
+            os.remove(os.path.join(shards_path(destination), name))
+        if os.path.exists(journal_path(source)):
+            _replace_with_copy(journal_path(source), journal_path(destination))
+        elif os.path.exists(journal_path(destination)):
+            os.remove(journal_path(destination))
+
+
+def _vault_mtime(vault_file: str) -> float:
+    """Fecha de modificación de la bóveda teniendo en cuenta su diario o su WAL."""
+    mtime = os.path.getmtime(vault_file)
+    for path in (journal_path(vault_file), vault_file + WAL_SUFFIXES[0]):
+        if os.path.exists(path):
+            mtime = max(mtime, os.path.getmtime(path))
+    return mtime
 
 
 class LocalCloudSync:
@@ -49,7 +151,7 @@ class LocalCloudSync:
         if not os.path.isfile(vault_file):
             raise FileNotFoundError(f"Archivo de bóveda no encontrado: {vault_file}")
         destination = os.path.join(self.sync_folder, os.path.basename(vault_file))
-        shutil.copy2(vault_file, destination)
+        _copy_vault(vault_file, destination)
         return True
 
     def download_vault(self, destination: str, vault_name: Optional[str] = None) -> bool:
@@ -73,7 +175,7 @@ class LocalCloudSync:
         source = os.path.join(self.sync_folder, vault_name)
         if not os.path.exists(source):
             return False
-        shutil.copy2(source, destination)
+        _copy_vault(source, destination)
         return True
 
     def sync_vault(self, vault_file: str) -> bool:
@@ -100,18 +202,18 @@ class LocalCloudSync:
             return True
         if not local_exists and remote_exists:
             # Descargar si no existe localmente
-            shutil.copy2(remote_path, vault_file)
+            _copy_vault(remote_path, vault_file)
             return True
 
         # Ambos existen, comparar fechas de modificación
-        local_mtime = os.path.getmtime(vault_file)
-        remote_mtime = os.path.getmtime(remote_path)
+        local_mtime = _vault_mtime(vault_file)
+        remote_mtime = _vault_mtime(remote_path)
         if local_mtime > remote_mtime:
             # Local más reciente, subir
             self.upload_vault(vault_file)
             return True
         elif remote_mtime > local_mtime:
             # Remoto más reciente, descargar
-            shutil.copy2(remote_path, vault_file)
+            _copy_vault(remote_path, vault_file)
             return True
         return False
@@ -16,12 +16,109 @@ capturado y manejado por capas superiores (por ejemplo, la UI).
 
 from __future__ import annotations
 
+import atexit
+import bz2
+import hmac
+import io
+import itertools
 import json
+import lzma
 import os
-from typing import Dict, Tuple
+import re
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import unicodedata
+import uuid
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from collections.abc import Mapping, MutableSequence, Sequence
+from types import MappingProxyType
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
 
 import hashlib
 
+try:  # pragma: no cover - depende de la plataforma
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore[assignment]
+
+from .crypto import (
+    BLOCK_SIZE as _BLOCK_SIZE,
+    CIPHER_SUITES,
+    DATA_KEY_SIZE,
+    DEFAULT_SUITE,
+    LEGACY_SUITE,
+    MAC_ALGORITHM,
+    MAC_EXCLUDED as _MAC_EXCLUDED,
+    PASSWORD_SLOT as _PASSWORD_SLOT,
+    TAG_SIZE as _TAG_SIZE,
+    SeekableCipher,
+    VaultIntegrityError,
+    cipher_suite as _cipher_suite,
+    header_digest as _header_digest,
+    key_check as _key_check,
+    keystream as _keystream,
+    mac_key as _mac_key,
+    open_data_key,
+    requires_mac as _requires_mac,
+    subkey as _subkey,
+    tag as _tag,
+    verify_tag as _verify_tag,
+    wipe as _wipe,
+    wrap_key as _wrap_key,
+    xor_bytes as _xor_bytes,
+)
+from .password_utils import check_password_strength
+from .serializers import DEFAULT_SERIALIZER, get_serializer
+
+# Cabecera del formato v2: firma, versión y longitud de la cabecera JSON
+VAULT_MAGIC = b"VKEY"
+FORMAT_VERSION = 2
+_PREAMBLE = struct.Struct(">4sBI")
+_FRAME = struct.Struct(">I")
+
+# Tamaño objetivo del texto plano de cada fragmento del formato v2
+CHUNK_SIZE = 64 * 1024
+
+# Disposiciones del cuerpo v2 (ver :class:`VaultWriter`)
+LAYOUTS = ("stream", "records", "sharded")
+DEFAULT_LAYOUT = "stream"
+_FOOTER = struct.Struct(">Q")
+
+# Fragmentos de las bóvedas ``sharded``: ``<bóveda>.shards/<n>-<instantánea>``
+SHARDS_SUFFIX = ".shards"
+DEFAULT_SHARDS = 16
+# Por debajo de este tamaño total los fragmentos se leen en el propio
+# proceso: arrancar un conjunto de procesos costaría más que descifrarlos.
+_PARALLEL_SHARD_BYTES = 4 * 1024 * 1024
+
+# Compresores disponibles antes del cifrado: (comprimir, descomprimir, nivel por defecto)
+CODECS: Dict[str, Tuple[Callable[[bytes, int], bytes], Callable[[bytes], bytes], int]] = {
+    "none": (lambda data, level: data, lambda data: data, 0),
+    "zlib": (lambda data, level: zlib.compress(data, level), zlib.decompress, 6),
+    "bz2": (lambda data, level: bz2.compress(data, level), bz2.decompress, 9),
+    "lzma": (lambda data, level: lzma.compress(data, preset=level), lzma.decompress, 6),
+}
+DEFAULT_CODEC = "zlib"
+
+# Índice ciego de búsqueda de las bóvedas ``records`` (ver :func:`search_vault`)
+INDEX_ALGORITHM = "hmac-sha256"
+_INDEX_TOKEN_SIZE = 16
+
+# La cabecera JSON se rellena con espacios hasta un múltiplo de
+# ``_HEADER_ALIGN`` bytes dejando libres al menos ``_HEADER_SLACK`` bytes
+# (o la mitad de su tamaño, si es mayor), para poder reescribirla sin
+# desplazar el cuerpo cifrado.
+_HEADER_ALIGN = 512
+_HEADER_SLACK = 256
+
+
 def derive_key(
     password: str,
     salt: bytes,
@@ -51,16 +148,163 @@ def derive_key(
     )
 
 
-def _keystream(key: bytes, nonce: bytes, length: int) -> bytes:
-    """Genera un flujo de bytes pseudoaleatorio para cifrado XOR."""
-    stream = b''
-    counter = 0
-    while len(stream) < length:
-        counter_bytes = counter.to_bytes(4, 'big')
-        digest = hashlib.sha256(key + nonce + counter_bytes).digest()
-        stream += digest
-        counter += 1
-    return stream[:length]
+class KeyCache:
+    """
+    Caché en proceso de claves derivadas con PBKDF2.
+
+    Cada clave se indexa por la sal, un resumen HMAC de la contraseña
+    (calculado con un secreto aleatorio del proceso, de modo que la
+    caché nunca guarda la contraseña ni un hash reutilizable fuera de
+    él) y los parámetros del KDF.  Las claves caducan tras ``ttl``
+    segundos, se expulsan por orden de uso cuando se supera
+    ``max_size`` y sus búferes se sobrescriben con ceros al salir de la
+    caché.  Es seguro usarla desde varios hilos.
+
+    :param max_size: Número máximo de claves almacenadas.
+    :param ttl: Tiempo de vida de cada clave en segundos.
+    """
+
+    def __init__(self, max_size: int = 16, ttl: float = 300.0) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._secret = os.urandom(32)
+        self._entries: "OrderedDict[Tuple, Tuple[float, bytes, bytearray]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cache_key(self, password: str, salt: bytes, params: Dict[str, Any]) -> Tuple:
+        digest = hmac.new(self._secret, password.encode('utf-8'), hashlib.sha256).digest()
+        return (bytes(salt), digest, tuple(sorted(params.items())))
+
+    def _discard(self, cache_key: Tuple) -> None:
+        _, _, buffer = self._entries.pop(cache_key)
+        _wipe(buffer)
+
+    def get(self, password: str, salt: bytes, **params: Any) -> Optional[bytes]:
+        """Devuelve la clave almacenada o ``None`` si no existe o ha caducado."""
+        cache_key = self._cache_key(password, salt, params)
+        with self._lock:
+            item = self._entries.get(cache_key)
+            if item is None:
+                return None
+            if time.monotonic() >= item[0]:
+                self._discard(cache_key)
+                return None
+            self._entries.move_to_end(cache_key)
+            return bytes(item[2])
+
+    def put(self, password: str, salt: bytes, key: bytes, **params: Any) -> None:
+        """Almacena una clave derivada, expulsando la menos usada si es necesario."""
+        if self.max_size <= 0:
+            return
+        cache_key = self._cache_key(password, salt, params)
+        with self._lock:
+            if cache_key in self._entries:
+                self._discard(cache_key)
+            self._entries[cache_key] = (time.monotonic() + self.ttl, bytes(salt), bytearray(key))
+            while len(self._entries) > self.max_size:
+                self._discard(next(iter(self._entries)))
+
+    def forget(self, salt: Optional[bytes] = None) -> None:
+        """
+        Elimina y sobrescribe claves de la caché.
+
+        :param salt: Si se indica, solo se olvidan las claves derivadas
+            con esa sal; en caso contrario se vacía la caché completa.
+        """
+        with self._lock:
+            for cache_key in list(self._entries):
+                if salt is None or self._entries[cache_key][1] == salt:
+                    self._discard(cache_key)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+# Caché compartida por las funciones de este módulo
+key_cache = KeyCache()
+
+# Parámetros del KDF usados por defecto (los mismos que :func:`derive_key`)
+DEFAULT_KDF: Dict[str, Any] = {"algorithm": "sha256", "iterations": 200_000, "key_length": 32}
+
+# Límites aceptados para los parámetros del KDF anotados en una cabecera
+MIN_KDF_ITERATIONS = 100_000
+MIN_KEY_LENGTH = 16
+
+
+def normalize_kdf(params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Completa ``params`` con :data:`DEFAULT_KDF` y valida el resultado.
+
+    :raises ValueError: Si el algoritmo no existe o los valores son
+        demasiado débiles (también protege frente a cabeceras manipuladas).
+    """
+    if params is not None and not isinstance(params, dict):
+        raise ValueError("Parámetros del KDF no válidos")
+    kdf = {**DEFAULT_KDF, **(params or {})}
+    if set(kdf) != set(DEFAULT_KDF):
+        raise ValueError("Parámetros del KDF no válidos")
+    if kdf["algorithm"] not in hashlib.algorithms_available:
+        raise ValueError(f"Algoritmo de KDF no soportado: {kdf['algorithm']}")
+    for name, minimum in (("iterations", MIN_KDF_ITERATIONS), ("key_length", MIN_KEY_LENGTH)):
+        if not isinstance(kdf[name], int) or isinstance(kdf[name], bool) or kdf[name] < minimum:
+            raise ValueError(f"Parámetro del KDF '{name}' no válido: {kdf[name]!r}")
+    return kdf
+
+
+def calibrate(
+    target_ms: float = 250.0,
+    *,
+    algorithm: str = "sha256",
+    key_length: int = 32,
+    sample_iterations: int = 50_000,
+    repeat: int = 3,
+) -> Dict[str, Any]:
+    """
+    Mide PBKDF2 en esta máquina y elige las iteraciones para ``target_ms``.
+
+    Se cronometra ``sample_iterations`` iteraciones (la más rápida de
+    ``repeat`` mediciones) y se escala linealmente, redondeando a miles.
+    El resultado nunca baja de :data:`MIN_KDF_ITERATIONS`, aunque eso
+    supere el objetivo en máquinas muy lentas.
+
+    :param target_ms: Latencia de desbloqueo deseada en milisegundos.
+    :param algorithm: Algoritmo hash de PBKDF2.
+    :param key_length: Longitud de la clave en bytes.
+    :param sample_iterations: Iteraciones de la medición.
+    :param repeat: Número de mediciones.
+    :return: Parámetros listos para ``kdf=`` (mismo formato que
+        :data:`DEFAULT_KDF`).
+    """
+    salt = os.urandom(16)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        hashlib.pbkdf2_hmac(algorithm, b"calibracion", salt, sample_iterations, dklen=key_length)
+        best = min(best, time.perf_counter() - start)
+    per_iteration = best / sample_iterations
+    iterations = int(target_ms / 1000 / per_iteration) if per_iteration > 0 else MIN_KDF_ITERATIONS
+    iterations = max(MIN_KDF_ITERATIONS, round(iterations, -3))
+    return normalize_kdf({"algorithm": algorithm, "iterations": iterations, "key_length": key_length})
+
+
+def _derive_key_cached(password: str, salt: bytes, **params: Any) -> Tuple[bytes, bool]:
+    """
+    Obtiene la clave de :data:`key_cache` o la deriva con :func:`derive_key`.
+
+    La clave no se almacena aquí: el llamador debe invocar
+    ``key_cache.put`` solo después de comprobar que descifra los datos,
+    para no llenar la caché con intentos de contraseña fallidos.
+
+    :param params: Parámetros de :func:`derive_key`; por defecto
+        :data:`DEFAULT_KDF`.
+    :return: Tupla ``(clave, procedía_de_caché)``.
+    """
+    params = {**DEFAULT_KDF, **params}
+    key = key_cache.get(password, salt, **params)
+    if key is not None:
+        return key, True
+    return derive_key(password, salt, **params), False
 
 
 def encrypt_data(vault_data: Dict, key: bytes, salt: bytes | None = None) -> bytes:
@@ -85,7 +329,7 @@ def encrypt_data(vault_data: Dict, key: bytes, salt: bytes | None = None) -> byt
     plaintext = json.dumps(vault_data).encode('utf-8')
     # Generar un flujo del mismo tamaño que el plaintext
     stream = _keystream(key, nonce, len(plaintext))
-    ciphertext = bytes(a ^ b for a, b in zip(plaintext, stream))
+    ciphertext = _xor_bytes(plaintext, stream)
     return salt + nonce + ciphertext
 
 
@@ -96,7 +340,8 @@ def decrypt_data(encrypted: bytes, password: str) -> Tuple[Dict, bytes]:
     Se asume que el parámetro ``encrypted`` contiene la sal (16 bytes), un
     nonce de 16 bytes y el ciphertext. Esta función utiliza el mismo
     flujo pseudoaleatorio que :func:`encrypt_data` para recuperar el
-    texto plano.
+    texto plano.  Si los datos comienzan con :data:`VAULT_MAGIC` se
+    interpretan como un contenedor v2 (ver :class:`VaultReader`).
 
     :param encrypted: Datos cifrados concatenados (salt||nonce||ciphertext).
     :param password: Contraseña maestra original.
@@ -104,55 +349,2133 @@ def decrypt_data(encrypted: bytes, password: str) -> Tuple[Dict, bytes]:
         la clave derivada.
     :raises ValueError: Si los datos están corruptos o la contraseña no coincide.
     """
-    if len(encrypted) < 32:
-        raise ValueError("Datos cifrados demasiado cortos")
-    salt = encrypted[:16]
-    nonce = encrypted[16:32]
-    ciphertext = encrypted[32:]
-    key = derive_key(password, salt)
-    # Generar el mismo flujo para descifrar
-    stream = _keystream(key, nonce, len(ciphertext))
-    plaintext_bytes = bytes(a ^ b for a, b in zip(ciphertext, stream))
-    try:
-        vault_data = json.loads(plaintext_bytes.decode('utf-8'))
+    if encrypted[:len(VAULT_MAGIC)] == VAULT_MAGIC:
+        return read_vault(io.BytesIO(encrypted), password)
+    return _decrypt_buffer(bytearray(encrypted), password)
+
+
+def _decrypt_buffer(buffer: bytearray, password: str) -> Tuple[Dict, bytes]:
+    """
+    Descifra en el sitio una bóveda v1 contenida en ``buffer``.
+
+    A diferencia de :func:`decrypt_data`, no crea copias del archivo
+    completo: la sal y el nonce se separan del principio del búfer y el
+    ciphertext se descifra sobre sí mismo.  El búfer se sobrescribe con
+    ceros y se libera en cuanto se ha decodificado el texto, antes de
+    analizar el JSON, de modo que el búfer y las entradas analizadas
+    nunca coinciden en memoria.  El borrado ocurre también si el
+    descifrado falla.
+    """
+    try:
+        if len(buffer) < 32:
+            raise ValueError("Datos cifrados demasiado cortos")
+        salt = bytes(buffer[:16])
+        nonce = bytes(buffer[16:32])
+        # Eliminar el principio de un bytearray no copia el resto
+        del buffer[:32]
+        key, cached = _derive_key_cached(password, salt)
+        SeekableCipher(key, nonce).decrypt_into(0, buffer)
+        try:
+            text = buffer.decode('utf-8')
+        except UnicodeDecodeError as exc:
+            raise ValueError("Contraseña incorrecta o datos corruptos") from exc
+    finally:
+        _wipe(buffer)
+        buffer.clear()
+    try:
+        vault_data = json.loads(text)
     except Exception as exc:
         raise ValueError("Contraseña incorrecta o datos corruptos") from exc
+    finally:
+        del text
+    if not cached:
+        key_cache.put(password, salt, key, **DEFAULT_KDF)
     return vault_data, key
 
 
-def load_or_create_vault(vault_file: str, password: str) -> Tuple[Dict, bytes]:
+def _read_exact(f: BinaryIO, size: int) -> bytes:
+    """Lee exactamente ``size`` bytes o lanza ``ValueError`` si el archivo está truncado."""
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("Archivo de bóveda truncado o corrupto")
+    return data
+
+
+def _read_into(f: BinaryIO, size: int) -> bytearray:
+    """Como :func:`_read_exact`, pero lee directamente en un ``bytearray`` que puede borrarse."""
+    buffer = bytearray(size)
+    pos = 0
+    with memoryview(buffer) as view:
+        while pos < size:
+            with view[pos:] as rest:
+                read = f.readinto(rest)
+            if not read:
+                raise ValueError("Archivo de bóveda truncado o corrupto")
+            pos += read
+    return buffer
+
+
+def _read_remaining(f: BinaryIO) -> bytearray:
+    """Lee el resto del archivo en un único ``bytearray``."""
+    return _read_into(f, os.fstat(f.fileno()).st_size - f.tell())
+
+
+def read_header(fileobj: BinaryIO) -> Dict[str, Any]:
+    """
+    Lee el preámbulo y la cabecera JSON de una bóveda v2.
+
+    Deja ``fileobj`` posicionado en el primer marco cifrado.
+
+    :raises ValueError: Si el archivo no es v2 o la cabecera está corrupta.
+    """
+    magic, version, header_len = _PREAMBLE.unpack(_read_exact(fileobj, _PREAMBLE.size))
+    if magic != VAULT_MAGIC:
+        raise ValueError("El archivo no es una bóveda en formato v2")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Versión de formato no soportada: {version}")
+    try:
+        header = json.loads(_read_exact(fileobj, header_len).decode('utf-8'))
+    except ValueError as exc:
+        raise ValueError("Cabecera de la bóveda corrupta") from exc
+    if not isinstance(header, dict):
+        raise ValueError("Cabecera de la bóveda corrupta")
+    return header
+
+
+class _RecordRef:
+    """
+    Referencia a un registro cifrado dentro de una bóveda ``records``.
+
+    Además de la posición del registro conserva el resumen no secreto
+    de la entrada (identificador, título, usuario, fortaleza de la
+    contraseña y dominio) que se guarda en la tabla de contenidos cifrada.
+    """
+
+    __slots__ = ("offset", "length", "id", "title", "username", "strength", "score", "domain")
+
+    def __init__(self, offset: int, length: int, entry_id: str, title: str = "",
+                 username: str = "", strength: str = "", score: int = 0, domain: str = "") -> None:
+        self.offset = offset
+        self.length = length
+        self.id = entry_id
+        self.title = title
+        self.username = username
+        self.strength = strength
+        self.score = score
+        self.domain = domain
+
+    def to_list(self) -> List[Any]:
+        return [self.offset, self.length, self.id, self.title, self.username, self.strength, self.score, self.domain]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "title": self.title,
+            "username": self.username,
+            "strength": self.strength,
+            "score": self.score,
+            "domain": self.domain,
+        }
+
+
+def url_domain(url: Any) -> str:
+    """Nombre de host de ``url`` en minúsculas y sin ``www.``; cadena vacía si no tiene."""
+    if not isinstance(url, str) or not url.strip():
+        return ""
+    url = url.strip()
+    try:
+        host = urlsplit(url if "//" in url else "//" + url).hostname or ""
+    except ValueError:
+        return ""
+    return host[4:] if host.startswith("www.") else host
+
+
+def _summarize(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Calcula el resumen que se muestra en los listados sin la contraseña."""
+    strength = check_password_strength(entry.get("password", ""))
+    return {
+        "id": entry.get("id"),
+        "title": entry.get("title", ""),
+        "username": entry.get("username", ""),
+        "strength": strength["strength"],
+        "score": strength["score"],
+        "domain": url_domain(entry.get("url")),
+    }
+
+
+def _search_terms(*texts: Any) -> Set[str]:
+    """Palabras normalizadas (NFKC, sin distinguir mayúsculas) de ``texts``."""
+    text = " ".join(t for t in texts if isinstance(t, str))
+    return set(re.findall(r"\w+", unicodedata.normalize("NFKC", text).casefold()))
+
+
+def _entry_terms(entry: Dict[str, Any]) -> Set[str]:
+    """Términos indexados de una entrada: palabras del título, del usuario y del dominio."""
+    return _search_terms(entry.get("title"), entry.get("username"), url_domain(entry.get("url")))
+
+
+def _index_token(index_key: bytes, term: str) -> str:
+    """Ficha ciega de ``term``: HMAC truncado, en hexadecimal."""
+    return hmac.new(index_key, term.encode('utf-8'), hashlib.sha256).digest()[:_INDEX_TOKEN_SIZE].hex()
+
+
+def _codec(name: str) -> Tuple[Callable[[bytes, int], bytes], Callable[[bytes], bytes], int]:
+    """Devuelve el compresor registrado con ``name`` o lanza ``ValueError``."""
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f"Compresor no soportado: {name}") from None
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    """Descomprime ``data`` convirtiendo cualquier error del compresor en ``ValueError``."""
+    try:
+        return _codec(codec)[1](data)
+    except ValueError:
+        raise
+    except Exception as exc:
+        raise ValueError("Contraseña incorrecta o datos corruptos") from exc
+
+
+def _pad_header(raw: bytes) -> bytes:
+    """Rellena la cabecera JSON con espacios (ver :data:`_HEADER_SLACK`)."""
+    slack = max(_HEADER_SLACK, len(raw) // 2)
+    size = -(-(_PREAMBLE.size + len(raw) + slack) // _HEADER_ALIGN) * _HEADER_ALIGN
+    return raw + b" " * (size - _PREAMBLE.size - len(raw))
+
+
+def unlock_key(header: Dict[str, Any], password: str) -> Tuple[bytes, bytes, bool]:
+    """
+    Obtiene la clave de datos de una bóveda v2 a partir de la contraseña.
+
+    Deriva la clave de la contraseña con la sal y el KDF de la cabecera
+    (usando :data:`key_cache`) y abre con ella la clave de datos
+    (:func:`crypto.open_data_key`).
+
+    :return: Tupla ``(clave de datos, clave derivada, si estaba en caché)``;
+        el llamador guarda la derivada en la caché cuando la verifica.
+    :raises ValueError: Si la contraseña no coincide con la ranura o el KCV.
+    """
+    try:
+        salt = bytes.fromhex(header["salt"])
+    except (KeyError, TypeError, ValueError) as exc:
+        raise ValueError("Cabecera de la bóveda corrupta") from exc
+    derived, cached = _derive_key_cached(password, salt, **normalize_kdf(header.get("kdf")))
+    return open_data_key(header, derived), derived, cached
+
+
+def _read_record(
+    fileobj: BinaryIO,
+    key: bytes,
+    offset: int,
+    codec: str = "none",
+    serializer: str = "json",
+    mac: bool = False,
+    suite: str = LEGACY_SUITE,
+) -> Dict[str, Any]:
+    """
+    Descifra, descomprime y decodifica el registro que comienza en ``offset``.
+
+    Si ``mac`` es ``True`` la etiqueta del registro se comprueba antes de
+    descifrarlo.
+    """
+    fileobj.seek(offset)
+    (length,) = _FRAME.unpack(_read_exact(fileobj, _FRAME.size))
+    nonce = _read_exact(fileobj, 16)
+    buffer = _read_into(fileobj, length)
+    try:
+        if mac:
+            _verify_tag(_mac_key(key), _read_exact(fileobj, _TAG_SIZE), nonce, buffer)
+        SeekableCipher(key, nonce, suite=suite).decrypt_into(0, buffer)
+        return get_serializer(serializer).loads(_decompress(codec, buffer))
+    except VaultIntegrityError:
+        raise
+    except ValueError as exc:
+        raise ValueError("Registro de la bóveda corrupto") from exc
+    finally:
+        _wipe(buffer)
+
+
+class VaultWriter:
+    """
+    Escribe una bóveda en el formato v2.
+
+    El archivo comienza con :data:`VAULT_MAGIC`, un byte de versión y
+    una cabecera JSON en claro con la sal, el nonce, la disposición
+    (``layout``) y un identificador aleatorio de la instantánea (usado
+    por el diario, ver :func:`append_journal`).  Existen dos
+    disposiciones:
+
+    ``stream`` (por defecto)
+        Marcos ``longitud (4 bytes) || ciphertext``; el primero contiene
+        los metadatos de la bóveda (todas las claves salvo ``entries``)
+        y los siguientes agrupan entradas serializadas como JSON, una
+        por línea, hasta alcanzar ``chunk_size`` bytes.  Cada marco se
+        cifra por separado continuando el contador del flujo donde
+        terminó el anterior, y un marco de longitud cero marca el final.
+
+    ``records``
+        Cada entrada es un registro ``longitud || nonce || ciphertext``
+        cifrado con su propio nonce.  Al final se escribe una tabla de
+        contenidos cifrada con los metadatos, la posición de cada
+        registro y su resumen (título, usuario y fortaleza), seguida de
+        8 bytes con la posición de la tabla.  Permite descifrar una
+        entrada sin tocar las demás (ver :class:`LazyEntries`).  Con
+        ``index=True`` se escribe antes de la tabla un índice ciego en
+        claro (``longitud || JSON || etiqueta``) que asocia fichas HMAC
+        de las palabras del título, el usuario y el dominio de cada
+        entrada con la posición de sus registros; su posición se añade
+        al pie, delante de la de la tabla (ver :func:`search_vault`).
+
+    ``sharded``
+        El archivo es un manifiesto con el formato de ``stream`` pero sin
+        entradas: solo el marco de metadatos.  Las entradas se reparten
+        por un resumen de su ``id`` entre varias bóvedas ``stream``
+        cifradas con la misma clave, guardadas en :func:`shards_path`, y
+        la cabecera del manifiesto (``shards``) anota el archivo, la
+        instantánea y un resumen con clave del contenido de cada una
+        (ver :func:`_write_shards`).  Al estar la cabecera cubierta por
+        el MAC, un fragmento no puede sustituirse por otro ni por una
+        versión anterior.
+
+    Antes de cifrarse, cada fragmento, registro o tabla de contenidos se
+    comprime con el compresor ``codec`` (ver :data:`CODECS`); el nombre y
+    el nivel se anotan en la cabecera.  Las entradas se codifican con el
+    serializador ``serializer`` (ver :mod:`serializers`), también anotado
+    en la cabecera; metadatos y tabla de contenidos siguen siendo JSON.
+    La cabecera anota también los parámetros del KDF (``kdf``) con los que
+    se derivó ``key`` para que los lectores no dependan de los valores
+    por defecto, el número de versión de la instantánea (ver
+    :func:`vault_version`) y la suite de cifrado (``suite``, ver
+    :data:`CIPHER_SUITES`) que genera el flujo de marcos y registros.
+
+    Con ``slots`` la cabecera guarda además ``key`` envuelta con claves
+    derivadas de contraseñas (ver :func:`change_password`): ``key`` es
+    entonces una clave de datos aleatoria y ``salt`` y ``kdf`` describen
+    la ranura de la contraseña maestra.  ``rotate`` anota que la clave de
+    una bóveda compartida debe sustituirse (ver :mod:`sharing`).  La cabecera se rellena con
+    espacios para poder reescribir esos campos en el sitio.
+
+    La cabecera incluye un valor de comprobación de la clave (``kcv``)
+    y cada marco, registro y tabla de contenidos va seguido de una
+    etiqueta HMAC-SHA256 de 32 bytes sobre su ciphertext, calculada con
+    una subclave de ``key``.  La de los marcos cubre además la cabecera
+    y la posición del contador, de modo que no pueden reordenarse,
+    eliminarse ni truncarse (el marco final también lleva etiqueta); la
+    de los registros cubre su nonce, para poder copiarlos entre archivos.
+
+    Solo se mantiene en memoria el fragmento en construcción (o la
+    tabla de contenidos), por lo que el consumo no depende del tamaño
+    de las entradas::
+
+        with VaultWriter(f, key, salt, meta) as writer:
+            for entry in entries:
+                writer.write_entry(entry)
+    """
+
+    def __init__(
+        self,
+        fileobj: BinaryIO,
+        key: bytes,
+        salt: bytes,
+        meta: Optional[Dict[str, Any]] = None,
+        *,
+        chunk_size: int = CHUNK_SIZE,
+        layout: str = DEFAULT_LAYOUT,
+        codec: str = DEFAULT_CODEC,
+        level: Optional[int] = None,
+        serializer: str = DEFAULT_SERIALIZER,
+        kdf: Optional[Dict[str, Any]] = None,
+        version: int = 1,
+        suite: str = DEFAULT_SUITE,
+        index: bool = False,
+        slots: Optional[List[Dict[str, Any]]] = None,
+        rotate: bool = False,
+        shards: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        if layout not in LAYOUTS:
+            raise ValueError(f"Disposición de bóveda desconocida: {layout}")
+        if index and layout != "records":
+            raise ValueError("El índice de búsqueda requiere la disposición 'records'")
+        compress, _, default_level = _codec(codec)
+        self.codec = codec
+        self._level = default_level if level is None else level
+        self._compress = lambda data: compress(data, self._level)
+        self.serializer = serializer
+        self._serializer = get_serializer(serializer)
+        self._file = fileobj
+        self._key = key
+        self._mac_key = _mac_key(key)
+        self._nonce = os.urandom(16)
+        self.suite = suite
+        self._cipher = SeekableCipher(key, self._nonce, suite=suite)
+        self._counter = 0
+        self._chunk_size = chunk_size
+        self._pending: List[bytes] = []
+        self._pending_size = 0
+        self._closed = False
+        self._meta = meta or {}
+        self._position = 0
+        self.layout = layout
+        self.records: List[_RecordRef] = []
+        self._index: Optional[Dict[str, List[int]]] = {} if index else None
+        self._index_key = _subkey(key, b"index")
+        self.header: Dict[str, Any] = {
+            "salt": salt.hex(),
+            "nonce": self._nonce.hex(),
+            "chunk_size": chunk_size,
+            "snapshot": uuid.uuid4().hex,
+            "layout": layout,
+            "codec": codec,
+            "level": self._level,
+            "serializer": serializer,
+            "kdf": normalize_kdf(kdf),
+            "version": version,
+            "suite": suite,
+            "kcv": _key_check(key),
+            "mac": MAC_ALGORITHM,
+        }
+        if index:
+            self.header["index"] = INDEX_ALGORITHM
+        if layout == "sharded":
+            self.header["shards"] = shards or []
+        if slots:
+            self.header["slots"] = slots
+        if rotate:
+            self.header["rotate"] = True
+        self._header_digest = _header_digest(self.header)
+        header = _pad_header(json.dumps(self.header).encode('utf-8'))
+        self._write(_PREAMBLE.pack(VAULT_MAGIC, FORMAT_VERSION, len(header)))
+        self._write(header)
+        if layout != "records":
+            self._write_frame(json.dumps(self._meta).encode('utf-8'))
+
+    def _write(self, data: bytes) -> None:
+        self._file.write(data)
+        self._position += len(data)
+
+    def _frame_tag(self, ciphertext: bytes) -> bytes:
+        return _tag(self._mac_key, self._header_digest, self._counter.to_bytes(8, 'big'), ciphertext)
+
+    def _write_frame(self, plaintext: bytes) -> None:
+        """Comprime y cifra ``plaintext`` a partir del contador actual y lo escribe como marco."""
+        plaintext = self._compress(plaintext)
+        ciphertext = self._cipher.encrypt_range(self._counter * _BLOCK_SIZE, plaintext)
+        self._write(_FRAME.pack(len(plaintext)))
+        self._write(ciphertext)
+        self._write(self._frame_tag(ciphertext))
+        self._counter += -(-len(plaintext) // _BLOCK_SIZE)
+
+    def _flush_chunk(self) -> None:
+        if self._pending:
+            self._write_frame(self._serializer.pack(self._pending))
+            self._pending = []
+            self._pending_size = 0
+
+    def write_entry(self, entry: Dict[str, Any]) -> Optional[_RecordRef]:
+        """
+        Añade una entrada.
+
+        En la disposición ``stream`` se acumula en el fragmento actual,
+        que se cifra al llenarse; en ``records`` se cifra de inmediato
+        como un registro independiente (la entrada debe tener ``id``).
+
+        :return: En ``records``, la referencia al registro escrito.
+        """
+        if self.layout == "sharded":
+            raise ValueError("Las entradas de una bóveda 'sharded' se escriben en sus fragmentos")
+        line = self._serializer.dumps(entry)
+        if self.layout == "records":
+            summary = _summarize(entry)
+            if not summary["id"]:
+                raise ValueError("Las entradas de una bóveda 'records' necesitan 'id'")
+            nonce = os.urandom(16)
+            line = self._compress(line)
+            ref = _RecordRef(self._position, len(line), summary.pop("id"), **summary)
+            ciphertext = SeekableCipher(self._key, nonce, suite=self.suite).encrypt_range(0, line)
+            self._write(_FRAME.pack(len(line)))
+            self._write(nonce)
+            self._write(ciphertext)
+            self._write(_tag(self._mac_key, nonce, ciphertext))
+            self._add_record(ref)
+            return ref
+        self._append_line(line)
+        return None
+
+    def _append_line(self, line: bytes) -> None:
+        """Añade al fragmento actual una entrada ya serializada (``stream``)."""
+        self._pending.append(line)
+        self._pending_size += len(line) + self._serializer.overhead()
+        if self._pending_size >= self._chunk_size:
+            self._flush_chunk()
+
+    def copy_record(self, source: BinaryIO, ref: _RecordRef) -> _RecordRef:
+        """
+        Copia un registro ya cifrado (y autenticado) de otra bóveda con la
+        misma clave, compresor, serializador y suite de cifrado.
+
+        El registro se transfiere sin descifrarlo, de modo que guardar una
+        bóveda ``records`` solo cifra las entradas modificadas.
+
+        :return: Nueva referencia con la posición dentro de este archivo.
+        """
+        if self.layout != "records":
+            raise ValueError("Solo las bóvedas 'records' admiten copiar registros")
+        source.seek(ref.offset)
+        raw = _read_exact(source, _FRAME.size + 16 + ref.length + _TAG_SIZE)
+        new_ref = _RecordRef(self._position, ref.length, ref.id, ref.title, ref.username, ref.strength, ref.score, ref.domain)
+        self._write(raw)
+        self._add_record(new_ref)
+        return new_ref
+
+    def _add_record(self, ref: _RecordRef) -> None:
+        self.records.append(ref)
+        if self._index is not None:
+            for term in _search_terms(ref.title, ref.username, ref.domain):
+                self._index.setdefault(_index_token(self._index_key, term), []).append(ref.offset)
+
+    def close(self) -> None:
+        """Escribe lo pendiente y el cierre (marco final o tabla de contenidos)."""
+        if self._closed:
+            return
+        if self.layout == "records":
+            if self._index is not None:
+                index_offset = self._position
+                raw = json.dumps({"tokens": self._index}, separators=(",", ":"), sort_keys=True).encode('utf-8')
+                self._write(_FRAME.pack(len(raw)))
+                self._write(raw)
+                self._write(_tag(self._mac_key, self._header_digest, b"index", raw))
+            toc_offset = self._position
+            toc = {"meta": self._meta, "records": [ref.to_list() for ref in self.records]}
+            self._write_frame(json.dumps(toc).encode('utf-8'))
+            if self._index is not None:
+                self._write(_FOOTER.pack(index_offset))
+            self._write(_FOOTER.pack(toc_offset))
+        else:
+            self._flush_chunk()
+            self._write(_FRAME.pack(0))
+            self._write(self._frame_tag(b""))
+        self._closed = True
+
+    def __enter__(self) -> "VaultWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+
+
+class VaultReader:
+    """
+    Lee una bóveda en formato v2.
+
+    Al construirse lee la cabecera, deriva la clave (o usa ``key`` si se
+    proporciona) y descifra el marco de metadatos (``stream``) o la
+    tabla de contenidos (``records``), de modo que una contraseña
+    incorrecta se detecta antes de recorrer las entradas.  Iterar sobre
+    el lector produce las entradas una a una descifrando un único
+    fragmento o registro cada vez.
+
+    :param fileobj: Archivo binario posicionado al inicio de la bóveda.
+    :param password: Contraseña maestra.
+    :param key: Clave de datos ya obtenida (:attr:`key`); evita ejecutar
+        PBKDF2 de nuevo.
+    :raises ValueError: Si el archivo no es v2, está corrupto o la
+        contraseña no coincide.  Con cabecera ``kcv`` una contraseña
+        incorrecta se detecta nada más derivar la clave, y con ``mac``
+        cada marco o registro se autentica antes de descifrarse
+        (:class:`VaultIntegrityError` si no coincide).
+    """
+
+    def __init__(self, fileobj: BinaryIO, password: Optional[str] = None, *, key: Optional[bytes] = None) -> None:
+        self._file = fileobj
+        self.header = read_header(fileobj)
+        try:
+            self.salt = bytes.fromhex(self.header["salt"])
+            self._nonce = bytes.fromhex(self.header["nonce"])
+        except (KeyError, TypeError, ValueError) as exc:
+            raise ValueError("Cabecera de la bóveda corrupta") from exc
+        self.layout = self.header.get("layout", "stream")
+        if self.layout not in LAYOUTS:
+            raise ValueError(f"Disposición de bóveda no soportada: {self.layout}")
+        self.codec = self.header.get("codec", "none")
+        _codec(self.codec)
+        self.serializer = self.header.get("serializer", "json")
+        self._serializer = get_serializer(self.serializer)
+        self.suite = self.header.get("suite", LEGACY_SUITE)
+        _cipher_suite(self.suite)
+        self.kdf = normalize_kdf(self.header.get("kdf"))
+        self.mac = _requires_mac(self.header)
+        cached = True
+        if key is None:
+            if password is None:
+                raise ValueError("Se requiere la contraseña o la clave")
+            key, derived, cached = unlock_key(self.header, password)
+        elif "kcv" in self.header and not hmac.compare_digest(str(self.header["kcv"]), _key_check(key)):
+            raise ValueError("Contraseña incorrecta o datos corruptos")
+        self.key = key
+        self._mac_key = _mac_key(key)
+        self._header_digest = _header_digest(self.header)
+        self._cipher = SeekableCipher(key, self._nonce, suite=self.suite)
+        self._counter = 0
+        self.records: List[_RecordRef] = []
+        if self.layout == "records":
+            fileobj.seek(-_FOOTER.size, io.SEEK_END)
+            (toc_offset,) = _FOOTER.unpack(_read_exact(fileobj, _FOOTER.size))
+            fileobj.seek(toc_offset)
+        try:
+            buffer = self._read_frame() or bytearray()
+            try:
+                frame = json.loads(buffer)
+            finally:
+                _wipe(buffer)
+            if self.layout == "records":
+                self.records = [_RecordRef(*item) for item in frame["records"]]
+                frame = frame["meta"]
+        except VaultIntegrityError:
+            raise
+        except Exception as exc:
+            raise ValueError("Contraseña incorrecta o datos corruptos") from exc
+        if not isinstance(frame, dict):
+            raise ValueError("Contraseña incorrecta o datos corruptos")
+        self.meta: Dict[str, Any] = frame
+        if not cached:
+            key_cache.put(password, self.salt, derived, **self.kdf)
+
+    def _read_frame(self) -> Optional[bytearray]:
+        """
+        Lee, autentica y descifra el siguiente marco; ``None`` indica el final.
+
+        El marco se lee y descifra en un único ``bytearray`` que el
+        llamador debe borrar con :func:`_wipe` cuando termine de usarlo.
+        """
+        (length,) = _FRAME.unpack(_read_exact(self._file, _FRAME.size))
+        buffer = _read_into(self._file, length)
+        if self.mac:
+            tag = _read_exact(self._file, _TAG_SIZE)
+            _verify_tag(self._mac_key, tag, self._header_digest, self._counter.to_bytes(8, 'big'), buffer)
+        if length == 0:
+            return None
+        self._cipher.decrypt_into(self._counter * _BLOCK_SIZE, buffer)
+        self._counter += -(-length // _BLOCK_SIZE)
+        if self.codec == "none":
+            return buffer
+        try:
+            return bytearray(_decompress(self.codec, buffer))
+        finally:
+            _wipe(buffer)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        if self.layout == "records":
+            for ref in self.records:
+                yield _read_record(self._file, self.key, ref.offset, self.codec, self.serializer, self.mac, self.suite)
+            return
+        while True:
+            chunk = self._read_frame()
+            if chunk is None:
+                return
+            try:
+                entries = [self._serializer.loads(line) for line in self._serializer.unpack(chunk)]
+            except VaultIntegrityError:
+                raise
+            except ValueError as exc:
+                raise ValueError("Contraseña incorrecta o datos corruptos") from exc
+            finally:
+                _wipe(chunk)
+            yield from entries
+
+
+class LazyEntries(MutableSequence):
+    """
+    Lista de entradas de una bóveda ``records`` que descifra bajo demanda.
+
+    Cada posición contiene una referencia a un registro cifrado o una
+    entrada ya descifrada.  Acceder a ``entries[i]`` descifra solo ese
+    registro (y lo conserva en memoria); :meth:`summaries` devuelve
+    título, usuario y fortaleza de todas las entradas a partir de la
+    tabla de contenidos, sin descifrar ningún registro.  Las operaciones
+    de modificación (asignar, insertar, eliminar) funcionan como en una
+    lista normal y :func:`save_vault` reutiliza sin descifrarlos los
+    registros que no se han tocado.
+
+    :param source: Ruta del archivo de la bóveda o su contenido en bytes.
+    :param key: Clave derivada de la bóveda.
+    :param items: Referencias o entradas iniciales.
+    :param codec: Compresor de los registros (ver :data:`CODECS`).
+    :param serializer: Serializador de los registros (ver :mod:`serializers`).
+    :param mac: Si los registros llevan etiqueta de autenticación.
+    :param suite: Suite de cifrado de los registros (ver :data:`CIPHER_SUITES`).
+    """
+
+    def __init__(
+        self,
+        source: Any,
+        key: bytes,
+        items: Iterable[Any] = (),
+        codec: str = "none",
+        serializer: str = "json",
+        mac: bool = False,
+        suite: str = LEGACY_SUITE,
+    ) -> None:
+        self._source = source
+        self._key = key
+        self._codec = codec
+        self._serializer = serializer
+        self._mac = mac
+        self._suite = suite
+        self._items: List[Any] = list(items)
+        self._lock = threading.RLock()
+
+    def _open(self) -> BinaryIO:
+        if isinstance(self._source, (bytes, bytearray)):
+            return io.BytesIO(self._source)
+        return open(self._source, 'rb')
+
+    def _load(self, index: int, fileobj: Optional[BinaryIO] = None) -> Dict[str, Any]:
+        with self._lock:
+            item = self._items[index]
+            if isinstance(item, _RecordRef):
+                if fileobj is None:
+                    with self._open() as f:
+                        item = _read_record(f, self._key, item.offset, self._codec, self._serializer, self._mac, self._suite)
+                else:
+                    item = _read_record(fileobj, self._key, item.offset, self._codec, self._serializer, self._mac, self._suite)
+                self._items[index] = item
+            return item
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        # Un recorrido completo reutiliza un único descriptor de archivo
+        with self._open() as f:
+            index = 0
+            while index < len(self._items):
+                yield self._load(index, f)
+                index += 1
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __getitem__(self, index):  # type: ignore[override]
+        if isinstance(index, slice):
+            return [self._load(i) for i in range(*index.indices(len(self._items)))]
+        if index < 0:
+            index += len(self._items)
+        if not 0 <= index < len(self._items):
+            raise IndexError("índice de entrada fuera de rango")
+        return self._load(index)
+
+    def __setitem__(self, index, value) -> None:  # type: ignore[override]
+        with self._lock:
+            self._items[index] = value
+
+    def __delitem__(self, index) -> None:  # type: ignore[override]
+        with self._lock:
+            del self._items[index]
+
+    def insert(self, index: int, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._items.insert(index, value)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (list, LazyEntries)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        loaded = sum(1 for item in self._items if not isinstance(item, _RecordRef))
+        return f"<LazyEntries {len(self._items)} entradas, {loaded} descifradas>"
+
+    def copy(self) -> "LazyEntries":
+        """Copia superficial que comparte los registros aún cifrados (y el cerrojo)."""
+        with self._lock:
+            clone = LazyEntries(
+                self._source, self._key, self._items, self._codec, self._serializer, self._mac, self._suite
+            )
+            clone._lock = self._lock
+            return clone
+
+    def ids(self) -> List[Optional[str]]:
+        """Identificadores de todas las entradas, sin descifrar registros."""
+        return [item.id if isinstance(item, _RecordRef) else item.get("id") for item in self._items]
+
+    def summaries(self) -> List[Dict[str, Any]]:
+        """Resumen (sin contraseñas) de cada entrada, sin descifrar registros."""
+        return [item.summary() if isinstance(item, _RecordRef) else _summarize(item) for item in self._items]
+
+
+def entry_summaries(entries: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Devuelve ``id``, título, usuario y fortaleza de cada entrada.
+
+    Con una :class:`LazyEntries` los datos salen de la tabla de
+    contenidos, sin descifrar ninguna entrada; con una lista normal se
+    calculan a partir de las entradas.  Es la forma recomendada de
+    construir listados.
+    """
+    if isinstance(entries, LazyEntries):
+        return entries.summaries()
+    return [_summarize(entry) for entry in entries]
+
+
+def match_entries(entries: Iterable[Dict[str, Any]], query: str) -> List[int]:
+    """
+    Índices de las entradas que contienen todas las palabras de ``query``.
+
+    Aplica las mismas reglas que :func:`search_vault` (palabras
+    completas, sin distinguir mayúsculas, del título, del usuario y del
+    dominio de la URL) sobre :func:`entry_summaries`, así que con una
+    :class:`LazyEntries` no se descifra ninguna entrada.
+    """
+    terms = _search_terms(query)
+    if not terms:
+        return []
+    return [
+        index
+        for index, summary in enumerate(entry_summaries(entries))
+        if terms <= _search_terms(summary["title"], summary["username"], summary["domain"])
+    ]
+
+
+def _entry_ids(entries: Iterable[Dict[str, Any]]) -> List[Optional[str]]:
+    """Identificadores de las entradas sin forzar el descifrado de una :class:`LazyEntries`."""
+    if isinstance(entries, LazyEntries):
+        return entries.ids()
+    return [entry.get("id") for entry in entries]
+
+
+def read_vault(
+    fileobj: BinaryIO,
+    password: Optional[str],
+    key: Optional[bytes] = None,
+    vault_file: Optional[str] = None,
+) -> Tuple[Dict, bytes]:
+    """
+    Reconstruye el diccionario de una bóveda v2.
+
+    Si se indica ``vault_file`` se aplican además las operaciones de su
+    diario asociado.  En la disposición ``records`` las entradas se
+    devuelven como una :class:`LazyEntries` que no descifra nada hasta
+    que se accede a ellas, y en ``sharded`` se leen sus fragmentos en
+    paralelo (ver :func:`_read_shards`).
+    """
+    reader = VaultReader(fileobj, password, key=key)
+    vault_data = dict(reader.meta)
+    records: List[Dict[str, Any]] = []
+    if vault_file is not None:
+        records = _read_journal(vault_file, reader.key, reader.header.get("snapshot"), reader.mac)
+    if reader.layout == "records":
+        if vault_file is None:
+            fileobj.seek(0)
+            source: Any = fileobj.read()
+        else:
+            source = vault_file
+        items = _apply_journal(reader.records, records, _item_id)
+        vault_data["entries"] = LazyEntries(
+            source, reader.key, items, reader.codec, reader.serializer, reader.mac, reader.suite
+        )
+    elif reader.layout == "sharded":
+        if vault_file is None:
+            raise ValueError("Las bóvedas 'sharded' solo pueden leerse desde su archivo")
+        vault_data["entries"] = list(_apply_journal(_read_shards(vault_file, reader.header, reader.key), records))
+    else:
+        vault_data["entries"] = list(_apply_journal(reader, records))
+    return vault_data, reader.key
+
+
+def read_file_header(vault_file: str) -> Optional[Dict[str, Any]]:
+    """Devuelve la cabecera de una bóveda v2, o ``None`` si el archivo es v1."""
+    with open(vault_file, 'rb') as f:
+        if f.read(len(VAULT_MAGIC)) != VAULT_MAGIC:
+            return None
+        f.seek(0)
+        return read_header(f)
+
+
+def _read_salt(vault_file: str) -> Optional[bytes]:
+    """Devuelve la sal almacenada en una bóveda v1 o v2, o ``None`` si no existe."""
+    if not os.path.exists(vault_file):
+        return None
+    with open(vault_file, 'rb') as f:
+        prefix = f.read(16)
+        if prefix[:len(VAULT_MAGIC)] == VAULT_MAGIC:
+            f.seek(0)
+            try:
+                return bytes.fromhex(read_header(f)["salt"])
+            except (KeyError, TypeError, ValueError):
+                return None
+    return prefix if len(prefix) == 16 else None
+
+
+def shards_path(vault_file: str) -> str:
+    """Directorio de los fragmentos de una bóveda ``sharded``."""
+    return vault_file + SHARDS_SUFFIX
+
+
+def _shard_of(entry_id: str, count: int) -> int:
+    """
+    Fragmento al que pertenece la entrada ``entry_id`` entre ``count``.
+
+    Basta un CRC-32: solo reparte las entradas, el fragmento no es secreto.
+    """
+    return zlib.crc32(entry_id.encode('utf-8')) % count
+
+
+def _shard_digest(key: bytes, codec: str, serializer: str, suite: str, lines: List[bytes]) -> str:
+    """
+    Resumen con clave del contenido de un fragmento.
+
+    Cubre las entradas serializadas y el formato con el que se cifran,
+    de modo que un fragmento solo se reutiliza si escribirlo de nuevo
+    produciría el mismo contenido.  Al depender de ``key`` no revela si
+    dos bóvedas contienen las mismas entradas.
+    """
+    mac = hmac.new(_subkey(key, b"shard"), json.dumps([codec, serializer, suite]).encode('utf-8'), hashlib.sha256)
+    mac.update(get_serializer(serializer).pack(lines))
+    return mac.hexdigest()
+
+
+def _shard_files(vault_file: str, header: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """Rutas e instantáneas de los fragmentos que anota la cabecera de un manifiesto."""
+    try:
+        items = [(item["file"], item["snapshot"]) for item in header["shards"]]
+    except (KeyError, TypeError) as exc:
+        raise ValueError("Cabecera de la bóveda corrupta") from exc
+    for name, _ in items:
+        if not isinstance(name, str) or os.path.basename(name) != name or name in ("", ".", ".."):
+            raise ValueError("Cabecera de la bóveda corrupta")
+    return [(os.path.join(shards_path(vault_file), name), snapshot) for name, snapshot in items]
+
+
+def _open_shard(path: str, key: bytes, snapshot: str) -> Tuple[BinaryIO, VaultReader]:
+    """Abre un fragmento comprobando que es la instantánea que anota el manifiesto."""
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        raise ValueError(f"Falta un fragmento de la bóveda: {os.path.basename(path)}") from None
+    try:
+        reader = VaultReader(f, key=key)
+        if reader.layout != "stream" or reader.header.get("snapshot") != snapshot:
+            raise VaultIntegrityError("Fragmento de la bóveda sustituido o corrupto")
+    except BaseException:
+        f.close()
+        raise
+    return f, reader
+
+
+def _load_shard(path: str, key: bytes, snapshot: str) -> List[Dict[str, Any]]:
+    """Descifra todas las entradas de un fragmento (en un proceso de :func:`_read_shards`)."""
+    f, reader = _open_shard(path, key, snapshot)
+    with f:
+        return list(reader)
+
+
+def _read_shards(vault_file: str, header: Dict[str, Any], key: bytes) -> List[Dict[str, Any]]:
+    """
+    Descifra los fragmentos de una bóveda ``sharded`` en un conjunto de procesos.
+
+    Cada proceso descifra, descomprime y decodifica un fragmento
+    completo, de modo que el trabajo se reparte entre los núcleos en
+    lugar de limitarse al GIL de este proceso; solo la recepción de las
+    entradas ya decodificadas es secuencial.  Con un único núcleo, o si
+    los fragmentos suman menos de :data:`_PARALLEL_SHARD_BYTES`, se
+    descifran aquí mismo.  Las entradas se devuelven fragmento a
+    fragmento, conservando su orden dentro de cada uno.
+    """
+    shards = _shard_files(vault_file, header)
+    workers = min(len(shards), os.cpu_count() or 1)
+    size = sum(os.path.getsize(path) for path, _ in shards if os.path.exists(path))
+    if workers > 1 and size >= _PARALLEL_SHARD_BYTES:
+        paths, snapshots = zip(*shards)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_load_shard, paths, itertools.repeat(key), snapshots))
+    else:
+        parts = [_load_shard(path, key, snapshot) for path, snapshot in shards]
+    return [entry for part in parts for entry in part]
+
+
+def _write_shards(
+    vault_file: str,
+    entries: Iterable[Dict[str, Any]],
+    key: bytes,
+    salt: bytes,
+    count: int,
+    previous: List[Dict[str, Any]],
+    **options: Any,
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Escribe los fragmentos de una bóveda ``sharded`` cuyo contenido cambió.
+
+    Las entradas se reparten con :func:`_shard_of` y cada grupo se
+    compara, por su resumen (ver :func:`_shard_digest`), con el
+    fragmento que ocupaba su posición en ``previous``: si coincide se
+    reutiliza el archivo sin cifrar nada.  Los fragmentos nuevos se
+    escriben con un nombre propio, nunca sobre uno existente, de modo
+    que la bóveda anterior sigue intacta hasta sustituir el manifiesto.
+
+    :param previous: Descriptores ``shards`` de la cabecera actual, o una
+        lista vacía si no pueden reutilizarse.
+    :param options: Opciones de :class:`VaultWriter` (compresor,
+        serializador, KDF, suite y versión).
+    :return: Tupla ``(descriptores para la cabecera, archivos creados)``.
+    """
+    groups: List[List[Dict[str, Any]]] = [[] for _ in range(count)]
+    for entry in entries:
+        groups[_shard_of(ensure_entry_id(entry), count)].append(entry)
+    encoder = get_serializer(options["serializer"])
+    directory = shards_path(vault_file)
+    os.makedirs(directory, exist_ok=True)
+    shards: List[Dict[str, Any]] = []
+    created: List[str] = []
+    try:
+        for number, group in enumerate(groups):
+            lines = [encoder.dumps(entry) for entry in group]
+            digest = _shard_digest(key, options["codec"], options["serializer"], options["suite"], lines)
+            old = previous[number] if number < len(previous) else None
+            if old is not None and old.get("digest") == digest and os.path.exists(os.path.join(directory, old["file"])):
+                shards.append(old)
+                continue
+            fd, tmp_file = tempfile.mkstemp(prefix=f".{number:03d}-", suffix=".tmp", dir=directory)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    with VaultWriter(f, key, salt, layout="stream", **options) as writer:
+                        for line in lines:
+                            writer._append_line(line)
+                    f.flush()
+                    os.fsync(f.fileno())
+                name = f"{number:03d}-{writer.header['snapshot']}"
+                os.replace(tmp_file, os.path.join(directory, name))
+            except BaseException:
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+                raise
+            created.append(os.path.join(directory, name))
+            shards.append({"file": name, "snapshot": writer.header["snapshot"], "digest": digest})
+    except BaseException:
+        for path in created:
+            os.remove(path)
+        raise
+    return shards, created
+
+
+# Diario de operaciones junto a la instantánea v2
+JOURNAL_SUFFIX = ".journal"
+JOURNAL_MAGIC = b"VKJL"
+_JOURNAL_PREAMBLE = struct.Struct(">4sI")
+
+# Umbrales a partir de los cuales el diario se compacta en una instantánea
+JOURNAL_MAX_BYTES = 4 * 1024 * 1024
+JOURNAL_MAX_RATIO = 0.5
+
+
+# Bloqueo entre procesos (ver :func:`vault_lock`)
+LOCK_SUFFIX = ".lock"
+LOCK_TIMEOUT = 10.0
+
+
+class VaultConflictError(ValueError):
+    """La bóveda cambió (o está bloqueada) en otro proceso; la escritura no se realizó."""
+
+
+def journal_path(vault_file: str) -> str:
+    """Ruta del diario asociado a ``vault_file``."""
+    return vault_file + JOURNAL_SUFFIX
+
+
+def lock_path(vault_file: str) -> str:
+    """Ruta del archivo de bloqueo asociado a ``vault_file``."""
+    return vault_file + LOCK_SUFFIX
+
+
+@contextmanager
+def vault_lock(vault_file: str, exclusive: bool = False, timeout: float = LOCK_TIMEOUT) -> Iterator[None]:
+    """
+    Bloquea la bóveda frente a otros procesos con ``fcntl.flock``.
+
+    Los lectores toman un bloqueo compartido, de modo que pueden abrir
+    la bóveda a la vez sin esperarse entre sí; los escritores toman uno
+    exclusivo.  El bloqueo se hace sobre :func:`lock_path` y no sobre la
+    bóveda porque las instantáneas la sustituyen con :func:`os.replace`.
+    Si no se obtiene en ``timeout`` segundos se lanza
+    :class:`VaultConflictError`.  En plataformas sin :mod:`fcntl` no se
+    bloquea nada, y un lector que no puede crear el archivo de bloqueo
+    (directorio de solo lectura) continúa sin él.
+
+    Los bloqueos son por descriptor: dentro de un mismo proceso, un
+    escritor espera igualmente a que terminen los lectores abiertos.
+    """
+    if fcntl is None:  # pragma: no cover - Windows
+        yield
+        return
+    try:
+        handle = open(lock_path(vault_file), 'a+b')
+    except OSError:
+        if exclusive:
+            raise
+        yield
+        return
+    with handle:
+        mode = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(handle.fileno(), mode | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise VaultConflictError("La bóveda está bloqueada por otro proceso") from None
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+def _journal_extent(path: str) -> Tuple[int, int]:
+    """
+    Cuenta los registros completos de un diario sin descifrarlos.
+
+    :return: Tupla ``(registros, posición tras el último registro completo)``.
+    """
+    header = _journal_header(path) or {}
+    tag_size = _TAG_SIZE if header.get("mac") else 0
+    with open(path, 'rb') as f:
+        _, header_len = _JOURNAL_PREAMBLE.unpack(_read_exact(f, _JOURNAL_PREAMBLE.size))
+        size = os.fstat(f.fileno()).st_size
+        end = _JOURNAL_PREAMBLE.size + header_len
+        count = 0
+        while end + _FRAME.size <= size:
+            f.seek(end)
+            (length,) = _FRAME.unpack(_read_exact(f, _FRAME.size))
+            record_size = _FRAME.size + 16 + length + tag_size
+            if end + record_size > size:
+                break
+            end += record_size
+            count += 1
+        return count, end
+
+
+def vault_version(vault_file: str) -> int:
+    """
+    Versión lógica de la bóveda en disco.
+
+    Es el campo ``version`` de la cabecera más el número de registros
+    del diario de esa instantánea, por lo que crece con cada escritura,
+    ya sea una instantánea o una adición al diario.  Las bóvedas que no
+    existen, las v1 y las v2 anteriores a este campo parten de 0.  Las
+    de otros backends de :mod:`storage` informan de la suya.
+    """
+    if not os.path.exists(vault_file):
+        return 0
+    header = read_file_header(vault_file)
+    if header is None:
+        storage = _storage_backend(vault_file)
+        return 0 if storage is None else storage.version(vault_file)
+    version = int(header.get("version", 0))
+    path = journal_path(vault_file)
+    if header.get("snapshot") and _journal_snapshot(path) == header["snapshot"]:
+        version += _journal_extent(path)[0]
+    return version
+
+
+def read_vault_file(vault_file: str, key: bytes) -> Tuple[Dict[str, Any], Dict, int]:
+    """
+    Lee una bóveda v2 con su clave de datos, sin contraseña.
+
+    La cabecera, los datos (con el diario aplicado) y la versión se leen
+    bajo el mismo bloqueo compartido, así que corresponden a una misma
+    escritura.  La versión sirve como ``expected_version`` de la
+    escritura siguiente (ver :func:`update_header` y :func:`write_vault`).
+
+    :return: Una tupla ``(header, vault_data, version)``.
+    :raises ValueError: Si el archivo no es v2 o ``key`` no lo descifra.
+    """
+    with vault_lock(vault_file), open(vault_file, 'rb') as f:
+        version = vault_version(vault_file)
+        header = read_header(f)
+        f.seek(0)
+        vault_data, _ = read_vault(f, None, key=key, vault_file=vault_file)
+    return header, vault_data, version
+
+
+def _check_version(vault_file: str, expected_version: int) -> None:
+    """Lanza :class:`VaultConflictError` si la versión en disco no es ``expected_version``."""
+    current = vault_version(vault_file)
+    if current != expected_version:
+        raise VaultConflictError(
+            f"La bóveda fue modificada por otro proceso (versión {current}, se esperaba {expected_version})"
+        )
+
+
+def append_journal(
+    vault_file: str,
+    key: bytes,
+    snapshot_id: str,
+    records: Iterable[Dict[str, Any]],
+    *,
+    expected_version: Optional[int] = None,
+) -> int:
+    """
+    Añade operaciones al diario cifrado de una bóveda.
+
+    Cada operación es un diccionario ``{"op": "put", "entry": {...}}``
+    (añadir o actualizar la entrada con ese ``id``) o
+    ``{"op": "delete", "id": ...}``, y se escribe como un registro
+    ``longitud || nonce || ciphertext || etiqueta`` cifrado con su propio
+    nonce, de modo que una edición cuesta solo unos pocos bytes en disco.
+    La etiqueta HMAC cubre también el identificador de la instantánea.  El
+    diario comienza con una cabecera que lo vincula a la instantánea
+    ``snapshot_id``; si el diario existente pertenece a otra
+    instantánea (por ejemplo, tras una compactación interrumpida) se
+    descarta y se empieza uno nuevo.
+
+    :param vault_file: Ruta de la bóveda (instantánea).
+    :param key: Clave derivada de la bóveda.
+    :param snapshot_id: Identificador ``snapshot`` de la cabecera v2.
+    :param records: Operaciones a añadir, en orden.
+    :param expected_version: Si se indica, la escritura solo se realiza si
+        :func:`vault_version` coincide; en caso contrario se lanza
+        :class:`VaultConflictError`.  Cada registro añadido incrementa la
+        versión en uno.
+    :return: Tamaño del diario en bytes tras la escritura.
+    """
+    path = journal_path(vault_file)
+    with vault_lock(vault_file, exclusive=True):
+        if expected_version is not None:
+            _check_version(vault_file, expected_version)
+        header = _journal_header(path)
+        if header is None or header.get("snapshot") != snapshot_id:
+            header = {"snapshot": snapshot_id, "mac": MAC_ALGORITHM, "suite": DEFAULT_SUITE}
+            raw = json.dumps(header).encode('utf-8')
+            with open(path, 'wb') as f:
+                f.write(_JOURNAL_PREAMBLE.pack(JOURNAL_MAGIC, len(raw)))
+                f.write(raw)
+        else:
+            if header.get("mac") is None and _requires_mac(read_file_header(vault_file) or {}):
+                raise VaultIntegrityError("Diario de la bóveda manipulado o corrupto")
+            # Descartar un registro final incompleto para no escribir tras él
+            _, end = _journal_extent(path)
+            if os.path.getsize(path) > end:
+                os.truncate(path, end)
+        mac_key = _mac_key(key) if header.get("mac") else None
+        suite = header.get("suite", LEGACY_SUITE)
+        with open(path, 'ab') as f:
+            for record in records:
+                plaintext = json.dumps(record).encode('utf-8')
+                nonce = os.urandom(16)
+                ciphertext = SeekableCipher(key, nonce, suite=suite).encrypt_range(0, plaintext)
+                f.write(_FRAME.pack(len(plaintext)))
+                f.write(nonce)
+                f.write(ciphertext)
+                if mac_key is not None:
+                    f.write(_tag(mac_key, snapshot_id.encode('utf-8'), nonce, ciphertext))
+            f.flush()
+            os.fsync(f.fileno())
+            return f.tell()
+
+
+def _journal_header(path: str) -> Optional[Dict[str, Any]]:
+    """Cabecera de un diario, o ``None`` si no existe o no es válido."""
+    try:
+        with open(path, 'rb') as f:
+            magic, header_len = _JOURNAL_PREAMBLE.unpack(_read_exact(f, _JOURNAL_PREAMBLE.size))
+            if magic != JOURNAL_MAGIC:
+                return None
+            header = json.loads(_read_exact(f, header_len).decode('utf-8'))
+    except (OSError, ValueError):
+        return None
+    return header if isinstance(header, dict) else None
+
+
+def _journal_snapshot(path: str) -> Optional[str]:
+    """Identificador de instantánea de un diario, o ``None`` si no es válido."""
+    header = _journal_header(path)
+    return header.get("snapshot") if header is not None else None
+
+
+def _read_journal(vault_file: str, key: bytes, snapshot_id: Optional[str], mac: bool) -> List[Dict[str, Any]]:
+    """
+    Lee y descifra las operaciones del diario de ``vault_file``.
+
+    Un diario ausente o perteneciente a otra instantánea no aporta
+    operaciones.  Un último registro incompleto (escritura interrumpida)
+    se ignora.  Si el diario está autenticado, la etiqueta de cada
+    registro se comprueba antes de descifrarlo.
+
+    :param mac: Si la bóveda está autenticada (ver :func:`_requires_mac`);
+        en ese caso el diario también debe estarlo.
+
+    :raises ValueError: Si un registro completo no puede descifrarse o su
+        etiqueta no coincide (:class:`VaultIntegrityError`).
+    """
+    path = journal_path(vault_file)
+    header = _journal_header(path)
+    if snapshot_id is None or header is None or header.get("snapshot") != snapshot_id:
+        return []
+    if header.get("mac") is None:
+        if mac:
+            raise VaultIntegrityError("Diario de la bóveda manipulado o corrupto")
+        mac_key = None
+    elif header["mac"] != MAC_ALGORITHM:
+        raise ValueError(f"Algoritmo de autenticación no soportado: {header['mac']}")
+    else:
+        mac_key = _mac_key(key)
+    tag_size = _TAG_SIZE if mac_key is not None else 0
+    suite = header.get("suite", LEGACY_SUITE)
+    records: List[Dict[str, Any]] = []
+    with open(path, 'rb') as f:
+        _, header_len = _JOURNAL_PREAMBLE.unpack(f.read(_JOURNAL_PREAMBLE.size))
+        f.seek(header_len, io.SEEK_CUR)
+        while True:
+            prefix = f.read(_FRAME.size)
+            if len(prefix) < _FRAME.size:
+                break
+            (length,) = _FRAME.unpack(prefix)
+            try:
+                body = _read_into(f, 16 + length + tag_size)
+            except ValueError:
+                break
+            nonce = bytes(body[:16])
+            try:
+                with memoryview(body) as view, view[16:16 + length] as ciphertext:
+                    if mac_key is not None:
+                        with view[16 + length:] as tag:
+                            _verify_tag(mac_key, tag, snapshot_id.encode('utf-8'), nonce, ciphertext)
+                    SeekableCipher(key, nonce, suite=suite).decrypt_into(0, ciphertext)
+                del body[16 + length:]
+                del body[:16]
+                records.append(json.loads(body))
+            except VaultIntegrityError:
+                raise
+            except ValueError as exc:
+                raise ValueError("Diario de la bóveda corrupto") from exc
+            finally:
+                _wipe(body)
+    return records
+
+
+def _item_id(item: Any) -> Optional[str]:
+    """Identificador de una entrada o de una referencia a registro."""
+    return item.id if isinstance(item, _RecordRef) else item.get("id")
+
+
+def _apply_journal(
+    entries: Iterable[Any],
+    records: List[Dict[str, Any]],
+    id_of: Callable[[Any], Optional[str]] = _item_id,
+) -> Iterator[Any]:
+    """
+    Aplica las operaciones del diario sobre un flujo de entradas.
+
+    Las entradas actualizadas conservan su posición, las eliminadas se
+    omiten y las nuevas se añaden al final en el orden del diario.
+    ``id_of`` permite aplicar el diario a referencias de registros sin
+    descifrarlos.
+    """
+    if not records:
+        yield from entries
+        return
+    puts: Dict[str, Dict[str, Any]] = {}
+    deleted: Set[str] = set()
+    for record in records:
+        if record.get("op") == "put":
+            entry = record["entry"]
+            puts.pop(entry["id"], None)
+            puts[entry["id"]] = entry
+            deleted.discard(entry["id"])
+        elif record.get("op") == "delete":
+            puts.pop(record["id"], None)
+            deleted.add(record["id"])
+    for entry in entries:
+        entry_id = id_of(entry)
+        if entry_id in deleted:
+            continue
+        yield puts.pop(entry_id) if entry_id in puts else entry
+    yield from puts.values()
+
+
+def iter_vault_entries(vault_file: str, password: str) -> Iterator[Dict[str, Any]]:
+    """
+    Recorre las entradas de una bóveda sin cargarla completa en memoria.
+
+    Para archivos v2 se descifra un fragmento cada vez (aplicando el
+    diario, si existe); los archivos v1 se descifran de una sola vez
+    porque su formato no está fragmentado.
+
+    :param vault_file: Ruta del archivo de la bóveda.
+    :param password: Contraseña maestra.
+    :return: Iterador de diccionarios de entrada.
+    :raises ValueError: Si la contraseña no coincide o el archivo está corrupto.
+    """
+    # Bajo el bloqueo solo se abre el archivo y se lee el diario: el
+    # descriptor abierto conserva esa instantánea aunque otro proceso la
+    # sustituya, así que el recorrido no retiene el bloqueo.
+    # Los fragmentos de una bóveda ``sharded`` se abren también bajo el
+    # bloqueo y se recorren uno tras otro.
+    shards: List[Tuple[BinaryIO, VaultReader]] = []
+    with vault_lock(vault_file):
+        f = open(vault_file, 'rb')
+        try:
+            legacy = f.read(len(VAULT_MAGIC)) != VAULT_MAGIC
+            f.seek(0)
+            if legacy:
+                vault_data, _ = _decrypt_buffer(_read_remaining(f), password)
+            else:
+                reader = VaultReader(f, password)
+                records = _read_journal(vault_file, reader.key, reader.header.get("snapshot"), reader.mac)
+                if reader.layout == "sharded":
+                    for path, snapshot in _shard_files(vault_file, reader.header):
+                        shards.append(_open_shard(path, reader.key, snapshot))
+        except BaseException:
+            f.close()
+            for shard, _ in shards:
+                shard.close()
+            raise
+    with f:
+        try:
+            if legacy:
+                yield from vault_data.get("entries", [])
+            elif reader.layout == "sharded":
+                yield from _apply_journal(itertools.chain.from_iterable(shard for _, shard in shards), records)
+            else:
+                yield from _apply_journal(reader, records)
+        finally:
+            for shard, _ in shards:
+                shard.close()
+
+
+def _read_index(fileobj: BinaryIO, header: Dict[str, Any], key: bytes) -> Dict[str, List[int]]:
+    """Lee y autentica el índice ciego de una bóveda ``records``."""
+    if header.get("index") != INDEX_ALGORITHM:
+        raise ValueError(f"Índice de búsqueda no soportado: {header.get('index')}")
+    fileobj.seek(-2 * _FOOTER.size, io.SEEK_END)
+    (offset,) = _FOOTER.unpack(_read_exact(fileobj, _FOOTER.size))
+    fileobj.seek(offset)
+    (length,) = _FRAME.unpack(_read_exact(fileobj, _FRAME.size))
+    raw = _read_exact(fileobj, length)
+    _verify_tag(_mac_key(key), _read_exact(fileobj, _TAG_SIZE), _header_digest(header), b"index", raw)
+    try:
+        tokens = json.loads(raw.decode('utf-8'))["tokens"]
+    except (KeyError, TypeError, ValueError) as exc:
+        raise ValueError("Índice de búsqueda corrupto") from exc
+    if not isinstance(tokens, dict):
+        raise ValueError("Índice de búsqueda corrupto")
+    return tokens
+
+
+def search_vault(vault_file: str, password: str, query: str) -> List[Dict[str, Any]]:
+    """
+    Busca las entradas que contienen todas las palabras de ``query``.
+
+    Se comparan palabras completas, sin distinguir mayúsculas, del
+    título, del usuario y del dominio de la URL.  Si la bóveda tiene
+    índice ciego (``save_vault(..., layout="records", index=True)``), la
+    búsqueda solo deriva la clave, consulta las fichas HMAC del índice
+    y descifra los registros que coinciden (y el diario, que es
+    pequeño); ni la tabla de contenidos ni el resto de registros se
+    descifran.  Sin índice, se recorren todas las entradas con
+    :func:`iter_vault_entries`.
+
+    El índice no revela las palabras, pero sí cuántas entradas comparten
+    cada una.
+
+    :param vault_file: Ruta de la bóveda.
+    :param password: Contraseña maestra.
+    :param query: Texto a buscar, por ejemplo ``"github"``.
+    :return: Entradas que coinciden, en el orden de la bóveda.
+    :raises ValueError: Si la contraseña no coincide o el índice está
+        corrupto (:class:`VaultIntegrityError` si fue manipulado).
+    """
+    terms = _search_terms(query)
+    if not terms:
+        return []
+    with vault_lock(vault_file), open(vault_file, 'rb') as f:
+        indexed = f.read(len(VAULT_MAGIC)) == VAULT_MAGIC
+        if indexed:
+            f.seek(0)
+            header = read_header(f)
+            indexed = "index" in header
+        if indexed:
+            key, derived, cached = unlock_key(header, password)
+            tokens = _read_index(f, header, key)
+            index_key = _subkey(key, b"index")
+            offsets: Optional[Set[int]] = None
+            for term in terms:
+                found = set(tokens.get(_index_token(index_key, term), ()))
+                offsets = found if offsets is None else offsets & found
+            codec, serializer = header.get("codec", "none"), header.get("serializer", "json")
+            suite, mac = header.get("suite", LEGACY_SUITE), _requires_mac(header)
+            candidates = [_read_record(f, key, offset, codec, serializer, mac, suite) for offset in sorted(offsets or ())]
+            records = _read_journal(vault_file, key, header.get("snapshot"), mac)
+            if not cached:
+                key_cache.put(password, bytes.fromhex(header["salt"]), derived, **normalize_kdf(header.get("kdf")))
+            # El diario puede haber modificado o eliminado candidatos, o
+            # añadido entradas que también coinciden
+            return [entry for entry in _apply_journal(candidates, records) if terms <= _entry_terms(entry)]
+    return [entry for entry in iter_vault_entries(vault_file, password) if terms <= _entry_terms(entry)]
+
+
+def write_vault(
+    vault_file: str,
+    entries: Iterable[Dict[str, Any]],
+    key: bytes,
+    salt: bytes,
+    meta: Optional[Dict[str, Any]] = None,
+    *,
+    layout: Optional[str] = None,
+    codec: Optional[str] = None,
+    level: Optional[int] = None,
+    serializer: Optional[str] = None,
+    kdf: Optional[Dict[str, Any]] = None,
+    suite: Optional[str] = None,
+    index: Optional[bool] = None,
+    wrap_key: Optional[bytes] = None,
+    slots: Optional[List[Dict[str, Any]]] = None,
+    shards: Optional[int] = None,
+    expected_version: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Escribe una bóveda v2 consumiendo ``entries`` de forma incremental.
+
+    El contenido se escribe primero en un archivo temporal junto al
+    destino y se sustituye con :func:`os.replace`, de modo que una
+    interrupción nunca deja la bóveda a medio escribir.  La nueva
+    instantánea recibe un identificador propio, por lo que cualquier
+    diario anterior queda obsoleto y se elimina.
+
+    Si ``entries`` es una :class:`LazyEntries` de este mismo archivo, los
+    registros que no se han descifrado se copian tal cual y la lista se
+    actualiza para apuntar a sus nuevas posiciones.
+
+    :param vault_file: Ruta del archivo de destino.
+    :param entries: Iterable (por ejemplo, un generador) de entradas.
+    :param key: Clave derivada con la que cifrar.
+    :param salt: Sal con la que se derivó ``key``.
+    :param meta: Claves adicionales de la bóveda distintas de ``entries``.
+    :param layout: ``"stream"``, ``"records"`` o ``"sharded"``; por
+        defecto se conserva la del archivo existente (``records`` si
+        ``entries`` es una :class:`LazyEntries`, ``sharded`` si se indica
+        ``shards``).
+    :param codec: Compresor aplicado antes del cifrado (ver :data:`CODECS`);
+        por defecto se conserva el del archivo existente o
+        :data:`DEFAULT_CODEC` si es nuevo.
+    :param level: Nivel de compresión; por defecto el propio del compresor.
+    :param serializer: Codificación de las entradas (``"json"``,
+        ``"compact"`` o ``"binary"``); por defecto se conserva la del
+        archivo existente o :data:`serializers.DEFAULT_SERIALIZER`.
+    :param kdf: Parámetros con los que se derivó ``key`` (ver
+        :data:`DEFAULT_KDF`); por defecto se conservan los del archivo
+        existente, del mismo modo que la sal.
+    :param suite: Suite de cifrado (ver :data:`CIPHER_SUITES`).  A
+        diferencia de los demás campos, no se conserva la del archivo
+        existente: por defecto se usa :data:`DEFAULT_SUITE`, de modo que
+        las bóvedas migran a ella al guardarse.
+    :param index: Si ``True`` se escribe un índice ciego de búsqueda (solo
+        con ``layout="records"``, ver :func:`search_vault`); por defecto se
+        conserva si el archivo existente lo tenía.
+    :param wrap_key: Clave derivada de la contraseña (con ``salt`` y
+        ``kdf``) con la que envolver ``key``, que pasa a ser la clave de
+        datos.  Si se omite y el archivo existente ya envuelve ``key``, se
+        conservan sus ranuras, su sal y su KDF (``salt`` y ``kdf`` se
+        ignoran); si no, ``key`` se usa directamente como en las bóvedas
+        anteriores a las claves de datos.
+    :param slots: Ranuras ya construidas que envuelven ``key`` (por
+        ejemplo, las de los miembros de una bóveda compartida, ver
+        :mod:`sharing`); sustituyen a las del archivo.
+    :param shards: Número de fragmentos de una bóveda ``sharded``; por
+        defecto se conserva el del archivo o :data:`DEFAULT_SHARDS`.
+        Solo se vuelven a cifrar los fragmentos cuyas entradas cambiaron
+        (ver :func:`_write_shards`); cambiar el número los reescribe todos.
+    :param expected_version: Versión (ver :func:`vault_version`) sobre la
+        que se hicieron los cambios.  Si se indica, la instantánea se
+        cifra sin bloquear la bóveda y solo se sustituye, bajo un bloqueo
+        exclusivo, si la versión en disco sigue siendo esa; si no, se
+        descarta y se lanza :class:`VaultConflictError`.  Sin ella, el
+        bloqueo exclusivo se mantiene durante toda la escritura y se
+        sobrescribe lo que haya.
+    :return: La cabecera escrita; su campo ``version`` es la nueva versión.
+    """
+    args = (vault_file, entries, key, salt, meta, layout, codec, level, serializer, kdf, suite, index, wrap_key, slots, shards)
+    if expected_version is None:
+        with vault_lock(vault_file, exclusive=True):
+            snapshot = _write_snapshot(*args, version=vault_version(vault_file) + 1)
+            _commit_snapshot(vault_file, snapshot)
+        return snapshot.header
+    snapshot = _write_snapshot(*args, version=expected_version + 1)
+    try:
+        with vault_lock(vault_file, exclusive=True):
+            _check_version(vault_file, expected_version)
+            _commit_snapshot(vault_file, snapshot)
+    except BaseException:
+        snapshot.discard()
+        raise
+    return snapshot.header
+
+
+class _Snapshot:
+    """
+    Instantánea escrita en un archivo temporal, pendiente de sustituir a la bóveda.
+
+    En una bóveda ``sharded``, ``created`` son los fragmentos escritos para
+    ella y ``obsolete`` los de la instantánea anterior que deja de usar.
+    """
+
+    def __init__(
+        self,
+        tmp_file: str,
+        header: Dict[str, Any],
+        entries: Any,
+        relocations: List[Tuple[_RecordRef, _RecordRef]],
+        created: Optional[List[str]] = None,
+        obsolete: Optional[List[str]] = None,
+    ) -> None:
+        self.tmp_file = tmp_file
+        self.header = header
+        self.entries = entries
+        self.relocations = relocations
+        self.created = created or []
+        self.obsolete = obsolete or []
+
+    def discard(self) -> None:
+        for path in [self.tmp_file, *self.created]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _resolve_layout(vault_file: str, entries: Any, layout: Optional[str]) -> str:
+    """Disposición con la que escribir: explícita, la de ``entries`` o la del archivo."""
+    if layout is not None:
+        return layout
+    if isinstance(entries, LazyEntries):
+        return "records"
+    if os.path.exists(vault_file):
+        try:
+            header = read_file_header(vault_file)
+        except ValueError:
+            header = None
+        if header is not None:
+            return header.get("layout", "stream")
+    return DEFAULT_LAYOUT
+
+
+def _resolve_header_field(vault_file: str, field: str, value: Any, legacy: Any, default: Any) -> Any:
+    """
+    Valor de ``field`` con el que escribir: explícito, el del archivo o ``default``.
+
+    :param legacy: Valor implícito de los archivos v2 que no anotan ``field``.
+    """
+    if value is not None:
+        return value
+    if os.path.exists(vault_file):
+        try:
+            header = read_file_header(vault_file)
+        except ValueError:
+            header = None
+        if header is not None:
+            return header.get(field, legacy)
+    return default
+
+
+def _resolve_slots(
+    vault_file: str,
+    key: bytes,
+    salt: bytes,
+    kdf: Dict[str, Any],
+    wrap_key: Optional[bytes],
+    slots: Optional[List[Dict[str, Any]]] = None,
+) -> Tuple[bytes, Dict[str, Any], Optional[List[Dict[str, Any]]], bool]:
+    """
+    Sal, KDF, ranuras y rotación pendiente con las que escribir una instantánea cifrada con ``key``.
+
+    Las ranuras del archivo existente solo se conservan si envuelven
+    ``key``: así una sesión que no sabe que otro proceso cambió la
+    contraseña no deshace el cambio al guardar.  Si el archivo tiene
+    ranuras para otra clave (por ejemplo, tras rotar la de una bóveda
+    compartida) y no se indican otras, se lanza
+    :class:`VaultConflictError` en lugar de dejar a sus miembros sin
+    acceso.  La marca ``rotate`` (ver :func:`sharing.remove_members`) se
+    conserva mientras la clave de datos siga siendo la misma.
+    """
+    header = None
+    if os.path.exists(vault_file):
+        try:
+            header = read_file_header(vault_file)
+        except ValueError:
+            header = None
+    same_key = header is not None and hmac.compare_digest(str(header.get("kcv", "")), _key_check(key))
+    rotate = same_key and bool(header.get("rotate"))
+    if slots is not None:
+        return salt, kdf, slots, rotate
+    kept = [slot for slot in header.get("slots") or () if slot.get("type") != _PASSWORD_SLOT] if same_key else []
+    if wrap_key is not None:
+        return salt, kdf, kept + [_wrap_key(wrap_key, key)], rotate
+    if header is not None and header.get("slots"):
+        if not same_key:
+            raise VaultConflictError("La bóveda fue reescrita con otra clave por otro proceso")
+        return bytes.fromhex(header["salt"]), normalize_kdf(header.get("kdf")), header["slots"], rotate
+    return salt, kdf, None, False
+
+
+def _write_snapshot(
+    vault_file: str,
+    entries: Iterable[Dict[str, Any]],
+    key: bytes,
+    salt: bytes,
+    meta: Optional[Dict[str, Any]],
+    layout: Optional[str] = None,
+    codec: Optional[str] = None,
+    level: Optional[int] = None,
+    serializer: Optional[str] = None,
+    kdf: Optional[Dict[str, Any]] = None,
+    suite: Optional[str] = None,
+    index: Optional[bool] = None,
+    wrap_key: Optional[bytes] = None,
+    slots: Optional[List[Dict[str, Any]]] = None,
+    shards: Optional[int] = None,
+    version: int = 1,
+) -> _Snapshot:
+    """Escribe la instantánea en un archivo temporal junto a ``vault_file``."""
+    if _storage_backend(vault_file) is not None:
+        raise ValueError("La bóveda usa otro backend de almacenamiento: guárdela con save_vault")
+    if shards is not None and layout is None:
+        layout = "sharded"
+    layout = _resolve_layout(vault_file, entries, layout)
+    codec = _resolve_header_field(vault_file, "codec", codec, "none", DEFAULT_CODEC)
+    serializer = _resolve_header_field(vault_file, "serializer", serializer, "json", DEFAULT_SERIALIZER)
+    kdf = normalize_kdf(_resolve_header_field(vault_file, "kdf", kdf, DEFAULT_KDF, DEFAULT_KDF))
+    salt, kdf, slots, rotate = _resolve_slots(vault_file, key, salt, kdf, wrap_key, slots)
+    suite = DEFAULT_SUITE if suite is None else suite
+    _cipher_suite(suite)
+    if index is None:
+        # El índice se conserva mientras la bóveda siga siendo 'records'
+        index = layout == "records" and bool(_resolve_header_field(vault_file, "index", None, None, None))
+    if shards is not None and (layout != "sharded" or shards < 1):
+        raise ValueError("'shards' requiere la disposición 'sharded' y al menos un fragmento")
+    current = _resolve_header_field(vault_file, "layout", None, "stream", None) == "sharded"
+    previous = _resolve_header_field(vault_file, "shards", None, [], []) if current else []
+    old_files = [path for path, _ in _shard_files(vault_file, {"shards": previous})]
+    shard_list: Optional[List[Dict[str, Any]]] = None
+    created: List[str] = []
+    if layout == "sharded":
+        count = shards or len(previous) or DEFAULT_SHARDS
+        reusable = (
+            len(previous) == count
+            and _resolve_header_field(vault_file, "kcv", None, None, None) == _key_check(key)
+        )
+        shard_list, created = _write_shards(
+            vault_file, entries, key, salt, count, previous if reusable else [],
+            codec=codec, level=level, serializer=serializer, kdf=kdf, version=version, suite=suite,
+        )
+        entries = []
+    kept = {os.path.join(shards_path(vault_file), item["file"]) for item in shard_list or ()}
+    obsolete = [path for path in old_files if path not in kept]
+    directory, name = os.path.split(os.path.abspath(vault_file))
+    fd, tmp_file = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+    relocations: List[Tuple[_RecordRef, _RecordRef]] = []
+    reuse = (
+        layout == "records"
+        and isinstance(entries, LazyEntries)
+        and entries._key == key
+        and entries._codec == codec
+        and entries._serializer == serializer
+        and entries._suite == suite
+        and entries._mac
+    )
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            with VaultWriter(f, key, salt, meta, layout=layout, codec=codec, level=level, serializer=serializer, kdf=kdf, version=version, suite=suite, index=index, slots=slots, rotate=rotate, shards=shard_list) as writer:
+                if reuse:
+                    with entries._lock, entries._open() as source:
+                        for item in list(entries._items):
+                            if isinstance(item, _RecordRef):
+                                relocations.append((item, writer.copy_record(source, item)))
+                            else:
+                                ensure_entry_id(item)
+                                writer.write_entry(item)
+                else:
+                    for entry in entries:
+                        if layout == "records":
+                            ensure_entry_id(entry)
+                        writer.write_entry(entry)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        for path in [tmp_file, *created]:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    return _Snapshot(tmp_file, writer.header, entries, relocations, created, obsolete)
+
+
+def _commit_snapshot(vault_file: str, snapshot: _Snapshot) -> None:
+    """
+    Sustituye atómicamente la bóveda y elimina el diario ya obsoleto.
+
+    El llamador debe tener el bloqueo exclusivo de :func:`vault_lock`.
+
+    Si la instantánea reutilizó registros de una :class:`LazyEntries`
+    que lee de ``vault_file``, sus referencias se actualizan bajo el
+    mismo cerrojo para que ninguna lectura vea posiciones antiguas.
+    """
+    entries = snapshot.entries
+    rebind = (
+        isinstance(entries, LazyEntries)
+        and isinstance(entries._source, str)
+        and os.path.abspath(entries._source) == os.path.abspath(vault_file)
+    )
+    if rebind:
+        with entries._lock:
+            os.replace(snapshot.tmp_file, vault_file)
+            for old, new in snapshot.relocations:
+                old.offset = new.offset
+    else:
+        os.replace(snapshot.tmp_file, vault_file)
+    if os.path.exists(journal_path(vault_file)):
+        os.remove(journal_path(vault_file))
+    # Los lectores abren los fragmentos bajo el bloqueo compartido, así que
+    # ninguno puede estar leyendo los que deja de usar el nuevo manifiesto
+    for path in snapshot.obsolete:
+        if os.path.exists(path):
+            os.remove(path)
+    if snapshot.obsolete and snapshot.header.get("layout") != "sharded":
+        try:
+            os.rmdir(shards_path(vault_file))
+        except OSError:
+            pass
+
+
+def _rewrite_header(vault_file: str, header: Dict[str, Any]) -> bool:
+    """
+    Sustituye la cabecera de una bóveda v2 sin volver a cifrar el cuerpo.
+
+    El llamador debe tener el bloqueo exclusivo de :func:`vault_lock`.
+    La nueva cabecera solo puede diferir en campos que no cubre el MAC.
+    Si cabe en el espacio reservado se escribe en el sitio; si no, una
+    bóveda ``stream`` o el manifiesto de una ``sharded`` (sin posiciones
+    absolutas) se copia tal cual tras una cabecera más grande y se
+    sustituye atómicamente.
+
+    :return: ``False`` si la cabecera no cabe y la bóveda es ``records``:
+        sus registros deben reubicarse con una instantánea completa.
+    """
+    raw = json.dumps(header).encode('utf-8')
+    with open(vault_file, 'r+b') as f:
+        _, _, header_len = _PREAMBLE.unpack(_read_exact(f, _PREAMBLE.size))
+        if len(raw) <= header_len:
+            # Una única escritura de unos cientos de bytes, alineada al inicio
+            os.pwrite(f.fileno(), raw + b" " * (header_len - len(raw)), _PREAMBLE.size)
+            os.fsync(f.fileno())
+            return True
+        if header.get("layout", "stream") == "records":
+            return False
+        f.seek(_PREAMBLE.size + header_len)
+        directory, name = os.path.split(os.path.abspath(vault_file))
+        fd, tmp_file = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                raw = _pad_header(raw)
+                out.write(_PREAMBLE.pack(VAULT_MAGIC, FORMAT_VERSION, len(raw)))
+                out.write(raw)
+                shutil.copyfileobj(f, out, CHUNK_SIZE)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp_file, vault_file)
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+    return True
+
+
+def update_header(
+    vault_file: str,
+    key: bytes,
+    update: Callable[[Dict[str, Any]], Dict[str, Any]],
+    expected_version: Optional[int] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Cambia campos de la cabecera no cubiertos por el MAC e incrementa la versión.
+
+    :param key: Clave de datos con la que debe estar cifrada la bóveda.
+    :param update: Recibe la cabecera actual y devuelve los campos nuevos.
+    :return: La nueva cabecera, o ``None`` si la bóveda no puede
+        actualizarse sin una instantánea completa (v1, sin ``kcv`` o
+        ``records`` sin espacio en la cabecera).
+    :raises VaultConflictError: Si la versión en disco no es
+        ``expected_version`` o la bóveda ya no está cifrada con ``key``.
+    """
+    with vault_lock(vault_file, exclusive=True):
+        if expected_version is not None:
+            _check_version(vault_file, expected_version)
+        header = read_file_header(vault_file)
+        if header is None or "kcv" not in header:
+            return None
+        if not hmac.compare_digest(str(header["kcv"]), _key_check(key)):
+            raise VaultConflictError("La bóveda fue reescrita con otra clave por otro proceso")
+        changes = update(header)
+        if any(field not in _MAC_EXCLUDED for field in changes):
+            raise ValueError("Solo pueden cambiarse campos no autenticados de la cabecera")
+        header = dict(header, **changes, version=int(header.get("version", 0)) + 1)
+        header = {k: v for k, v in header.items() if v is not None}
+        return header if _rewrite_header(vault_file, header) else None
+
+
+def _rewrap(
+    vault_file: str,
+    key: bytes,
+    salt: bytes,
+    kdf: Dict[str, Any],
+    wrap_key: bytes,
+    expected_version: Optional[int] = None,
+) -> Optional[Dict[str, Any]]:
+    """Envuelve la clave de datos ``key`` en una nueva ranura de contraseña reescribiendo solo la cabecera."""
+    def update(header: Dict[str, Any]) -> Dict[str, Any]:
+        kept = [slot for slot in header.get("slots") or () if slot.get("type") != _PASSWORD_SLOT]
+        return {"salt": salt.hex(), "kdf": normalize_kdf(kdf), "slots": kept + [_wrap_key(wrap_key, key)]}
+
+    return update_header(vault_file, key, update, expected_version)
+
+
+def change_password(
+    vault_file: str,
+    password: str,
+    new_password: Optional[str] = None,
+    *,
+    kdf: Optional[Dict[str, Any]] = None,
+    expected_version: Optional[int] = None,
+) -> None:
+    """
+    Cambia la contraseña maestra o los parámetros del KDF de una bóveda.
+
+    La bóveda se cifra con una clave de datos aleatoria que la cabecera
+    guarda envuelta (cifrada y autenticada) con la clave derivada de la
+    contraseña, en el campo ``slots``.  Cambiar la contraseña solo
+    desenvuelve esa clave y la vuelve a envolver con una sal nueva, así
+    que únicamente se reescriben unos cientos de bytes de la cabecera,
+    en el sitio y sin descifrar nada, sea cual sea el tamaño de la
+    bóveda.  El cuerpo y el diario siguen siendo válidos y las sesiones
+    abiertas pueden recargarla con :meth:`VaultSession.reload`.
+
+    Las bóvedas v2 anteriores a este formato se actualizan también en el
+    sitio: su clave actual pasa a ser la clave de datos.  Las v1, o una
+    cabecera que ya no cabe en su espacio reservado, obligan a escribir
+    una instantánea completa.
+
+    La clave de datos no cambia: las copias antiguas del archivo siguen
+    abriéndose con la contraseña anterior.  Para sustituirla hay que
+    guardar la bóveda con una clave nueva (:func:`write_vault` con
+    ``wrap_key``).
+
+    :param vault_file: Ruta de la bóveda.
+    :param password: Contraseña maestra actual.
+    :param new_password: Nueva contraseña; por defecto se conserva.
+    :param kdf: Parámetros del KDF para la nueva ranura (por ejemplo, los
+        de :func:`calibrate`); por defecto se conservan los actuales.
+    :param expected_version: Si se indica y la bóveda cambió desde esa
+        versión se lanza :class:`VaultConflictError`.
+    :raises ValueError: Si la bóveda no existe o la contraseña no coincide.
+    """
+    if not os.path.exists(vault_file):
+        raise ValueError(f"La bóveda no existe: {vault_file}")
+    vault_data: Optional[Dict] = None
+    old_salt: Optional[bytes] = None
+    with vault_lock(vault_file), open(vault_file, 'rb') as f:
+        version = vault_version(vault_file)
+        if expected_version is not None and version != expected_version:
+            raise VaultConflictError(
+                f"La bóveda fue modificada por otro proceso (versión {version}, se esperaba {expected_version})"
+            )
+        if f.read(len(VAULT_MAGIC)) == VAULT_MAGIC:
+            f.seek(0)
+            header = read_header(f)
+            key, _, _ = unlock_key(header, password)
+            params = normalize_kdf(kdf if kdf is not None else header.get("kdf"))
+            old_salt = bytes.fromhex(header["salt"])
+        else:
+            f.seek(0)
+            vault_data, key = _decrypt_buffer(_read_remaining(f), password)
+            params = normalize_kdf(kdf)
+    salt = os.urandom(16)
+    new_password = password if new_password is None else new_password
+    wrap_key = derive_key(new_password, salt, **params)
+    if vault_data is not None or _rewrap(vault_file, key, salt, params, wrap_key, expected_version=version) is None:
+        if vault_data is None:
+            with vault_lock(vault_file), open(vault_file, 'rb') as f:
+                vault_data, _ = read_vault(f, None, key=key, vault_file=vault_file)
+        meta = {k: v for k, v in vault_data.items() if k != "entries"}
+        write_vault(vault_file, vault_data["entries"], key, salt, meta, kdf=params, wrap_key=wrap_key, expected_version=version)
+    if old_salt is not None:
+        key_cache.forget(old_salt)
+    key_cache.put(new_password, salt, wrap_key, **params)
+
+
+def _storage_backend(vault_file: str, backend: Optional[str] = None) -> Any:
+    """
+    Backend de :mod:`storage` que atiende a ``vault_file``, o ``None`` si es el archivo de este módulo.
+
+    Una bóveda existente se abre siempre con el backend que la escribió;
+    pedir otro lanza ``ValueError``.
+    """
+    from .storage import DEFAULT_BACKEND, detect_backend, get_backend  # storage importa este módulo
+
+    chosen = detect_backend(vault_file)
+    if backend is not None and backend != chosen.name:
+        if os.path.exists(vault_file):
+            raise ValueError(f"La bóveda usa el backend '{chosen.name}', no '{backend}'")
+        chosen = get_backend(backend)
+    return None if chosen.name == DEFAULT_BACKEND else chosen
+
+
+def load_or_create_vault(
+    vault_file: str,
+    password: str,
+    *,
+    kdf: Optional[Dict[str, Any]] = None,
+    backend: Optional[str] = None,
+) -> Tuple[Dict, bytes]:
     """
     Carga una bóveda existente o crea una nueva.
 
     Si el archivo de bóveda no existe, se crea una estructura vacía
     ``{"entries": []}``, se cifra y se guarda en disco. En ambos
-    casos se retorna el diccionario de datos y la clave derivada.
+    casos se retorna el diccionario de datos y la clave con la que se
+    cifra la bóveda: la clave de datos aleatoria que la cabecera guarda
+    envuelta con la contraseña (ver :func:`change_password`) o, en
+    bóvedas anteriores a ella, la derivada de la contraseña.
+    El formato (v1 o v2) se detecta a partir de la firma inicial y los
+    archivos v2 se leen fragmento a fragmento, aplicando después las
+    operaciones de su diario (ver :func:`append_journal`), bajo un
+    bloqueo compartido (ver :func:`vault_lock`).  Si la bóveda
+    usa la disposición ``records``, ``vault_data["entries"]`` es una
+    :class:`LazyEntries` que solo descifra las entradas a las que se
+    accede.
 
     :param vault_file: Ruta del archivo de la bóveda.
     :param password: Contraseña maestra para derivar la clave.
+    :param kdf: Parámetros del KDF para una bóveda nueva (por ejemplo,
+        el resultado de :func:`calibrate`).  Las bóvedas existentes se
+        abren con los parámetros anotados en su cabecera; para migrarlas
+        use :meth:`VaultSession.open` con ``kdf``.
+    :param backend: Backend de :mod:`storage` para una bóveda nueva
+        (``"file"`` por defecto o ``"sqlite"``).  El de una existente se
+        detecta a partir de su contenido.
     :return: Una tupla ``(vault_data, key)``.
     """
+    storage = _storage_backend(vault_file, backend)
+    if storage is not None:
+        return storage.load(vault_file, password, kdf=kdf)
     if not os.path.exists(vault_file):
         vault_data: Dict = {"entries": []}
         salt = os.urandom(16)
-        key = derive_key(password, salt)
-        encrypted = encrypt_data(vault_data, key, salt)
-        with open(vault_file, 'wb') as f:
-            f.write(encrypted)
-        return vault_data, key
-    # Leer archivo existente
-    with open(vault_file, 'rb') as f:
-        encrypted = f.read()
-    return decrypt_data(encrypted, password)
+        params = normalize_kdf(kdf)
+        derived = derive_key(password, salt, **params)
+        key = os.urandom(DATA_KEY_SIZE)
+        try:
+            write_vault(vault_file, [], key, salt, kdf=params, wrap_key=derived, expected_version=0)
+        except VaultConflictError:
+            pass  # Otro proceso la creó a la vez: se abre la suya
+        else:
+            key_cache.put(password, salt, derived, **params)
+            return vault_data, key
+    # Leer archivo existente (bajo bloqueo compartido, junto con su diario)
+    with vault_lock(vault_file), open(vault_file, 'rb') as f:
+        if f.read(len(VAULT_MAGIC)) == VAULT_MAGIC:
+            f.seek(0)
+            return read_vault(f, password, vault_file=vault_file)
+        f.seek(0)
+        # El archivo se lee en un único búfer que se descifra en el sitio
+        buffer = _read_remaining(f)
+    return _decrypt_buffer(buffer, password)
+
 
+class VaultLoadResult:
+    """
+    Resultado de abrir una bóveda con :func:`load_vaults_parallel`.
 
-def save_vault(vault_file: str, vault_data: Dict, key: bytes, salt: bytes | None = None) -> None:
+    :ivar path: Ruta de la bóveda.
+    :ivar data: Datos descifrados, o ``None`` si falló.
+    :ivar key: Clave derivada, o ``None`` si falló.
+    :ivar error: Excepción producida al abrirla, o ``None``.
+    :ivar seconds: Tiempo empleado (derivación y descifrado) en segundos.
+    """
+
+    __slots__ = ("path", "data", "key", "error", "seconds")
+
+    def __init__(self, path: str, data: Optional[Dict], key: Optional[bytes], error: Optional[Exception], seconds: float) -> None:
+        self.path = path
+        self.data = data
+        self.key = key
+        self.error = error
+        self.seconds = seconds
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self) -> str:
+        status = "ok" if self.ok else f"error={self.error!r}"
+        return f"VaultLoadResult({self.path!r}, {status}, {self.seconds:.3f}s)"
+
+
+def _load_existing_vault(vault_file: str, password: str) -> VaultLoadResult:
+    """Abre una bóveda ya existente capturando el error en el resultado."""
+    start = time.perf_counter()
+    try:
+        if not os.path.exists(vault_file):
+            raise ValueError(f"La bóveda no existe: {vault_file}")
+        data, key = load_or_create_vault(vault_file, password)
+    except (OSError, ValueError) as exc:
+        return VaultLoadResult(vault_file, None, None, exc, time.perf_counter() - start)
+    return VaultLoadResult(vault_file, data, key, None, time.perf_counter() - start)
+
+
+def load_vaults_parallel(
+    paths_and_passwords: Iterable[Tuple[str, str]],
+    workers: Optional[int] = None,
+) -> Iterator[VaultLoadResult]:
+    """
+    Abre muchas bóvedas repartiendo el trabajo entre varios hilos.
+
+    PBKDF2 (``hashlib.pbkdf2_hmac``) libera el GIL mientras deriva la
+    clave, por lo que un conjunto de hilos escala aproximadamente con el
+    número de núcleos sin el coste de serializar los resultados entre
+    procesos.  A diferencia de :func:`load_or_create_vault`, las bóvedas
+    que no existen no se crean: se informan como error.  Un fallo en una
+    bóveda no interrumpe el resto.
+
+    :param paths_and_passwords: Pares ``(ruta, contraseña maestra)``.
+    :param workers: Número de hilos; por defecto, el número de núcleos.
+    :return: Iterador de :class:`VaultLoadResult` en orden de finalización.
+    """
+    workers = workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_load_existing_vault, path, password) for path, password in paths_and_passwords]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def save_vault(
+    vault_file: str,
+    vault_data: Dict,
+    key: bytes,
+    salt: bytes | None = None,
+    *,
+    layout: Optional[str] = None,
+    codec: Optional[str] = None,
+    level: Optional[int] = None,
+    serializer: Optional[str] = None,
+    kdf: Optional[Dict[str, Any]] = None,
+    suite: Optional[str] = None,
+    index: Optional[bool] = None,
+    shards: Optional[int] = None,
+    expected_version: Optional[int] = None,
+    backend: Optional[str] = None,
+) -> None:
     """
     Cifra y guarda la bóveda en disco.
 
     Este procedimiento sobrescribe completamente el archivo de salida.
     Debe llamarse cada vez que se modifique el contenido de la bóveda
-    para persistir los cambios.
+    para persistir los cambios.  La bóveda se escribe siempre en el
+    formato v2, por lo que los archivos v1 se migran al guardarse.
 
     :param vault_file: Ruta del archivo donde guardar la bóveda.
     :param vault_data: Datos estructurados de la bóveda.
@@ -160,15 +2483,724 @@ def save_vault(vault_file: str, vault_data: Dict, key: bytes, salt: bytes | None
     :param salt: Sal opcional que se antepondrá al archivo. Si no se
         proporciona, se generará una nueva. Utilice la misma sal si
         desea mantener la clave derivada.
+    :param layout: ``"stream"`` (fragmentos), ``"records"`` (un registro
+        cifrado por entrada con descifrado perezoso) o ``"sharded"``
+        (entradas repartidas en varios archivos que se descifran en
+        paralelo y se reescriben solo si cambian).  Por defecto se
+        conserva la disposición del archivo existente.
+    :param codec: Compresor aplicado antes del cifrado (``"none"``,
+        ``"zlib"``, ``"lzma"`` o ``"bz2"``).  Por defecto se conserva el
+        del archivo existente.
+    :param level: Nivel de compresión del compresor elegido.
+    :param serializer: Codificación de las entradas (``"json"``,
+        ``"compact"`` o ``"binary"``).  Por defecto se conserva la del
+        archivo existente.
+    :param kdf: Parámetros del KDF con los que se derivó ``key``.  Igual
+        que con ``salt``, si se omiten se conservan los del archivo; al
+        cambiarlos hay que pasar también la sal de la nueva clave.
+    :param suite: Suite de cifrado; por defecto :data:`DEFAULT_SUITE`, a
+        la que migran al guardarse las bóvedas escritas con otra.
+    :param index: Si ``True`` se añade un índice ciego para
+        :func:`search_vault` (requiere ``layout="records"``).  Por defecto
+        se conserva el del archivo existente.
+    :param shards: Número de fragmentos de una bóveda ``sharded`` (implica
+        ``layout="sharded"``); por defecto se conserva el del archivo.
+    :param expected_version: Versión leída junto con ``vault_data`` (ver
+        :func:`vault_version`).  Si la bóveda cambió desde entonces se
+        lanza :class:`VaultConflictError` en lugar de sobrescribirla.
+    :param backend: Backend de :mod:`storage`; por defecto el de la
+        bóveda existente.  El backend ``sqlite`` solo admite ``salt`` y
+        ``expected_version``.
     """
+    storage = _storage_backend(vault_file, backend)
+    if storage is not None:
+        storage.save(
+            vault_file, vault_data, key, salt, expected_version=expected_version,
+            layout=layout, codec=codec, level=level, serializer=serializer, kdf=kdf, suite=suite, index=index,
+            shards=shards,
+        )
+        return
     # Si no se proporciona una sal explícita intentamos reutilizar la sal
     # existente del archivo para garantizar que la clave suministrada siga
     # siendo válida. Si el archivo no existe se generará una nueva.
-    if salt is None and os.path.exists(vault_file):
-        with open(vault_file, 'rb') as f:
-            existing = f.read(16)
-        if len(existing) == 16:
-            salt = existing
-    encrypted = encrypt_data(vault_data, key, salt)
-    with open(vault_file, 'wb') as f:
-        f.write(encrypted)
+    if salt is None:
+        salt = _read_salt(vault_file) or os.urandom(16)
+    meta = {k: v for k, v in vault_data.items() if k != "entries"}
+    write_vault(
+        vault_file, vault_data.get("entries", []), key, salt, meta,
+        layout=layout, codec=codec, level=level, serializer=serializer, kdf=kdf, suite=suite, index=index,
+        shards=shards, expected_version=expected_version,
+    )
+
+
+def ensure_entry_id(entry: Dict[str, Any]) -> str:
+    """Devuelve el identificador estable de una entrada, asignándolo si falta."""
+    entry_id = entry.get("id")
+    if not entry_id:
+        entry_id = entry["id"] = uuid.uuid4().hex
+    return entry_id
+
+
+class VaultSession:
+    """
+    Sesión abierta sobre una bóveda con escritura diferida.
+
+    La sesión conserva la sal, la clave y los datos descifrados durante
+    toda su vida, por lo que guardar no necesita volver a leer el
+    archivo.  Las modificaciones realizadas con :meth:`add_entry`,
+    :meth:`update_entry` y :meth:`delete_entry` se registran como
+    pendientes (por identificador de entrada) y se agrupan en una única
+    escritura en segundo plano que se ejecuta ``delay`` segundos después
+    de la última modificación.  :meth:`flush` fuerza la escritura y
+    :meth:`close` la garantiza antes de cerrar; además se registra con
+    :mod:`atexit` para no perder cambios al terminar el proceso.
+
+    En modo diario (``journal=True``, por defecto) cada escritura añade
+    solo las entradas modificadas a :func:`journal_path` en lugar de
+    reescribir la bóveda; cuando el diario supera
+    :data:`JOURNAL_MAX_BYTES` o :data:`JOURNAL_MAX_RATIO` veces el
+    tamaño de la instantánea, se compacta en un hilo aparte (ver
+    :meth:`compact`).  Los cambios hechos directamente sobre
+    :attr:`data` y marcados con ``mark_dirty()`` sin entrada obligan a
+    reescribir la instantánea completa.
+
+    :param vault_file: Ruta del archivo de la bóveda.
+    :param vault_data: Datos ya descifrados.
+    :param key: Clave derivada.
+    :param salt: Sal con la que se derivó ``key``.
+    :param delay: Segundos de espera antes de la escritura diferida.
+    :param on_error: Función opcional que recibe la excepción si una
+        escritura en segundo plano falla.
+    :param journal: Si ``True``, los cambios se añaden al diario.
+    :param snapshot_id: Identificador de la instantánea en disco; si
+        es ``None`` la primera escritura será una instantánea completa.
+    :param kdf: Parámetros con los que se derivó ``key``; ``None``
+        conserva los anotados en el archivo.
+    :param version: Versión en disco de la que proceden los datos (ver
+        :func:`vault_version`).  Si se indica, cada escritura comprueba
+        que nadie más haya modificado la bóveda y, si no es así, falla
+        con :class:`VaultConflictError` sin sobrescribir nada.
+        :meth:`open` la rellena automáticamente.
+    """
+
+    def __init__(
+        self,
+        vault_file: str,
+        vault_data: Dict[str, Any],
+        key: bytes,
+        salt: bytes,
+        *,
+        delay: float = 1.0,
+        on_error: Optional[Callable[[Exception], None]] = None,
+        journal: bool = True,
+        snapshot_id: Optional[str] = None,
+        kdf: Optional[Dict[str, Any]] = None,
+        version: Optional[int] = None,
+    ) -> None:
+        self.vault_file = vault_file
+        self.data = vault_data
+        self.data.setdefault("entries", [])
+        self.key = key
+        self.salt = salt
+        self.kdf = kdf
+        self.delay = delay
+        self.on_error = on_error
+        self.journal = journal
+        self.snapshot_id = snapshot_id
+        self.version = version
+        self.dirty: Set[str] = set()
+        # Clave derivada pendiente de envolver la clave de datos (ver :meth:`rekey`)
+        self._wrap_key: Optional[bytes] = None
+        self._pending = False
+        # El diario identifica las entradas por ``id``: si alguna no lo
+        # tenía, la próxima escritura debe ser una instantánea completa.
+        self._needs_snapshot = snapshot_id is None
+        for index, entry_id in enumerate(_entry_ids(self.entries)):
+            if not entry_id:
+                ensure_entry_id(self.entries[index])
+                self._needs_snapshot = True
+        self._journal_appends = 0
+        self._compacting = False
+        self.last_error: Optional[Exception] = None
+        self._lock = threading.RLock()
+        self._timer: Optional[threading.Timer] = None
+        self._closed = False
+        atexit.register(self.close)
+
+    @classmethod
+    def open(
+        cls,
+        vault_file: str,
+        password: str,
+        *,
+        kdf: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> "VaultSession":
+        """
+        Abre (o crea) la bóveda y devuelve una sesión sobre ella.
+
+        :param kdf: Parámetros del KDF deseados (por ejemplo, los de
+            :func:`calibrate`).  Si la bóveda existente usa otros, la
+            clave se vuelve a derivar con una sal nueva y la próxima
+            escritura será una instantánea completa con los nuevos
+            parámetros (ver :meth:`rekey`).
+        """
+        if not os.path.exists(vault_file):
+            load_or_create_vault(vault_file, password, kdf=kdf)
+        elif _storage_backend(vault_file) is not None:
+            raise ValueError("Las sesiones solo admiten bóvedas del backend 'file'")
+        # Datos, cabecera y versión se leen bajo el mismo bloqueo compartido
+        with vault_lock(vault_file):
+            vault_data, key = load_or_create_vault(vault_file, password)
+            salt = _read_salt(vault_file)
+            header = read_file_header(vault_file)
+            version = vault_version(vault_file)
+        if salt is None:
+            raise ValueError("No se pudo leer la sal de la bóveda")
+        kwargs.setdefault("snapshot_id", header.get("snapshot") if header else None)
+        kwargs.setdefault("version", version)
+        current = normalize_kdf(header.get("kdf") if header else None)
+        session = cls(vault_file, vault_data, key, salt, kdf=current, **kwargs)
+        if kdf is not None and normalize_kdf(kdf) != current:
+            session.rekey(password, kdf)
+        return session
+
+    def rekey(self, password: str, kdf: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Envuelve la clave de datos con una clave derivada nueva (con sal nueva).
+
+        La bóveda en disco no cambia hasta la siguiente llamada a
+        :meth:`flush` (o :meth:`close`), que solo reescribe la cabecera
+        con la nueva sal y los nuevos parámetros (ver
+        :func:`change_password`); los cambios pendientes se escriben
+        como de costumbre.
+
+        :param password: Contraseña maestra (la nueva, si se cambia).
+        :param kdf: Parámetros del KDF; por defecto :data:`DEFAULT_KDF`.
+        """
+        params = normalize_kdf(kdf)
+        salt = os.urandom(16)
+        wrap_key = derive_key(password, salt, **params)
+        with self._lock:
+            if self._closed:
+                raise ValueError("La sesión de la bóveda está cerrada")
+            self.salt, self.kdf, self._wrap_key = salt, params, wrap_key
+            self._pending = True
+        key_cache.put(password, salt, wrap_key, **params)
+
+    def reload(self) -> None:
+        """
+        Vuelve a leer la bóveda del disco con la clave de la sesión.
+
+        Sirve para incorporar los cambios de otros procesos sin repetir el
+        KDF, incluido un cambio de contraseña con :func:`change_password`,
+        que conserva la clave de datos.  Solo es posible si no hay cambios
+        pendientes y la bóveda es v2 y sigue cifrada con la clave de la
+        sesión.
+
+        :raises ValueError: Si hay cambios pendientes, si la bóveda es v1
+            o si se reescribió con otra clave.
+        """
+        with self._lock:
+            if self._closed:
+                raise ValueError("La sesión de la bóveda está cerrada")
+            if self._pending:
+                raise ValueError("La sesión tiene cambios sin guardar")
+            with vault_lock(self.vault_file):
+                header = read_file_header(self.vault_file)
+                if header is None:
+                    same_key = False
+                elif "kcv" in header:
+                    same_key = hmac.compare_digest(str(header["kcv"]), _key_check(self.key))
+                else:
+                    same_key = header.get("salt") == self.salt.hex()
+                if not same_key:
+                    raise ValueError("La bóveda cambió de clave; ábrala de nuevo con la contraseña")
+                with open(self.vault_file, 'rb') as f:
+                    vault_data, _ = read_vault(f, None, key=self.key, vault_file=self.vault_file)
+                version = vault_version(self.vault_file)
+            self.data = vault_data
+            self.data.setdefault("entries", [])
+            self.salt = bytes.fromhex(header["salt"])
+            self.kdf = normalize_kdf(header.get("kdf"))
+            self.snapshot_id = header.get("snapshot")
+            if self.version is not None:
+                self.version = version
+            self._needs_snapshot = self.snapshot_id is None
+            for index, entry_id in enumerate(_entry_ids(self.entries)):
+                if not entry_id:
+                    ensure_entry_id(self.entries[index])
+                    self._needs_snapshot = True
+
+    @property
+    def entries(self) -> List[Dict[str, Any]]:
+        """Lista de entradas de la bóveda (o :class:`LazyEntries`)."""
+        return self.data["entries"]
+
+    @property
+    def is_dirty(self) -> bool:
+        """Indica si hay cambios pendientes de escribir."""
+        return self._pending
+
+    def add_entry(self, entry: Dict[str, Any]) -> int:
+        """Añade una entrada y devuelve su índice."""
+        with self._lock:
+            self.entries.append(entry)
+            self._mark(ensure_entry_id(entry))
+            return len(self.entries) - 1
+
+    def update_entry(self, index: int, entry: Dict[str, Any]) -> None:
+        """Reemplaza la entrada ``index`` conservando su identificador."""
+        with self._lock:
+            previous = self.entries[index]
+            if "id" in previous:
+                entry.setdefault("id", previous["id"])
+            self.entries[index] = entry
+            self._mark(ensure_entry_id(entry))
+
+    def delete_entry(self, index: int) -> Dict[str, Any]:
+        """Elimina y devuelve la entrada ``index``."""
+        with self._lock:
+            entry = self.entries.pop(index)
+            self._mark(ensure_entry_id(entry))
+            return entry
+
+    def mark_dirty(self, entry: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Registra una modificación hecha directamente sobre :attr:`data`.
+
+        :param entry: Entrada modificada; si se omite, la sesión solo se
+            marca como pendiente de guardar.
+        """
+        with self._lock:
+            if entry is None:
+                self._needs_snapshot = True
+            self._mark(ensure_entry_id(entry) if entry is not None else None)
+
+    def _mark(self, entry_id: Optional[str]) -> None:
+        if self._closed:
+            raise ValueError("La sesión de la bóveda está cerrada")
+        if entry_id is not None:
+            self.dirty.add(entry_id)
+        self._pending = True
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(self.delay, self._write_behind)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _write_behind(self) -> None:
+        try:
+            self.flush()
+        except Exception as exc:  # pragma: no cover - depende del sistema de archivos
+            self.last_error = exc
+            if self.on_error is not None:
+                self.on_error(exc)
+
+    def _meta(self) -> Dict[str, Any]:
+        return {k: v for k, v in self.data.items() if k != "entries"}
+
+    def flush(self, compact: bool = False) -> bool:
+        """
+        Escribe inmediatamente los cambios pendientes.
+
+        :param compact: Si ``True`` se escribe una instantánea completa
+            aunque el modo diario esté activo (por ejemplo, antes de
+            sincronizar el archivo con la nube).
+        :return: ``True`` si se escribió algo.
+        :raises VaultConflictError: Si otro proceso modificó la bóveda; los
+            cambios siguen pendientes en memoria.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            has_journal = os.path.exists(journal_path(self.vault_file))
+            if not self._pending and not (compact and has_journal):
+                return False
+            snapshot = compact or self._needs_snapshot or not self.journal
+            if self._wrap_key is not None and not snapshot:
+                header = _rewrap(self.vault_file, self.key, self.salt, self.kdf, self._wrap_key, self.version)
+                if header is None:
+                    snapshot = True
+                else:
+                    self._wrap_key = None
+                    if self.version is not None:
+                        self.version += 1
+            if snapshot:
+                header = write_vault(
+                    self.vault_file, self.entries, self.key, self.salt, self._meta(),
+                    kdf=self.kdf, wrap_key=self._wrap_key, expected_version=self.version,
+                )
+                self.snapshot_id = header["snapshot"]
+                if self.version is not None:
+                    self.version = header["version"]
+                self._needs_snapshot = False
+                self._wrap_key = None
+            elif self.dirty:
+                by_id = {
+                    entry_id: self.entries[index]
+                    for index, entry_id in enumerate(_entry_ids(self.entries))
+                    if entry_id in self.dirty
+                }
+                records = [
+                    {"op": "put", "entry": by_id[entry_id]} if entry_id in by_id else {"op": "delete", "id": entry_id}
+                    for entry_id in sorted(self.dirty, key=lambda i: i in by_id)
+                ]
+                journal_size = append_journal(
+                    self.vault_file, self.key, self.snapshot_id, records, expected_version=self.version
+                )
+                if self.version is not None:
+                    self.version += len(records)
+                self._journal_appends += 1
+                snapshot_size = os.path.getsize(self.vault_file)
+                if journal_size > JOURNAL_MAX_BYTES or journal_size > JOURNAL_MAX_RATIO * snapshot_size:
+                    self._compact_in_background()
+            self.dirty.clear()
+            self._pending = False
+            self.last_error = None
+            return True
+
+    def _compact_in_background(self) -> None:
+        if self._compacting:
+            return
+        self._compacting = True
+        thread = threading.Thread(target=self._write_behind_compact, daemon=True)
+        thread.start()
+
+    def _write_behind_compact(self) -> None:
+        try:
+            self.compact()
+        except Exception as exc:  # pragma: no cover - depende del sistema de archivos
+            self.last_error = exc
+            if self.on_error is not None:
+                self.on_error(exc)
+        finally:
+            self._compacting = False
+
+    def compact(self) -> bool:
+        """
+        Integra el diario en una nueva instantánea.
+
+        La instantánea se cifra y escribe sin bloquear la sesión a partir
+        de una copia de las entradas; solo la sustitución atómica final
+        toma el cerrojo.  Si mientras tanto se añadieron registros al
+        diario, la instantánea se descarta y se reintentará en la
+        siguiente escritura.
+
+        :return: ``True`` si la nueva instantánea sustituyó a la anterior.
+        :raises VaultConflictError: Si otro proceso modificó la bóveda.
+        """
+        with self._lock:
+            entries = self.entries.copy()
+            meta = self._meta()
+            appends = self._journal_appends
+            key, salt, kdf, version = self.key, self.salt, self.kdf, self.version
+        current = version if version is not None else vault_version(self.vault_file)
+        snapshot = _write_snapshot(self.vault_file, entries, key, salt, meta, kdf=kdf, version=current + 1)
+        with self._lock:
+            if appends != self._journal_appends or key != self.key or self._closed:
+                snapshot.discard()
+                return False
+            try:
+                with vault_lock(self.vault_file, exclusive=True):
+                    if version is not None:
+                        _check_version(self.vault_file, version)
+                    _commit_snapshot(self.vault_file, snapshot)
+            except BaseException:
+                snapshot.discard()
+                raise
+            self.snapshot_id = snapshot.header["snapshot"]
+            if version is not None:
+                self.version = snapshot.header["version"]
+            return True
+
+    def close(self) -> None:
+        """Guarda los cambios pendientes y cierra la sesión."""
+        with self._lock:
+            if self._closed:
+                return
+            try:
+                self.flush()
+            finally:
+                self._closed = True
+                atexit.unregister(self.close)
+
+    def __enter__(self) -> "VaultSession":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+class VaultSnapshot(Sequence):
+    """
+    Versión inmutable de una bóveda publicada por :class:`Vault`.
+
+    Se recorre como una secuencia de entradas de solo lectura
+    (:class:`types.MappingProxyType`); los valores anidados, como las
+    listas de adjuntos, se comparten con las versiones siguientes y no
+    deben modificarse.  Una instantánea nunca cambia después de
+    publicarse, así que puede leerse desde cualquier hilo sin cerrojos.
+
+    :ivar revision: Número de versión en memoria, que crece con cada lote.
+    :ivar meta: Claves de la bóveda distintas de ``entries`` (solo lectura).
+    """
+
+    __slots__ = ("revision", "meta", "_entries", "_index")
+
+    def __init__(self, entries: Tuple[Dict[str, Any], ...], meta: Dict[str, Any], revision: int) -> None:
+        self.revision = revision
+        # Copia propia: quien pasó ``meta`` (por ejemplo, el lote) puede seguir modificándolo
+        self.meta = MappingProxyType(dict(meta))
+        self._entries = entries
+        self._index: Optional[Dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [MappingProxyType(entry) for entry in self._entries[index]]
+        return MappingProxyType(self._entries[index])
+
+    def __iter__(self) -> Iterator[Mapping[str, Any]]:
+        return map(MappingProxyType, self._entries)
+
+    def _positions(self) -> Dict[str, int]:
+        # Se calcula al primer uso; dos hilos que lo calculen a la vez obtienen el mismo resultado
+        if self._index is None:
+            self._index = {entry["id"]: position for position, entry in enumerate(self._entries)}
+        return self._index
+
+    def get(self, entry_id: str) -> Optional[Mapping[str, Any]]:
+        """Entrada con identificador ``entry_id``, o ``None`` si no existe."""
+        position = self._positions().get(entry_id)
+        return None if position is None else MappingProxyType(self._entries[position])
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Diccionario con la forma de ``vault_data`` para las funciones que lo esperan (por ejemplo, la auditoría)."""
+        return {**self.meta, "entries": list(self)}
+
+
+class VaultBatch:
+    """
+    Lote de modificaciones sobre una :class:`Vault` (ver :meth:`Vault.batch`).
+
+    Las entradas se identifican por su ``id``, que no cambia entre
+    versiones, en lugar de por su posición.  Las entradas que se añaden o
+    sustituyen se copian, de modo que el llamador puede seguir usando
+    sus diccionarios sin afectar a la bóveda.
+
+    :ivar meta: Copia modificable de las claves distintas de ``entries``.
+    """
+
+    def __init__(self, snapshot: VaultSnapshot) -> None:
+        self._entries = list(snapshot._entries)
+        self._index: Optional[Dict[str, int]] = dict(snapshot._positions())
+        self.meta = dict(snapshot.meta)
+        self._meta = snapshot.meta
+        self.changed: Set[str] = set()
+
+    def _positions(self) -> Dict[str, int]:
+        if self._index is None:
+            self._index = {entry["id"]: position for position, entry in enumerate(self._entries)}
+        return self._index
+
+    def _position(self, entry_id: str) -> int:
+        try:
+            return self._positions()[entry_id]
+        except KeyError:
+            raise KeyError(f"No existe ninguna entrada con id {entry_id!r}") from None
+
+    def get(self, entry_id: str) -> Optional[Mapping[str, Any]]:
+        """Entrada ``entry_id`` tal como queda con los cambios del lote."""
+        position = self._positions().get(entry_id)
+        return None if position is None else MappingProxyType(self._entries[position])
+
+    def add(self, entry: Dict[str, Any]) -> str:
+        """Añade una copia de ``entry`` y devuelve su identificador (se asigna si falta)."""
+        entry = dict(entry)
+        entry_id = ensure_entry_id(entry)
+        if entry_id in self._positions():
+            raise ValueError(f"Ya existe una entrada con id {entry_id!r}")
+        self._index[entry_id] = len(self._entries)
+        self._entries.append(entry)
+        self.changed.add(entry_id)
+        return entry_id
+
+    def update(self, entry_id: str, entry: Dict[str, Any]) -> None:
+        """Sustituye la entrada ``entry_id`` por una copia de ``entry`` con el mismo identificador."""
+        position = self._position(entry_id)
+        self._entries[position] = {**entry, "id": entry_id}
+        self.changed.add(entry_id)
+
+    def delete(self, entry_id: str) -> Mapping[str, Any]:
+        """Elimina y devuelve la entrada ``entry_id``."""
+        entry = self._entries.pop(self._position(entry_id))
+        self._index = None
+        self.changed.add(entry_id)
+        return MappingProxyType(entry)
+
+    @property
+    def meta_changed(self) -> bool:
+        """Indica si el lote modificó :attr:`meta`."""
+        return self.meta != self._meta
+
+    def _snapshot(self, revision: int) -> VaultSnapshot:
+        return VaultSnapshot(tuple(self._entries), self.meta, revision)
+
+
+class Vault:
+    """
+    Bóveda compartible entre hilos que publica versiones inmutables.
+
+    Los lectores obtienen con :meth:`snapshot` la versión actual y la
+    recorren sin tomar ningún cerrojo: publicar una versión es una única
+    asignación de atributo, así que cada lector ve una versión completa
+    aunque otro hilo escriba a la vez, y los lectores no compiten entre
+    sí.  Los escritores agrupan sus cambios en un lote (:meth:`batch`)
+    que se aplica sobre una copia de la lista de entradas
+    (copy-on-write: las entradas que no cambian se comparten entre
+    versiones) y se publica de una vez al terminar.  Los lotes se
+    serializan con un cerrojo propio::
+
+        vault = Vault.open("vault.json", password)
+        for entry in vault.snapshot():      # hilo de la interfaz
+            ...
+        with vault.batch() as batch:        # hilo de sincronización
+            batch.add({"title": "GitHub", "password": "..."})
+            batch.delete(entry_id)
+
+    Con una :class:`VaultSession` (ver :meth:`open`) cada lote se
+    registra también en la sesión, que lo escribe en segundo plano, y
+    :meth:`reload` publica lo que otro proceso haya guardado.  Las
+    entradas se cargan completas en memoria, también en la disposición
+    ``records``.
+
+    :param vault_data: Datos iniciales; se ignoran si se indica ``session``.
+    :param session: Sesión que persiste los cambios.
+    """
+
+    def __init__(self, vault_data: Optional[Dict[str, Any]] = None, *, session: Optional[VaultSession] = None) -> None:
+        self.session = session
+        self._write_lock = threading.Lock()
+        self._snapshot = self._publishable(session.data if session is not None else vault_data or {}, 0)
+
+    @classmethod
+    def open(cls, vault_file: str, password: str, **kwargs: Any) -> "Vault":
+        """Abre (o crea) la bóveda con :meth:`VaultSession.open`, que recibe ``kwargs``."""
+        return cls(session=VaultSession.open(vault_file, password, **kwargs))
+
+    @staticmethod
+    def _publishable(vault_data: Dict[str, Any], revision: int) -> VaultSnapshot:
+        """Versión a partir de ``vault_data`` con copias de sus entradas, asignando los identificadores que falten."""
+        entries = vault_data.get("entries", ())
+        if isinstance(entries, LazyEntries):
+            # Se descifra sobre una copia para que la sesión conserve sus registros sin descifrar
+            entries = entries.copy()
+        entries = tuple(dict(entry) for entry in entries)
+        for entry in entries:
+            ensure_entry_id(entry)
+        meta = {k: v for k, v in vault_data.items() if k != "entries"}
+        return VaultSnapshot(entries, meta, revision)
+
+    def snapshot(self) -> VaultSnapshot:
+        """Versión publicada más reciente; no toma ningún cerrojo."""
+        return self._snapshot
+
+    @contextmanager
+    def batch(self) -> Iterator[VaultBatch]:
+        """
+        Aplica un lote de modificaciones y publica la versión resultante.
+
+        Si el bloque lanza una excepción no se publica nada.  Mientras
+        dura el lote, los demás escritores esperan y los lectores siguen
+        viendo la versión anterior.
+        """
+        with self._write_lock:
+            current = self._snapshot
+            batch = VaultBatch(current)
+            yield batch
+            if not batch.changed and not batch.meta_changed:
+                return
+            snapshot = batch._snapshot(current.revision + 1)
+            if self.session is not None:
+                self._record(snapshot, batch)
+            self._snapshot = snapshot
+
+    def _record(self, snapshot: VaultSnapshot, batch: VaultBatch) -> None:
+        """
+        Aplica el lote a los datos de la sesión, entrada a entrada.
+
+        Solo se tocan las entradas de ``batch.changed``, con copias de las
+        publicadas (la sesión no comparte diccionarios con la versión), y
+        el resto conserva su forma: en una :class:`LazyEntries` siguen
+        siendo registros sin descifrar, que el siguiente guardado copia
+        tal cual.
+        """
+        session = self.session
+        published = snapshot._positions()
+        with session._lock:
+            if session._closed:
+                raise ValueError("La sesión de la bóveda está cerrada")
+            entries = session.entries
+            stored = {entry_id: index for index, entry_id in enumerate(_entry_ids(entries))}
+            for index in sorted((stored[i] for i in batch.changed if i in stored and i not in published), reverse=True):
+                del entries[index]
+            stored = {entry_id: index for index, entry_id in enumerate(_entry_ids(entries))}
+            for entry_id in sorted((i for i in batch.changed if i in published), key=published.__getitem__):
+                entry = dict(snapshot._entries[published[entry_id]])
+                if entry_id in stored:
+                    entries[stored[entry_id]] = entry
+                else:
+                    entries.append(entry)
+            if batch.meta_changed:
+                session.data = {**snapshot.meta, "entries": entries}
+                session._needs_snapshot = True
+            # Un único temporizador de escritura diferida para todo el lote
+            session.dirty.update(batch.changed)
+            session._mark(None)
+
+    def add_entry(self, entry: Dict[str, Any]) -> str:
+        """Añade una entrada en un lote propio y devuelve su identificador."""
+        with self.batch() as batch:
+            return batch.add(entry)
+
+    def update_entry(self, entry_id: str, entry: Dict[str, Any]) -> None:
+        """Sustituye la entrada ``entry_id`` en un lote propio."""
+        with self.batch() as batch:
+            batch.update(entry_id, entry)
+
+    def delete_entry(self, entry_id: str) -> Mapping[str, Any]:
+        """Elimina la entrada ``entry_id`` en un lote propio y la devuelve."""
+        with self.batch() as batch:
+            return batch.delete(entry_id)
+
+    def reload(self) -> VaultSnapshot:
+        """
+        Vuelve a leer la bóveda de disco y publica su contenido (ver :meth:`VaultSession.reload`).
+
+        :raises ValueError: Si no hay sesión o tiene cambios pendientes.
+        """
+        if self.session is None:
+            raise ValueError("La bóveda no tiene una sesión asociada")
+        with self._write_lock:
+            self.session.reload()
+            self._snapshot = self._publishable(self.session.data, self._snapshot.revision + 1)
+            return self._snapshot
+
+    def flush(self, compact: bool = False) -> bool:
+        """Escribe los cambios pendientes de la sesión (ver :meth:`VaultSession.flush`)."""
+        return self.session.flush(compact) if self.session is not None else False
+
+    def close(self) -> None:
+        """Cierra la sesión, si la hay, guardando sus cambios pendientes."""
+        if self.session is not None:
+            self.session.close()
+
+    def __enter__(self) -> "Vault":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
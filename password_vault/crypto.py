@@ -0,0 +1,379 @@
+"""
+Primitivas criptográficas de las bóvedas.
+
+Reúne lo que :mod:`core` y los módulos que construyen sobre él
+(:mod:`attachments`, :mod:`auth`, :mod:`sharing`, :mod:`storage`)
+necesitan para cifrar, autenticar y envolver claves, sin depender del
+formato de archivo:
+
+- Suites de cifrado de flujo con acceso aleatorio
+  (:class:`SeekableCipher`, :data:`CIPHER_SUITES`).
+- Subclaves y etiquetas HMAC-SHA256 (:func:`subkey`, :func:`tag`,
+  :func:`verify_tag`, :func:`key_check`), y la comprobación de que una
+  cabecera exige etiquetas (:func:`requires_mac`).
+- Ranuras que guardan la clave de datos envuelta con otra clave
+  (:func:`wrap_key`, :func:`unwrap_key`, :func:`open_data_key`)::
+
+      slot = wrap_key(derive_key(password, salt), data_key)
+      assert unwrap_key(derive_key(password, salt), slot) == data_key
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import os
+from typing import Any, Callable, Dict, Optional
+
+# Tamaño en bytes de cada bloque del flujo (salida de SHA-256)
+BLOCK_SIZE = 32
+# Ventana de los borrados y del descifrado en el sitio
+_WINDOW = 64 * 1024
+_ZEROS = memoryview(bytes(_WINDOW))
+
+# Autenticación de los datos cifrados (ver :func:`mac_key`)
+MAC_ALGORITHM = "hmac-sha256"
+TAG_SIZE = 32
+_KCV_SIZE = 8
+# Campos de la cabecera que no cubre el MAC: dependen de cómo se obtiene
+# la clave, no de los datos, y pueden reescribirse sin volver a cifrar.
+MAC_EXCLUDED = ("salt", "kdf", "kcv", "version", "slots", "rotate")
+
+# Clave de datos envuelta con la clave de la contraseña (ver :func:`core.change_password`)
+DATA_KEY_SIZE = 32
+PASSWORD_SLOT = "password"
+
+
+def wipe(buffer: bytearray) -> None:
+    """
+    Sobrescribe con ceros un búfer mutable que contiene material secreto.
+
+    Se escribe por ventanas de 64 KiB para no reservar otro búfer del
+    mismo tamaño al borrar bóvedas grandes.
+    """
+    with memoryview(buffer) as view:
+        for start in range(0, len(view), _WINDOW):
+            end = min(start + _WINDOW, len(view))
+            view[start:end] = _ZEROS[:end - start]
+
+
+def keystream(key: bytes, nonce: bytes, length: int, counter: int = 0) -> bytearray:
+    """
+    Genera un flujo de bytes pseudoaleatorio para cifrado XOR.
+
+    Cada bloque de 32 bytes es ``SHA-256(key || nonce || contador)`` con
+    el contador codificado en 4 bytes *big-endian*.  El estado del hash
+    tras absorber ``key || nonce`` se calcula una sola vez y se clona
+    para cada bloque, y los resúmenes se escriben directamente en un
+    búfer preasignado, evitando el coste cuadrático de concatenar
+    objetos ``bytes``.
+
+    :param key: Clave derivada.
+    :param nonce: Nonce del archivo.
+    :param length: Número de bytes requeridos.
+    :param counter: Bloque inicial del contador (por defecto 0).
+    :return: Flujo de exactamente ``length`` bytes.
+    """
+    blocks = -(-length // BLOCK_SIZE)
+    stream = bytearray(blocks * BLOCK_SIZE)
+    view = memoryview(stream)
+    new_block = hashlib.sha256(key + nonce).copy
+    pos = 0
+    for block_index in range(counter, counter + blocks):
+        block = new_block()
+        block.update(block_index.to_bytes(4, 'big'))
+        view[pos:pos + BLOCK_SIZE] = block.digest()
+        pos += BLOCK_SIZE
+    view.release()
+    del stream[length:]
+    return stream
+
+
+def xor_bytes(data: bytes, stream: bytes) -> bytes:
+    """
+    Combina mediante XOR dos búferes de la misma longitud.
+
+    La operación se realiza sobre el búfer completo convirtiéndolo en
+    enteros de precisión arbitraria, de modo que el trabajo ocurre en C
+    y no byte a byte en un bucle de Python.
+    """
+    length = len(data)
+    if length != len(stream):
+        raise ValueError("El flujo y los datos deben tener la misma longitud")
+    mixed = int.from_bytes(data, 'little') ^ int.from_bytes(stream, 'little')
+    return mixed.to_bytes(length, 'little')
+
+
+def _sha256_ctr_stream(key: bytes, nonce: bytes, offset: int, length: int) -> bytearray:
+    """Suite ``sha256-ctr``: el flujo de :func:`keystream` desde ``offset``."""
+    block, skip = divmod(offset, BLOCK_SIZE)
+    stream = keystream(key, nonce, skip + length, block)
+    del stream[:skip]
+    return stream
+
+
+# Bytes del flujo SHAKE-256 que produce cada segmento
+_XOF_SEGMENT = 64 * 1024
+
+
+def _shake256_stream(key: bytes, nonce: bytes, offset: int, length: int) -> bytearray:
+    """
+    Suite ``shake256``: el flujo se divide en segmentos de 64 KiB y cada
+    uno es la salida de ``SHAKE-256(key || nonce || segmento)``, con el
+    número de segmento en 8 bytes *big-endian*.
+
+    Cada segmento se genera con una sola llamada en C en lugar de una
+    por bloque de 32 bytes; para acceder a un rango solo se calculan los
+    segmentos que lo contienen.
+    """
+    first, skip = divmod(offset, _XOF_SEGMENT)
+    end = offset + length
+    stream = bytearray()
+    base = hashlib.shake_256(key + nonce)
+    segment = first
+    while segment * _XOF_SEGMENT < end:
+        xof = base.copy()
+        xof.update(segment.to_bytes(8, 'big'))
+        stream += xof.digest(min(_XOF_SEGMENT, end - segment * _XOF_SEGMENT))
+        segment += 1
+    del stream[:skip]
+    return stream
+
+
+# Suites de cifrado: generan ``length`` bytes del flujo desde ``offset``.
+# La de cada bóveda v2 se anota en su cabecera (campo ``suite``); las
+# cabeceras sin ese campo usan :data:`LEGACY_SUITE`.
+CIPHER_SUITES: Dict[str, Callable[[bytes, bytes, int, int], bytearray]] = {
+    "sha256-ctr": _sha256_ctr_stream,
+    "shake256": _shake256_stream,
+}
+LEGACY_SUITE = "sha256-ctr"
+DEFAULT_SUITE = "shake256"
+
+
+def cipher_suite(name: str) -> Callable[[bytes, bytes, int, int], bytearray]:
+    """Devuelve el generador de flujo de la suite ``name`` o lanza ``ValueError``."""
+    try:
+        return CIPHER_SUITES[name]
+    except (KeyError, TypeError):
+        raise ValueError(f"Suite de cifrado no soportada: {name}") from None
+
+
+class SeekableCipher:
+    """
+    Cifrado de flujo con acceso aleatorio a cualquier rango de bytes.
+
+    Todas las suites de :data:`CIPHER_SUITES` permiten calcular el flujo
+    a partir de cualquier posición: ``sha256-ctr`` es un modo contador en
+    el que el byte ``n`` depende solo del bloque ``n // 32``, y
+    ``shake256`` genera por separado cada segmento de 64 KiB.  Así, un
+    rango puede cifrarse o descifrarse sin generar el flujo desde el
+    principio.  Si se indica ``source`` (``bytes`` o un archivo binario
+    con ``seek``), :meth:`decrypt_range` lee de él el ciphertext, situado
+    a partir de ``base``::
+
+        cipher = SeekableCipher(key, nonce, f, base=32)
+        fragment = cipher.decrypt_range(1_000_000, 64)
+
+    :param key: Clave derivada.
+    :param nonce: Nonce del flujo.
+    :param source: Ciphertext completo o archivo que lo contiene.
+    :param base: Posición del primer byte del ciphertext en ``source``.
+    :param suite: Nombre de la suite de cifrado (ver :data:`CIPHER_SUITES`).
+    """
+
+    def __init__(self, key: bytes, nonce: bytes, source: Any = None, base: int = 0, suite: str = LEGACY_SUITE) -> None:
+        self.key = key
+        self.nonce = nonce
+        self.suite = suite
+        self._stream = cipher_suite(suite)
+        self._source = source
+        self._base = base
+
+    def keystream(self, offset: int, length: int) -> bytearray:
+        """Devuelve los ``length`` bytes del flujo a partir de la posición ``offset``."""
+        if offset < 0 or length < 0:
+            raise ValueError("La posición y la longitud no pueden ser negativas")
+        return self._stream(self.key, self.nonce, offset, length)
+
+    def encrypt_range(self, offset: int, plaintext: bytes) -> bytes:
+        """Cifra ``plaintext`` como si ocupara la posición ``offset`` del flujo."""
+        return xor_bytes(plaintext, self.keystream(offset, len(plaintext)))
+
+    def decrypt_range(self, offset: int, length: int) -> bytes:
+        """
+        Descifra ``length`` bytes de ``source`` a partir de la posición ``offset``.
+
+        :raises ValueError: Si no hay ``source`` o el rango excede sus datos.
+        """
+        if self._source is None:
+            raise ValueError("El cifrador no tiene datos de origen")
+        if isinstance(self._source, (bytes, bytearray, memoryview)):
+            ciphertext = bytes(self._source[self._base + offset:self._base + offset + length])
+            if len(ciphertext) != length:
+                raise ValueError("Archivo de bóveda truncado")
+        else:
+            self._source.seek(self._base + offset)
+            ciphertext = self._source.read(length)
+            if len(ciphertext) != length:
+                raise ValueError("Archivo de bóveda truncado o corrupto")
+        return self.decrypt(offset, ciphertext)
+
+    def decrypt(self, offset: int, ciphertext: bytes) -> bytes:
+        """Descifra ``ciphertext`` que ocupa la posición ``offset`` del flujo."""
+        return xor_bytes(ciphertext, self.keystream(offset, len(ciphertext)))
+
+    def decrypt_into(self, offset: int, buffer: Any) -> None:
+        """
+        Descifra (o cifra) en el sitio un ``bytearray`` o ``memoryview`` escribible.
+
+        El búfer se procesa por ventanas de 64 KiB, de modo que la memoria
+        adicional no depende de su tamaño, y el flujo de cada ventana se
+        sobrescribe con ceros tras usarlo.
+        """
+        with memoryview(buffer) as view:
+            for start in range(0, len(view), _WINDOW):
+                with view[start:start + _WINDOW] as part:
+                    stream = self.keystream(offset + start, len(part))
+                    part[:] = xor_bytes(part, stream)
+                    wipe(stream)
+
+
+def subkey(key: bytes, label: bytes) -> bytes:
+    """Deriva de ``key`` una subclave independiente para el propósito ``label``."""
+    return hmac.new(key, b"vaultkey/" + label, hashlib.sha256).digest()
+
+
+def key_check(key: bytes) -> str:
+    """
+    Valor de comprobación de la clave (KCV) que se guarda en la cabecera.
+
+    Permite rechazar una contraseña incorrecta justo después del KDF sin
+    descifrar nada; al ser un HMAC truncado no revela la clave.
+    """
+    return subkey(key, b"kcv")[:_KCV_SIZE].hex()
+
+
+def mac_key(key: bytes) -> bytes:
+    """Subclave con la que se autentican marcos, registros y diario."""
+    return subkey(key, b"mac")
+
+
+def tag(key: bytes, *parts: bytes) -> bytes:
+    """HMAC-SHA256 de la concatenación de ``parts``."""
+    mac = hmac.new(key, digestmod=hashlib.sha256)
+    for part in parts:
+        mac.update(part)
+    return mac.digest()
+
+
+class VaultIntegrityError(ValueError):
+    """La etiqueta de autenticación no coincide: los datos fueron manipulados o están dañados."""
+
+
+def verify_tag(key: bytes, expected: bytes, *parts: bytes) -> None:
+    """Comprueba una etiqueta en tiempo constante; lanza :class:`VaultIntegrityError` si no coincide."""
+    if not hmac.compare_digest(expected, tag(key, *parts)):
+        raise VaultIntegrityError("Datos de la bóveda manipulados o corruptos")
+
+
+def requires_mac(header: Dict[str, Any]) -> bool:
+    """
+    Indica si los marcos, registros y diario de una bóveda v2 llevan etiqueta.
+
+    Solo las bóvedas v2 anteriores a las etiquetas pueden carecer de
+    ellas.  El campo ``mac`` viaja en claro, así que una cabecera con
+    ``kcv`` o ``slots`` (que ya se escribían con etiquetas) sin ``mac``
+    se considera manipulada: si no, bastaría con borrarlo para
+    desactivar la autenticación.
+
+    :raises VaultIntegrityError: Si falta ``mac`` en una cabecera que lo requiere.
+    :raises ValueError: Si el algoritmo no está soportado.
+    """
+    mac = header.get("mac")
+    if mac is None:
+        if "kcv" in header or "slots" in header:
+            raise VaultIntegrityError("Datos de la bóveda manipulados o corruptos")
+        return False
+    if mac != MAC_ALGORITHM:
+        raise ValueError(f"Algoritmo de autenticación no soportado: {mac}")
+    return True
+
+
+def header_digest(header: Dict[str, Any]) -> bytes:
+    """Resumen de los campos de la cabecera cubiertos por el MAC (todos salvo :data:`MAC_EXCLUDED`)."""
+    covered = {k: v for k, v in header.items() if k not in MAC_EXCLUDED}
+    return hashlib.sha256(json.dumps(covered, sort_keys=True, separators=(",", ":")).encode('utf-8')).digest()
+
+
+def wrap_key(wrapping_key: bytes, data_key: bytes) -> Dict[str, Any]:
+    """
+    Cifra y autentica ``data_key`` con ``wrapping_key``.
+
+    :return: Ranura de tipo :data:`PASSWORD_SLOT`; quien la guarde con
+        otro propósito cambia su ``type`` y añade sus campos.
+    """
+    nonce = os.urandom(16)
+    wrapped = SeekableCipher(wrapping_key, nonce, suite=DEFAULT_SUITE).encrypt_range(0, data_key)
+    return {
+        "type": PASSWORD_SLOT,
+        "suite": DEFAULT_SUITE,
+        "nonce": nonce.hex(),
+        "key": wrapped.hex(),
+        "tag": tag(subkey(wrapping_key, b"slot"), nonce, wrapped).hex(),
+    }
+
+
+def unwrap_key(wrapping_key: bytes, slot: Dict[str, Any]) -> bytes:
+    """
+    Recupera la clave de datos de ``slot``.
+
+    La etiqueta se comprueba antes de descifrar, así que una contraseña
+    incorrecta se rechaza sin generar ningún flujo.
+
+    :raises ValueError: Si la ranura está corrupta o ``wrapping_key`` no la abre.
+    """
+    try:
+        nonce, wrapped, expected = (bytes.fromhex(slot[field]) for field in ("nonce", "key", "tag"))
+        suite = slot.get("suite", LEGACY_SUITE)
+    except (KeyError, TypeError, ValueError) as exc:
+        raise ValueError("Cabecera de la bóveda corrupta") from exc
+    if not hmac.compare_digest(expected, tag(subkey(wrapping_key, b"slot"), nonce, wrapped)):
+        raise ValueError("Contraseña incorrecta o datos corruptos")
+    return SeekableCipher(wrapping_key, nonce, suite=suite).decrypt(0, wrapped)
+
+
+def password_slot(header: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Ranura de la contraseña maestra, o ``None`` si la bóveda no usa clave de datos.
+
+    :raises ValueError: Si ``slots`` está corrupto o la bóveda es
+        compartida (solo tiene ranuras de miembros, ver :mod:`sharing`).
+    """
+    slots = header.get("slots")
+    if slots is None:
+        return None
+    if not isinstance(slots, list):
+        raise ValueError("Cabecera de la bóveda corrupta")
+    for slot in slots:
+        if isinstance(slot, dict) and slot.get("type") == PASSWORD_SLOT:
+            return slot
+    raise ValueError("La bóveda es compartida: ábrala con las credenciales de un miembro (ver sharing)")
+
+
+def open_data_key(header: Dict[str, Any], derived: bytes) -> bytes:
+    """
+    Clave de datos de una cabecera v2 a partir de la clave de la contraseña.
+
+    Si la cabecera tiene ``slots``, desenvuelve con ``derived`` la ranura
+    de la contraseña; si no, ambas claves coinciden.  Después comprueba
+    el ``kcv``, si lo hay.
+
+    :raises ValueError: Si ``derived`` no abre la ranura o no coincide con el KCV.
+    """
+    slot = password_slot(header)
+    key = derived if slot is None else unwrap_key(derived, slot)
+    if "kcv" in header and not hmac.compare_digest(str(header["kcv"]), key_check(key)):
+        raise ValueError("Contraseña incorrecta o datos corruptos")
+    return key
@@ -0,0 +1,348 @@
+"""
+Migración masiva de bóvedas a un formato o KDF nuevos.
+
+Cuando cambian el formato en disco, la suite de cifrado o los
+parámetros del KDF, las bóvedas existentes solo se actualizan al
+volver a guardarse.  Esta herramienta las migra en bloque repartiendo
+el trabajo entre varios procesos::
+
+    python -m password_vault.migrate vaults/ --credentials claves.json
+    python -m password_vault.migrate lista.txt --password-env VAULT_PASSWORD \
+        --layout records --kdf-iterations 600000 --workers 8
+
+El origen es un directorio (se recorre entero, ignorando archivos
+ocultos, diarios, bloqueos y los directorios de adjuntos y fragmentos)
+o un manifiesto de texto con una ruta por línea, relativa al propio
+manifiesto.  Las contraseñas salen de un JSON ``{ruta: contraseña}``
+(la ruta puede ser la indicada, relativa al origen o solo el nombre del
+archivo) o, para todas las demás, de una variable de entorno.
+
+Cada bóveda se migra con :func:`migrate_vault`: se abre con su
+contraseña, se guarda con las opciones indicadas (a través de
+:func:`core.save_vault`, que escribe en un temporal y sustituye el
+archivo de forma atómica, y falla si otro proceso la modificó entretanto)
+y, si se pide otro KDF o aún no tiene clave de datos, se reescribe su
+cabecera con :func:`core.change_password`.  Las bóvedas de otro backend
+de :mod:`storage` (``sqlite``) se guardan con su propio backend, sin las
+opciones de formato ni el cambio de KDF, que solo describen el archivo
+de :mod:`core`; los archivos ``-wal`` y ``-shm`` de SQLite no se toman
+por bóvedas.
+
+El progreso se anota en un punto de control (JSON, una línea por
+bóveda terminada, sincronizada en disco).  Al repetir la orden con el
+mismo punto de control se omiten las bóvedas ya migradas y se
+reintentan las que fallaron.  Una bóveda migrada pero no anotada antes
+de la interrupción se migra otra vez, lo que no tiene efecto sobre su
+contenido.  La orden imprime el tiempo de cada bóveda y, al final, un
+resumen con el rendimiento total.
+"""
+
+from __future__ import annotations
+
+import argparse
+import fnmatch
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .attachments import CHUNKS_SUFFIX
+from .core import (
+    CIPHER_SUITES,
+    CODECS,
+    JOURNAL_SUFFIX,
+    LAYOUTS,
+    LOCK_SUFFIX,
+    SHARDS_SUFFIX,
+    change_password,
+    load_or_create_vault,
+    read_file_header,
+    save_vault,
+    vault_version,
+)
+from .serializers import SERIALIZERS
+from .storage import DEFAULT_BACKEND, WAL_SUFFIXES, detect_backend
+
+CHECKPOINT_SUFFIX = ".checkpoint.jsonl"
+_COMPANION_SUFFIXES = (JOURNAL_SUFFIX, LOCK_SUFFIX, CHECKPOINT_SUFFIX, ".tmp") + WAL_SUFFIXES
+
+
+class MigrationResult:
+    """
+    Resultado de migrar una bóveda.
+
+    :ivar path: Ruta de la bóveda.
+    :ivar seconds: Tiempo empleado en segundos.
+    :ivar size: Tamaño del archivo antes de migrarlo, en bytes.
+    :ivar error: Descripción del error, o ``None`` si se migró.
+    """
+
+    __slots__ = ("path", "seconds", "size", "error")
+
+    def __init__(self, path: str, seconds: float, size: int, error: Optional[str] = None) -> None:
+        self.path = path
+        self.seconds = seconds
+        self.size = size
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self) -> str:
+        status = "ok" if self.ok else f"error={self.error!r}"
+        return f"MigrationResult({self.path!r}, {status}, {self.seconds:.3f}s)"
+
+
+def discover_vaults(source: str, pattern: str = "*") -> List[str]:
+    """
+    Bóvedas que migrar desde un directorio o un manifiesto.
+
+    :param source: Directorio (se recorre de forma recursiva) o archivo de
+        texto con una ruta por línea; las líneas vacías y las que empiezan
+        por ``#`` se ignoran.
+    :param pattern: Patrón ``fnmatch`` que deben cumplir los nombres de
+        archivo de un directorio.
+    :return: Rutas ordenadas y sin repetir.
+    """
+    if os.path.isdir(source):
+        found = []
+        for root, dirs, files in os.walk(source):
+            dirs[:] = [d for d in dirs if not d.startswith(".") and not d.endswith((CHUNKS_SUFFIX, SHARDS_SUFFIX))]
+            for name in files:
+                if name.startswith(".") or name.endswith(_COMPANION_SUFFIXES) or not fnmatch.fnmatch(name, pattern):
+                    continue
+                found.append(os.path.join(root, name))
+        return sorted(found)
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, 'r', encoding='utf-8') as f:
+        lines = [line.strip() for line in f]
+    paths = [os.path.join(base, line) for line in lines if line and not line.startswith("#")]
+    return sorted(dict.fromkeys(paths))
+
+
+def load_credentials(
+    paths: Iterable[str],
+    source: str,
+    credentials_file: Optional[str] = None,
+    password_env: Optional[str] = None,
+) -> Dict[str, Optional[str]]:
+    """
+    Contraseña de cada bóveda de ``paths``.
+
+    Cada ruta se busca en el JSON ``credentials_file`` tal cual, relativa
+    al directorio de ``source`` y por su nombre de archivo; si no aparece
+    se usa la variable de entorno ``password_env``.
+
+    :return: Diccionario ``{ruta: contraseña o None}``.
+    :raises ValueError: Si el JSON no es un objeto de cadenas o la
+        variable de entorno no existe.
+    """
+    table: Dict[str, str] = {}
+    if credentials_file is not None:
+        with open(credentials_file, 'r', encoding='utf-8') as f:
+            table = json.load(f)
+        if not isinstance(table, dict) or not all(isinstance(v, str) for v in table.values()):
+            raise ValueError("El archivo de credenciales debe ser un objeto JSON {ruta: contraseña}")
+    default = None
+    if password_env is not None:
+        default = os.environ.get(password_env)
+        if default is None:
+            raise ValueError(f"La variable de entorno {password_env} no está definida")
+    base = source if os.path.isdir(source) else os.path.dirname(os.path.abspath(source))
+    result: Dict[str, Optional[str]] = {}
+    for path in paths:
+        candidates = (path, os.path.relpath(path, base), os.path.basename(path))
+        result[path] = next((table[c] for c in candidates if c in table), default)
+    return result
+
+
+def migrate_vault(path: str, password: str, kdf: Optional[Dict[str, Any]] = None, **options: Any) -> None:
+    """
+    Migra una bóveda al formato actual con las opciones de :func:`core.save_vault`.
+
+    Tras guardarla, su cabecera se reescribe con :func:`core.change_password`
+    si se indica ``kdf`` o si la bóveda aún no guarda una clave de datos
+    envuelta (v1 y v2 antiguas), sin volver a cifrar el cuerpo.
+
+    Una bóveda de otro backend (ver :func:`storage.detect_backend`) se
+    abre y se guarda con él; ``kdf`` y ``options`` se ignoran porque se
+    refieren al archivo cifrado de :mod:`core`.
+
+    :raises ValueError: Si la bóveda no existe, la contraseña no coincide o
+        otro proceso la modificó durante la migración.
+    """
+    if not os.path.isfile(path):
+        raise ValueError(f"La bóveda no existe: {path}")
+    storage = detect_backend(path)
+    version = vault_version(path)
+    data, key = load_or_create_vault(path, password)
+    if storage.name != DEFAULT_BACKEND:
+        storage.save(path, data, key, expected_version=version)
+        return
+    save_vault(path, data, key, expected_version=version, **options)
+    header = read_file_header(path) or {}
+    if kdf is not None or "slots" not in header:
+        change_password(path, password, kdf=kdf, expected_version=header.get("version"))
+
+
+def _migrate_one(path: str, password: Optional[str], kdf: Optional[Dict[str, Any]], options: Dict[str, Any]) -> MigrationResult:
+    """Migra ``path`` capturando el error en el resultado (se ejecuta en los procesos)."""
+    start = time.perf_counter()
+    size = os.path.getsize(path) if os.path.isfile(path) else 0
+    try:
+        if password is None:
+            raise ValueError("No hay contraseña para esta bóveda")
+        migrate_vault(path, password, kdf, **options)
+    except (OSError, ValueError) as exc:
+        return MigrationResult(path, time.perf_counter() - start, size, f"{type(exc).__name__}: {exc}")
+    return MigrationResult(path, time.perf_counter() - start, size)
+
+
+def _read_checkpoint(checkpoint: str, settings: Dict[str, Any]) -> Set[str]:
+    """
+    Bóvedas ya migradas según ``checkpoint``.
+
+    La primera línea anota las opciones de la migración; reanudar con
+    otras lanzaría ``ValueError`` en lugar de mezclar formatos.  Una
+    última línea incompleta (interrupción a mitad de escritura) se ignora.
+    """
+    done: Set[str] = set()
+    if not os.path.exists(checkpoint):
+        return done
+    with open(checkpoint, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if number == 0:
+                if record.get("settings") != settings:
+                    raise ValueError(f"El punto de control {checkpoint} corresponde a otra migración")
+            elif record.get("status") == "ok":
+                done.add(record["path"])
+    return done
+
+
+def _append_checkpoint(f: Any, record: Dict[str, Any]) -> None:
+    f.write(json.dumps(record) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def run_migration(
+    credentials: Dict[str, Optional[str]],
+    checkpoint: str,
+    *,
+    workers: Optional[int] = None,
+    kdf: Optional[Dict[str, Any]] = None,
+    **options: Any,
+) -> Iterator[Tuple[MigrationResult, bool]]:
+    """
+    Migra las bóvedas de ``credentials`` en paralelo, anotando el progreso.
+
+    Las bóvedas se reparten entre ``workers`` procesos (por defecto, uno
+    por núcleo): abrir una bóveda ocupa la CPU en el KDF, el descifrado y
+    la decodificación, que en hilos competirían por el GIL.  Con un solo
+    proceso se migran aquí mismo.  Cada resultado se anota en
+    ``checkpoint`` en cuanto llega.
+
+    :param credentials: ``{ruta: contraseña}`` (ver :func:`load_credentials`).
+    :param checkpoint: Archivo de punto de control.
+    :param kdf: Parámetros del KDF de destino.
+    :param options: Opciones de :func:`core.save_vault` (``layout``,
+        ``codec``, ``serializer``, ``suite``, ``shards``...).
+    :return: Iterador de ``(resultado, omitida)`` en orden de
+        finalización; las omitidas ya constaban como migradas.
+    """
+    settings = {"kdf": kdf, "options": options}
+    done = _read_checkpoint(checkpoint, settings)
+    pending = [(path, password) for path, password in credentials.items() if path not in done]
+    for path in credentials:
+        if path in done:
+            yield MigrationResult(path, 0.0, 0), True
+    workers = min(len(pending), workers or os.cpu_count() or 1)
+    new_file = not os.path.exists(checkpoint)
+    with open(checkpoint, 'a', encoding='utf-8') as log:
+        if new_file:
+            _append_checkpoint(log, {"settings": settings})
+        if workers <= 1:
+            results: Iterable[MigrationResult] = (_migrate_one(path, password, kdf, options) for path, password in pending)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            futures = [pool.submit(_migrate_one, path, password, kdf, options) for path, password in pending]
+            results = (future.result() for future in as_completed(futures))
+        try:
+            for result in results:
+                _append_checkpoint(log, {
+                    "path": result.path,
+                    "status": "ok" if result.ok else "error",
+                    "seconds": round(result.seconds, 6),
+                    "error": result.error,
+                })
+                yield result, False
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+
+def main(argv: List[str] | None = None) -> int:
+    """Punto de entrada: migra, imprime el progreso y devuelve 1 si alguna bóveda falló."""
+    parser = argparse.ArgumentParser(description="Migración masiva de bóvedas")
+    parser.add_argument("source", help="Directorio de bóvedas o manifiesto con una ruta por línea")
+    parser.add_argument("--credentials", help="JSON {ruta: contraseña}")
+    parser.add_argument("--password-env", help="Variable de entorno con la contraseña del resto de bóvedas")
+    parser.add_argument("--checkpoint", help=f"Punto de control (por defecto <origen>{CHECKPOINT_SUFFIX})")
+    parser.add_argument("--pattern", default="*", help="Patrón de nombres en un directorio (por defecto *)")
+    parser.add_argument("--workers", type=int, help="Procesos simultáneos (por defecto, uno por núcleo)")
+    parser.add_argument("--layout", choices=LAYOUTS, help="Disposición de destino")
+    parser.add_argument("--codec", choices=sorted(CODECS), help="Compresor de destino")
+    parser.add_argument("--serializer", choices=sorted(SERIALIZERS), help="Serializador de destino")
+    parser.add_argument("--suite", choices=sorted(CIPHER_SUITES), help="Suite de cifrado de destino")
+    parser.add_argument("--shards", type=int, help="Fragmentos de destino (disposición sharded)")
+    parser.add_argument("--kdf-iterations", type=int, help="Iteraciones de PBKDF2 de destino")
+    args = parser.parse_args(argv)
+    if args.credentials is None and args.password_env is None:
+        parser.error("indique --credentials o --password-env")
+
+    checkpoint = args.checkpoint or args.source.rstrip(os.sep) + CHECKPOINT_SUFFIX
+    kdf = None if args.kdf_iterations is None else {"iterations": args.kdf_iterations}
+    options = {
+        name: getattr(args, name)
+        for name in ("layout", "codec", "serializer", "suite", "shards")
+        if getattr(args, name) is not None
+    }
+
+    start = time.perf_counter()
+    migrated = failed = skipped = 0
+    volume = 0
+    try:
+        paths = discover_vaults(args.source, args.pattern)
+        credentials = load_credentials(paths, args.source, args.credentials, args.password_env)
+        for result, was_done in run_migration(credentials, checkpoint, workers=args.workers, kdf=kdf, **options):
+            if was_done:
+                skipped += 1
+            elif result.ok:
+                migrated += 1
+                volume += result.size
+                print(f"{result.seconds:>9.3f}s  ok     {result.path}", flush=True)
+            else:
+                failed += 1
+                print(f"{result.seconds:>9.3f}s  error  {result.path}: {result.error}", flush=True)
+    except (OSError, ValueError) as exc:
+        print(f"Error: {exc}")
+        return 2
+    elapsed = time.perf_counter() - start
+    rate = migrated / elapsed if elapsed else 0.0
+    print(
+        f"{migrated} migradas, {failed} con error, {skipped} ya migradas en {elapsed:.2f} s "
+        f"({rate:.1f} bóvedas/s, {volume / 1_000_000 / elapsed if elapsed else 0.0:.2f} MB/s)"
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":  # pragma: no cover - ejecución directa
+    sys.exit(main())
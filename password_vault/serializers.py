@@ -0,0 +1,224 @@
+"""
+Serialización de las entradas de la bóveda.
+
+Las bóvedas v2 anotan en su cabecera (campo ``serializer``) cómo se
+convirtieron las entradas en bytes antes de comprimirlas y cifrarlas:
+
+- ``json``: ``json.dumps`` con los separadores por defecto.  Es el
+  formato de los archivos escritos antes de existir este campo.
+- ``compact``: JSON sin espacios; más pequeño e igual de rápido.
+- ``binary``: registros con prefijo de longitud construidos con
+  :mod:`struct`.  Los nombres de campo habituales se sustituyen por un
+  código de un byte, de modo que no se repiten en cada entrada, y cada
+  entrada puede decodificarse por separado sin leer las demás.
+
+Todos los serializadores ofrecen la misma interfaz: :meth:`dumps` y
+:meth:`loads` para una entrada, y :meth:`pack` e :meth:`unpack` para
+agrupar varias entradas codificadas en un fragmento.
+"""
+
+from __future__ import annotations
+
+import json
+import struct
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, List
+
+_U16 = struct.Struct(">H")
+_U32 = struct.Struct(">I")
+_I64 = struct.Struct(">q")
+_F64 = struct.Struct(">d")
+
+# Nombres de campo internados: su código es la posición en la tupla.
+# Solo se pueden añadir nombres al final para no alterar los códigos.
+FIELD_NAMES = (
+    "id", "title", "username", "password", "url", "notes",
+    "category", "tags", "created", "modified", "strength", "score",
+)
+_FIELD_CODES = {name: code for code, name in enumerate(FIELD_NAMES)}
+_INLINE_NAME = 0xFF
+
+
+class Serializer(ABC):
+    """Convierte entradas en bytes y viceversa."""
+
+    name = ""
+
+    @abstractmethod
+    def dumps(self, entry: Dict[str, Any]) -> bytes:
+        """Codifica una entrada."""
+
+    @abstractmethod
+    def loads(self, data: bytes) -> Dict[str, Any]:
+        """Decodifica una entrada codificada con :meth:`dumps`."""
+
+    @abstractmethod
+    def pack(self, encoded: List[bytes]) -> bytes:
+        """Agrupa entradas ya codificadas en el contenido de un fragmento."""
+
+    @abstractmethod
+    def unpack(self, chunk: bytes) -> Iterator[bytes]:
+        """Separa un fragmento en las entradas codificadas que contiene."""
+
+    @abstractmethod
+    def overhead(self) -> int:
+        """Bytes que :meth:`pack` añade por entrada."""
+
+
+class JsonSerializer(Serializer):
+    """
+    Una entrada JSON por línea.
+
+    :param compact: Si es ``True`` se omiten los espacios tras ``,`` y ``:``.
+    """
+
+    def __init__(self, compact: bool = False) -> None:
+        self.name = "compact" if compact else "json"
+        self._separators = (",", ":") if compact else None
+
+    def dumps(self, entry: Dict[str, Any]) -> bytes:
+        return json.dumps(entry, separators=self._separators).encode('utf-8')
+
+    def loads(self, data: bytes) -> Dict[str, Any]:
+        return json.loads(data.decode('utf-8'))
+
+    def pack(self, encoded: List[bytes]) -> bytes:
+        return b"\n".join(encoded)
+
+    def unpack(self, chunk: bytes) -> Iterator[bytes]:
+        return iter(chunk.split(b"\n"))
+
+    def overhead(self) -> int:
+        return 1
+
+
+class BinarySerializer(Serializer):
+    """
+    Registros binarios con nombres de campo internados.
+
+    Una entrada se codifica como ``u16`` con el número de campos seguido,
+    por cada campo, del código del nombre (``u8``; ``0xFF`` indica que
+    sigue el nombre en UTF-8 con prefijo ``u16``) y del valor: una
+    etiqueta de un byte y su contenido.  Las cadenas llevan prefijo
+    ``u32``; listas, diccionarios y enteros fuera de rango se guardan
+    como JSON compacto.
+    """
+
+    name = "binary"
+
+    def dumps(self, entry: Dict[str, Any]) -> bytes:
+        parts = [_U16.pack(len(entry))]
+        append = parts.append
+        for name, value in entry.items():
+            code = _FIELD_CODES.get(name)
+            if code is None:
+                raw = name.encode('utf-8')
+                append(bytes((_INLINE_NAME,)) + _U16.pack(len(raw)) + raw)
+            else:
+                append(bytes((code,)))
+            if isinstance(value, str):
+                raw = value.encode('utf-8')
+                append(b"s" + _U32.pack(len(raw)) + raw)
+            elif value is None:
+                append(b"N")
+            elif value is True:
+                append(b"T")
+            elif value is False:
+                append(b"F")
+            elif isinstance(value, int) and -2**63 <= value < 2**63:
+                append(b"i" + _I64.pack(value))
+            elif isinstance(value, float):
+                append(b"f" + _F64.pack(value))
+            else:
+                raw = json.dumps(value, separators=(",", ":")).encode('utf-8')
+                append(b"j" + _U32.pack(len(raw)) + raw)
+        return b"".join(parts)
+
+    def loads(self, data: bytes) -> Dict[str, Any]:
+        try:
+            return self._loads(bytes(data))
+        except (struct.error, IndexError) as exc:
+            raise ValueError("Entrada binaria corrupta") from exc
+
+    def _loads(self, view: bytes) -> Dict[str, Any]:
+        (count,) = _U16.unpack_from(view, 0)
+        pos = _U16.size
+        entry: Dict[str, Any] = {}
+        for _ in range(count):
+            code = view[pos]
+            pos += 1
+            if code == _INLINE_NAME:
+                (size,) = _U16.unpack_from(view, pos)
+                pos += _U16.size
+                name = view[pos:pos + size].decode('utf-8')
+                pos += size
+            else:
+                name = FIELD_NAMES[code]
+            tag = view[pos]
+            pos += 1
+            if tag == 0x73:  # s
+                (size,) = _U32.unpack_from(view, pos)
+                pos += _U32.size
+                value: Any = view[pos:pos + size].decode('utf-8')
+                pos += size
+            elif tag == 0x4E:  # N
+                value = None
+            elif tag == 0x54:  # T
+                value = True
+            elif tag == 0x46:  # F
+                value = False
+            elif tag == 0x69:  # i
+                (value,) = _I64.unpack_from(view, pos)
+                pos += _I64.size
+            elif tag == 0x66:  # f
+                (value,) = _F64.unpack_from(view, pos)
+                pos += _F64.size
+            elif tag == 0x6A:  # j
+                (size,) = _U32.unpack_from(view, pos)
+                pos += _U32.size
+                value = json.loads(view[pos:pos + size].decode('utf-8'))
+                pos += size
+            else:
+                raise ValueError(f"Tipo de valor desconocido: {tag:#x}")
+            entry[name] = value
+        if pos != len(view):
+            raise ValueError("Entrada binaria corrupta")
+        return entry
+
+    def pack(self, encoded: List[bytes]) -> bytes:
+        parts = []
+        for item in encoded:
+            parts.append(_U32.pack(len(item)))
+            parts.append(item)
+        return b"".join(parts)
+
+    def unpack(self, chunk: bytes) -> Iterator[bytes]:
+        pos = 0
+        while pos < len(chunk):
+            if pos + _U32.size > len(chunk):
+                raise ValueError("Fragmento binario corrupto")
+            (size,) = _U32.unpack_from(chunk, pos)
+            pos += _U32.size
+            if pos + size > len(chunk):
+                raise ValueError("Fragmento binario corrupto")
+            yield chunk[pos:pos + size]
+            pos += size
+
+    def overhead(self) -> int:
+        return _U32.size
+
+
+SERIALIZERS: Dict[str, Serializer] = {
+    "json": JsonSerializer(),
+    "compact": JsonSerializer(compact=True),
+    "binary": BinarySerializer(),
+}
+DEFAULT_SERIALIZER = "compact"
+
+
+def get_serializer(name: str) -> Serializer:
+    """Devuelve el serializador registrado con ``name`` o lanza ``ValueError``."""
+    try:
+        return SERIALIZERS[name]
+    except KeyError:
+        raise ValueError(f"Serializador no soportado: {name}") from None
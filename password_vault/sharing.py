@@ -0,0 +1,283 @@
+"""
+Bóvedas compartidas entre varios usuarios.
+
+Una bóveda compartida se cifra con una única clave de datos (ver
+:func:`core.change_password`) que su cabecera guarda envuelta por
+separado para cada miembro, en una ranura ``recipient`` por usuario de
+:mod:`auth`.  Cada ranura se envuelve con Diffie-Hellman efímero: se
+genera un par de un solo uso, se combina con la clave pública del
+miembro y del secreto común se deriva la clave que envuelve la de
+datos.  Solo el miembro, con su contraseña, puede descifrar su clave
+privada y recuperar la de datos::
+
+    share_vault("equipo.vault", "maestra", "ana", "users.json", members=["luis"], owner_password="clave-de-ana")
+    data, key = open_shared_vault("equipo.vault", "luis", "su-clave", "users.json")
+    add_members("equipo.vault", "ana", "clave-de-ana", "users.json", ["eva"])
+
+Añadir o quitar miembros solo reescribe la tabla de ranuras de la
+cabecera, sin tocar el cuerpo cifrado: el coste depende del número de
+miembros, no del tamaño de la bóveda.  Quitar a un miembro impide que
+vuelva a abrir la bóveda, pero ya pudo conocer la clave de datos, así
+que :func:`remove_members` marca además la bóveda para rotarla: el
+siguiente miembro que la abra con :func:`open_shared_vault` genera una
+clave de datos nueva, vuelve a cifrar la bóveda una sola vez y la
+envuelve para los miembros restantes.  Varias bajas seguidas se
+resuelven con una única rotación.
+
+Una bóveda compartida ya no tiene ranura de contraseña maestra: se abre
+solo con las credenciales de sus miembros.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .auth import DH_PRIME, check_public_key, ensure_user_keys, generate_keypair, unlock_private_key, user_public_key
+from .core import (
+    load_or_create_vault,
+    read_file_header,
+    read_vault_file,
+    unlock_key,
+    update_header,
+    vault_lock,
+    vault_version,
+    write_vault,
+)
+from .crypto import DATA_KEY_SIZE, PASSWORD_SLOT, key_check, unwrap_key, wrap_key
+
+RECIPIENT_SLOT = "recipient"
+_DH_WIDTH = (DH_PRIME.bit_length() + 7) // 8
+
+
+def _recipient_key(shared: int, ephemeral: int, recipient: int) -> bytes:
+    """Clave que envuelve la de datos, derivada del secreto DH y de ambas claves públicas."""
+    material = b"".join(value.to_bytes(_DH_WIDTH, 'big') for value in (shared, ephemeral, recipient))
+    return hashlib.sha256(b"vaultkey/recipient" + material).digest()
+
+
+def _recipient_slot(username: str, public: int, data_key: bytes) -> Dict[str, Any]:
+    """Envuelve ``data_key`` para el usuario con clave pública ``public``."""
+    check_public_key(public)
+    secret, ephemeral = generate_keypair()
+    slot = wrap_key(_recipient_key(pow(public, secret, DH_PRIME), ephemeral, public), data_key)
+    slot.update(type=RECIPIENT_SLOT, user=username, ephemeral=format(ephemeral, 'x'))
+    return slot
+
+
+def _open_slot(slot: Dict[str, Any], private: int, public: int) -> bytes:
+    """Recupera la clave de datos de la ranura de un miembro con su clave privada."""
+    try:
+        ephemeral = check_public_key(int(slot["ephemeral"], 16))
+    except (KeyError, TypeError, ValueError) as exc:
+        raise ValueError("Cabecera de la bóveda corrupta") from exc
+    return unwrap_key(_recipient_key(pow(ephemeral, private, DH_PRIME), ephemeral, public), slot)
+
+
+def _member_slots(header: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    if header is None:
+        return []
+    return [slot for slot in header.get("slots") or () if slot.get("type") == RECIPIENT_SLOT]
+
+
+def vault_members(vault_file: str) -> List[str]:
+    """Usuarios que pueden abrir la bóveda (no requiere credenciales)."""
+    return [slot.get("user") for slot in _member_slots(read_file_header(vault_file))]
+
+
+def _member_key(vault_file: str, username: str, password: str, db_file: str) -> Tuple[bytes, Dict[str, Any], int]:
+    """
+    Clave de datos de la bóveda vista por ``username``.
+
+    :return: Tupla ``(clave de datos, cabecera, versión)`` leídas juntas.
+    :raises ValueError: Si el usuario no es miembro o sus credenciales no
+        son válidas.
+    """
+    with vault_lock(vault_file):
+        header = read_file_header(vault_file)
+        version = vault_version(vault_file)
+    slot = next((slot for slot in _member_slots(header) if slot.get("user") == username), None)
+    if slot is None:
+        raise ValueError(f"El usuario {username} no es miembro de la bóveda")
+    private = unlock_private_key(username, password, db_file)
+    key = _open_slot(slot, private, user_public_key(username, db_file))
+    if not hmac.compare_digest(str(header.get("kcv", "")), key_check(key)):
+        raise ValueError("Contraseña incorrecta o datos corruptos")
+    return key, header, version
+
+
+def _new_slots(members: Iterable[str], db_file: str, data_key: bytes) -> List[Dict[str, Any]]:
+    slots: List[Dict[str, Any]] = []
+    for member in dict.fromkeys(members):
+        slots.append(_recipient_slot(member, user_public_key(member, db_file), data_key))
+    return slots
+
+
+def _replace_slots(vault_file: str, key: bytes, slots: List[Dict[str, Any]], version: int, rotate: Optional[bool] = None) -> None:
+    """
+    Sustituye la tabla de ranuras, en la cabecera si es posible.
+
+    Si no cabe en el espacio reservado de una bóveda ``records`` (o la
+    bóveda es anterior a las claves de datos), se escribe una instantánea
+    con la misma clave: los registros se copian sin volver a cifrarlos.
+    Quitar ranuras nunca llega a ese caso, porque la cabecera encoge.
+    """
+    def update(header: Dict[str, Any]) -> Dict[str, Any]:
+        return {"slots": slots} if rotate is None else {"slots": slots, "rotate": rotate}
+
+    if update_header(vault_file, key, update, expected_version=version) is not None:
+        return
+    header, vault_data, _ = read_vault_file(vault_file, key)
+    meta = {k: v for k, v in vault_data.items() if k != "entries"}
+    write_vault(
+        vault_file, vault_data["entries"], key, bytes.fromhex(header["salt"]), meta,
+        kdf=header.get("kdf"), slots=slots, expected_version=version,
+    )
+
+
+def share_vault(
+    vault_file: str,
+    password: str,
+    owner: str,
+    db_file: str,
+    members: Iterable[str] = (),
+    *,
+    owner_password: Optional[str] = None,
+) -> None:
+    """
+    Convierte una bóveda protegida con contraseña en una bóveda compartida.
+
+    La ranura de la contraseña maestra se sustituye por una ranura para
+    ``owner`` y otra para cada usuario de ``members``; el cuerpo no se
+    vuelve a cifrar.  Los usuarios necesitan un par de claves (ver
+    :func:`auth.ensure_user_keys`): el de ``owner`` se crea aquí si se
+    indica su contraseña, y el de cada miembro la primera vez que abre
+    una bóveda compartida.
+
+    :param password: Contraseña maestra actual de la bóveda.
+    :param owner: Usuario de :mod:`auth` que comparte la bóveda.
+    :param owner_password: Contraseña de ``owner``, para crear su par de
+        claves si aún no lo tiene.
+    :raises ValueError: Si la contraseña no coincide o algún usuario no
+        existe o no tiene claves.
+    """
+    if owner_password is not None:
+        ensure_user_keys(owner, owner_password, db_file)
+    with vault_lock(vault_file):
+        version = vault_version(vault_file)
+        header = read_file_header(vault_file)
+    if header is None:
+        # Las bóvedas v1 no tienen cabecera: se reescriben en formato v2
+        vault_data, key = load_or_create_vault(vault_file, password)
+        meta = {k: v for k, v in vault_data.items() if k != "entries"}
+        slots = _new_slots([owner, *members], db_file, key)
+        write_vault(vault_file, vault_data["entries"], key, os.urandom(16), meta, slots=slots, expected_version=version)
+        return
+    if _member_slots(header):
+        raise ValueError("La bóveda ya es compartida")
+    key, _, _ = unlock_key(header, password)
+    _replace_slots(vault_file, key, _new_slots([owner, *members], db_file, key), version)
+
+
+def add_members(vault_file: str, username: str, password: str, db_file: str, members: Iterable[str]) -> List[str]:
+    """
+    Da acceso a ``members`` envolviendo para ellos la clave de datos.
+
+    Solo se reescribe la cabecera.  Los usuarios que ya eran miembros se
+    ignoran.
+
+    :param username: Miembro que concede el acceso.
+    :param password: Contraseña de ``username``.
+    :return: Miembros añadidos.
+    """
+    key, header, version = _member_key(vault_file, username, password, db_file)
+    current = _member_slots(header)
+    known = {slot.get("user") for slot in current}
+    added = [member for member in dict.fromkeys(members) if member not in known]
+    if added:
+        kept = [slot for slot in header.get("slots") or () if slot.get("type") != PASSWORD_SLOT]
+        _replace_slots(vault_file, key, kept + _new_slots(added, db_file, key), version)
+    return added
+
+
+def remove_members(
+    vault_file: str,
+    username: str,
+    password: str,
+    db_file: str,
+    members: Iterable[str],
+    *,
+    rotate: bool = True,
+) -> List[str]:
+    """
+    Retira el acceso de ``members`` eliminando sus ranuras.
+
+    Solo se reescribe la cabecera.  Con ``rotate=True`` (por defecto) la
+    bóveda queda marcada para que el siguiente miembro que la abra
+    sustituya la clave de datos (ver :func:`rotate_data_key`), ya que
+    los miembros retirados pudieron conocerla.
+
+    :param username: Miembro que retira el acceso.
+    :param password: Contraseña de ``username``.
+    :return: Miembros retirados.
+    :raises ValueError: Si la bóveda se quedaría sin miembros.
+    """
+    key, header, version = _member_key(vault_file, username, password, db_file)
+    removed = set(members)
+    gone = [slot for slot in _member_slots(header) if slot.get("user") in removed]
+    slots = [slot for slot in header.get("slots") or () if slot not in gone]
+    if not _member_slots({"slots": slots}):
+        raise ValueError("La bóveda compartida debe conservar al menos un miembro")
+    if gone:
+        _replace_slots(vault_file, key, slots, version, rotate=True if rotate else None)
+    return [slot.get("user") for slot in gone]
+
+
+def rotate_data_key(vault_file: str, key: bytes, db_file: str, expected_version: Optional[int] = None) -> bytes:
+    """
+    Vuelve a cifrar la bóveda con una clave de datos nueva para sus miembros actuales.
+
+    Es la única operación cuyo coste depende del tamaño de la bóveda y se
+    hace una sola vez por rotación, sea cual sea el número de miembros.
+
+    :param key: Clave de datos actual.
+    :return: La clave de datos nueva.
+    """
+    header, vault_data, version = read_vault_file(vault_file, key)
+    if expected_version is None:
+        expected_version = version
+    new_key = os.urandom(DATA_KEY_SIZE)
+    slots = _new_slots((slot.get("user") for slot in _member_slots(header)), db_file, new_key)
+    meta = {k: v for k, v in vault_data.items() if k != "entries"}
+    write_vault(
+        vault_file, vault_data["entries"], new_key, bytes.fromhex(header["salt"]), meta,
+        kdf=header.get("kdf"), slots=slots, expected_version=expected_version,
+    )
+    return new_key
+
+
+def open_shared_vault(vault_file: str, username: str, password: str, db_file: str) -> Tuple[Dict, bytes]:
+    """
+    Abre una bóveda compartida con las credenciales de un miembro.
+
+    Si hay una rotación pendiente (ver :func:`remove_members`) se realiza
+    antes de devolver los datos.  El resultado se usa igual que el de
+    :func:`core.load_or_create_vault`: ``save_vault(ruta, data, key)``
+    conserva las ranuras de los miembros.
+
+    La primera apertura crea además el par de claves del usuario (ver
+    :func:`auth.ensure_user_keys`), aunque aún no sea miembro: a partir
+    de entonces otros miembros pueden darle acceso.
+
+    :return: Una tupla ``(vault_data, key)`` con la clave de datos.
+    :raises ValueError: Si el usuario no es miembro o sus credenciales no
+        son válidas.
+    """
+    ensure_user_keys(username, password, db_file)
+    key, header, version = _member_key(vault_file, username, password, db_file)
+    if header.get("rotate"):
+        key = rotate_data_key(vault_file, key, db_file, expected_version=version)
+    _, vault_data, _ = read_vault_file(vault_file, key)
+    return vault_data, key
@@ -0,0 +1,673 @@
+"""
+Backends de almacenamiento de las bóvedas.
+
+:func:`core.load_or_create_vault` y :func:`core.save_vault` leen y
+escriben a través de un :class:`StorageBackend`, elegido con su
+parámetro ``backend`` para una bóveda nueva o detectado a partir del
+contenido de una existente:
+
+- ``file`` (por defecto): el archivo cifrado v2 de :mod:`core`, con sus
+  disposiciones, diario y fragmentos.
+- ``sqlite``: una base de datos :mod:`sqlite3` en modo WAL con una fila
+  cifrada por entrada (ver :class:`SQLiteBackend`).
+
+Además de abrir y guardar la bóveda entera, cada backend ofrece
+operaciones sobre una sola entrada a partir de la clave de datos::
+
+    data, key = load_or_create_vault("vault.db", password, backend="sqlite")
+    backend = get_backend("sqlite")
+    backend.put_entry("vault.db", key, {"id": "1", "title": "GitHub"})
+    backend.find_entries("vault.db", key, "domain", "github.com")
+
+En el backend ``sqlite`` estas operaciones usan los índices de la base
+de datos y su coste es logarítmico en el número de entradas.  En
+``file`` las lecturas descifran la bóveda y las escrituras se añaden a
+su diario.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import os
+import sqlite3
+import tempfile
+import unicodedata
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .core import (
+    LOCK_TIMEOUT,
+    VaultConflictError,
+    append_journal,
+    derive_key,
+    ensure_entry_id,
+    key_cache,
+    load_or_create_vault,
+    normalize_kdf,
+    read_file_header,
+    read_vault,
+    save_vault,
+    unlock_key,
+    url_domain,
+    vault_lock,
+    vault_version,
+)
+from .crypto import (
+    DATA_KEY_SIZE,
+    DEFAULT_SUITE,
+    MAC_ALGORITHM,
+    SeekableCipher,
+    VaultIntegrityError,
+    cipher_suite,
+    header_digest,
+    key_check,
+    mac_key,
+    requires_mac,
+    subkey,
+    tag,
+    verify_tag,
+    wrap_key,
+)
+from .serializers import DEFAULT_SERIALIZER, get_serializer
+
+SQLITE_MAGIC = b"SQLite format 3\x00"
+# Archivos auxiliares del modo WAL junto a la base de datos
+WAL_SUFFIXES = ("-wal", "-shm")
+# Campos no secretos por los que se puede buscar una entrada (ver :meth:`StorageBackend.find_entries`)
+LOOKUP_FIELDS = ("title", "username", "domain")
+_LOOKUP_SIZE = 16
+
+
+class StorageBackend(ABC):
+    """Lee y escribe bóvedas en un medio concreto."""
+
+    name = ""
+
+    @abstractmethod
+    def matches(self, vault_file: str) -> bool:
+        """Indica si ``vault_file`` existe y está guardado con este backend."""
+
+    @abstractmethod
+    def load(self, vault_file: str, password: str, *, kdf: Optional[Dict[str, Any]] = None) -> Tuple[Dict, bytes]:
+        """Abre (o crea) la bóveda; equivale a :func:`core.load_or_create_vault`."""
+
+    @abstractmethod
+    def save(
+        self,
+        vault_file: str,
+        vault_data: Dict,
+        key: bytes,
+        salt: Optional[bytes] = None,
+        *,
+        expected_version: Optional[int] = None,
+        **options: Any,
+    ) -> None:
+        """Guarda la bóveda completa; equivale a :func:`core.save_vault`."""
+
+    @abstractmethod
+    def version(self, vault_file: str) -> int:
+        """Versión lógica de la bóveda (ver :func:`core.vault_version`)."""
+
+    @abstractmethod
+    def get_entry(self, vault_file: str, key: bytes, entry_id: str) -> Optional[Dict[str, Any]]:
+        """Entrada con identificador ``entry_id``, o ``None`` si no existe."""
+
+    @abstractmethod
+    def put_entry(self, vault_file: str, key: bytes, entry: Dict[str, Any], *, expected_version: Optional[int] = None) -> str:
+        """Añade o sustituye la entrada con el ``id`` de ``entry`` (se asigna si falta) y lo devuelve."""
+
+    @abstractmethod
+    def delete_entry(self, vault_file: str, key: bytes, entry_id: str, *, expected_version: Optional[int] = None) -> None:
+        """Elimina la entrada ``entry_id`` si existe."""
+
+    @abstractmethod
+    def find_entries(self, vault_file: str, key: bytes, field: str, value: str) -> List[Dict[str, Any]]:
+        """
+        Entradas cuyo campo ``field`` (ver :data:`LOOKUP_FIELDS`) coincide con ``value``.
+
+        La comparación es exacta salvo mayúsculas y formas Unicode
+        equivalentes; el campo ``domain`` se extrae de la URL.
+        """
+
+
+def _normalize(value: Any) -> Optional[str]:
+    """Valor de búsqueda normalizado (NFKC, sin distinguir mayúsculas), o ``None`` si está vacío."""
+    if not isinstance(value, str) or not value.strip():
+        return None
+    return unicodedata.normalize("NFKC", value.strip()).casefold()
+
+
+def _lookup_value(entry: Dict[str, Any], field: str) -> Optional[str]:
+    if field == "domain":
+        return _normalize(url_domain(entry.get("url")))
+    return _normalize(entry.get(field))
+
+
+def _check_field(field: str) -> None:
+    if field not in LOOKUP_FIELDS:
+        raise ValueError(f"Campo de búsqueda no soportado: {field}")
+
+
+class FileBackend(StorageBackend):
+    """
+    El archivo cifrado de :mod:`core` (backend por defecto).
+
+    Las lecturas de una entrada descifran la bóveda completa y las
+    escrituras se añaden al diario (ver :func:`core.append_journal`).
+    """
+
+    name = "file"
+
+    def matches(self, vault_file: str) -> bool:
+        return os.path.exists(vault_file) and not SQLiteBackend().matches(vault_file)
+
+    def load(self, vault_file: str, password: str, *, kdf: Optional[Dict[str, Any]] = None) -> Tuple[Dict, bytes]:
+        return load_or_create_vault(vault_file, password, kdf=kdf, backend=self.name)
+
+    def save(self, vault_file, vault_data, key, salt=None, *, expected_version=None, **options) -> None:
+        save_vault(vault_file, vault_data, key, salt, expected_version=expected_version, backend=self.name, **options)
+
+    def version(self, vault_file: str) -> int:
+        return vault_version(vault_file)
+
+    def _entries(self, vault_file: str, key: bytes) -> Iterator[Dict[str, Any]]:
+        with vault_lock(vault_file), open(vault_file, 'rb') as f:
+            vault_data, _ = read_vault(f, None, key=key, vault_file=vault_file)
+            yield from vault_data["entries"]
+
+    def get_entry(self, vault_file, key, entry_id):
+        return next((entry for entry in self._entries(vault_file, key) if entry.get("id") == entry_id), None)
+
+    def _append(self, vault_file: str, key: bytes, record: Dict[str, Any], expected_version: Optional[int]) -> None:
+        header = read_file_header(vault_file)
+        if header is None or not header.get("snapshot"):
+            raise ValueError("Las escrituras por entrada requieren una bóveda v2; guárdela antes con save_vault")
+        append_journal(vault_file, key, header["snapshot"], [record], expected_version=expected_version)
+
+    def put_entry(self, vault_file, key, entry, *, expected_version=None) -> str:
+        entry_id = ensure_entry_id(entry)
+        self._append(vault_file, key, {"op": "put", "entry": entry}, expected_version)
+        return entry_id
+
+    def delete_entry(self, vault_file, key, entry_id, *, expected_version=None) -> None:
+        self._append(vault_file, key, {"op": "delete", "id": entry_id}, expected_version)
+
+    def find_entries(self, vault_file, key, field, value):
+        _check_field(field)
+        wanted = _normalize(value)
+        return [entry for entry in self._entries(vault_file, key) if wanted is not None and _lookup_value(entry, field) == wanted]
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS vault (
+    name TEXT PRIMARY KEY,
+    value BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    position INTEGER PRIMARY KEY,
+    id_hash BLOB NOT NULL UNIQUE,
+    title_hash BLOB,
+    username_hash BLOB,
+    domain_hash BLOB,
+    digest BLOB NOT NULL,
+    nonce BLOB NOT NULL,
+    data BLOB NOT NULL,
+    tag BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_title ON entries (title_hash);
+CREATE INDEX IF NOT EXISTS entries_username ON entries (username_hash);
+CREATE INDEX IF NOT EXISTS entries_domain ON entries (domain_hash);
+"""
+_ROW_COLUMNS = "position, id_hash, title_hash, username_hash, domain_hash, digest, nonce, data, tag"
+# Columnas que autentica :meth:`_RowCipher.open` (todas salvo el resumen)
+_OPEN_COLUMNS = "position, id_hash, title_hash, username_hash, domain_hash, nonce, data, tag"
+# Una entrada que ya existe conserva su posición (el orden de la bóveda)
+_UPSERT = (
+    f"INSERT INTO entries ({_ROW_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (id_hash) DO UPDATE SET title_hash = excluded.title_hash, "
+    "username_hash = excluded.username_hash, domain_hash = excluded.domain_hash, "
+    "digest = excluded.digest, nonce = excluded.nonce, data = excluded.data, tag = excluded.tag"
+)
+
+
+# Tamaño del resumen del conjunto de filas (ver :meth:`_RowCipher.mark`)
+_ROWS_SIZE = 32
+
+
+def _uint64(value: int) -> bytes:
+    """Versión o posición como entero de 8 bytes para las etiquetas."""
+    return int(value).to_bytes(8, 'big')
+
+
+class _RowCipher:
+    """Cifra, autentica y resume las filas de una bóveda ``sqlite`` con la clave de datos."""
+
+    def __init__(self, key: bytes, header: Dict[str, Any]) -> None:
+        self.key = key
+        self.suite = header.get("suite", DEFAULT_SUITE)
+        cipher_suite(self.suite)
+        self.serializer = get_serializer(header.get("serializer", DEFAULT_SERIALIZER))
+        if not requires_mac(header):
+            raise VaultIntegrityError("Datos de la bóveda manipulados o corruptos")
+        if not isinstance(header.get("vault_id"), str):
+            raise ValueError("Cabecera de la bóveda corrupta")
+        self.header_digest = header_digest(header)
+        self._mac_key = mac_key(key)
+        # HMAC ya inicializados que se copian por fila (evita repetir el relleno de la clave)
+        self._row_mac = hmac.new(self._mac_key, digestmod=hashlib.sha256)
+        self._lookup_mac = hmac.new(subkey(key, b"lookup"), digestmod=hashlib.sha256)
+        self._digest_mac = hmac.new(subkey(key, b"row"), digestmod=hashlib.sha256)
+        self._rows_mac = hmac.new(subkey(key, b"rows"), digestmod=hashlib.sha256)
+
+    @staticmethod
+    def _hmac(base: "hmac.HMAC", *parts: bytes) -> bytes:
+        mac = base.copy()
+        for part in parts:
+            mac.update(part)
+        return mac.digest()
+
+    def lookup(self, field: str, value: Optional[str]) -> Optional[bytes]:
+        """Ficha HMAC de ``value`` en la columna ``field`` (``id`` o uno de :data:`LOOKUP_FIELDS`)."""
+        if value is None:
+            return None
+        return self._hmac(self._lookup_mac, f"{field}\x00{value}".encode('utf-8'))[:_LOOKUP_SIZE]
+
+    def digest(self, plaintext: bytes) -> bytes:
+        """Resumen con clave del contenido de una fila, para detectar cambios sin descifrar."""
+        return self._hmac(self._digest_mac, plaintext)[:_LOOKUP_SIZE]
+
+    def _row_tag(self, position: int, id_hash: bytes, lookups: Tuple[Optional[bytes], ...], nonce: bytes, data: bytes) -> bytes:
+        """Etiqueta de una fila: cubre la cabecera, la posición, el ``id``, las fichas de búsqueda y el contenido."""
+        # Cada ficha lleva un prefijo que distingue NULL de un valor (todas miden lo mismo)
+        parts = (b"\x00" if value is None else b"\x01" + value for value in lookups)
+        return self._hmac(self._row_mac, self.header_digest, _uint64(position), id_hash, *parts, nonce, data)
+
+    def row(
+        self,
+        entry: Dict[str, Any],
+        position: int,
+        plaintext: Optional[bytes] = None,
+        id_hash: Optional[bytes] = None,
+        digest: Optional[bytes] = None,
+    ) -> Tuple[Any, ...]:
+        """Valores de :data:`_ROW_COLUMNS` para ``entry``; acepta los ya calculados por :meth:`SQLiteBackend.save`."""
+        plaintext = self.serializer.dumps(entry) if plaintext is None else plaintext
+        id_hash = self.lookup("id", ensure_entry_id(entry)) if id_hash is None else id_hash
+        lookups = tuple(self.lookup(field, _lookup_value(entry, field)) for field in LOOKUP_FIELDS)
+        nonce = os.urandom(16)
+        ciphertext = SeekableCipher(self.key, nonce, suite=self.suite).encrypt_range(0, plaintext)
+        return (
+            position,
+            id_hash,
+            *lookups,
+            self.digest(plaintext) if digest is None else digest,
+            nonce,
+            ciphertext,
+            self._row_tag(position, id_hash, lookups, nonce, ciphertext),
+        )
+
+    def open(
+        self,
+        position: int,
+        id_hash: bytes,
+        title_hash: Optional[bytes],
+        username_hash: Optional[bytes],
+        domain_hash: Optional[bytes],
+        nonce: bytes,
+        data: bytes,
+        tag: bytes,
+    ) -> Dict[str, Any]:
+        """Autentica y descifra una fila leída con :data:`_OPEN_COLUMNS`."""
+        expected = self._row_tag(position, id_hash, (title_hash, username_hash, domain_hash), nonce, data)
+        if not hmac.compare_digest(tag, expected):
+            raise VaultIntegrityError("Datos de la bóveda manipulados o corruptos")
+        return self.serializer.loads(SeekableCipher(self.key, nonce, suite=self.suite).decrypt(0, data))
+
+    def mark(self, id_hash: bytes, row_tag: bytes) -> int:
+        """
+        Aportación de una fila al resumen del conjunto de filas.
+
+        El resumen es el XOR de estas marcas, así que una escritura lo
+        actualiza quitando la marca de la fila anterior y añadiendo la de
+        la nueva.  Se guarda cifrado en los metadatos: sin la clave no se
+        pueden calcular las marcas ni conocer sus diferencias.
+        """
+        return int.from_bytes(self._hmac(self._rows_mac, id_hash, row_tag), 'big')
+
+    def seal_meta(self, meta: Dict[str, Any], version: int, rows: int) -> bytes:
+        """Cifra los metadatos (las claves distintas de ``entries``) con el resumen ``rows`` de las filas."""
+        nonce = os.urandom(16)
+        plaintext = rows.to_bytes(_ROWS_SIZE, 'big') + json.dumps(meta).encode('utf-8')
+        ciphertext = SeekableCipher(self.key, nonce, suite=self.suite).encrypt_range(0, plaintext)
+        return nonce + tag(self._mac_key, self.header_digest, b"meta", _uint64(version), nonce, ciphertext) + ciphertext
+
+    def open_meta(self, raw: bytes, version: int) -> Tuple[Dict[str, Any], int]:
+        """Descifra los metadatos y el resumen de las filas; su etiqueta cubre la cabecera y la ``version``."""
+        nonce, tag, ciphertext = raw[:16], raw[16:48], raw[48:]
+        verify_tag(self._mac_key, tag, self.header_digest, b"meta", _uint64(version), nonce, ciphertext)
+        plaintext = SeekableCipher(self.key, nonce, suite=self.suite).decrypt(0, ciphertext)
+        meta = json.loads(plaintext[_ROWS_SIZE:])
+        if not isinstance(meta, dict):
+            raise ValueError("Contraseña incorrecta o datos corruptos")
+        return meta, int.from_bytes(plaintext[:_ROWS_SIZE], 'big')
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Bóveda guardada en una base de datos SQLite con una fila cifrada por entrada.
+
+    La tabla ``vault`` guarda la cabecera en claro (sal, KDF, ranuras de
+    la clave de datos, KCV, suite, serializador y versión, como en el
+    formato v2) y los metadatos cifrados.  Cada entrada es una fila de
+    ``entries`` con su contenido serializado y cifrado con un nonce
+    propio, una etiqueta HMAC que lo vincula a su posición, a su ``id``,
+    a sus fichas de búsqueda y a la cabecera (que incluye un
+    ``vault_id`` aleatorio), un resumen con clave de su
+    contenido y fichas HMAC truncadas del ``id``, el título,
+    el usuario y el dominio.  Las fichas no revelan los valores, pero sí
+    qué entradas comparten uno.  Las búsquedas por ``id`` o por esas
+    fichas usan índices B-tree.
+
+    Los metadatos cifrados guardan además un resumen con clave del
+    conjunto de filas, y su etiqueta cubre la versión.  :meth:`load`
+    lo comprueba, así que reponer una fila anterior (o de otra bóveda),
+    borrarla o volver atrás la versión se detecta al abrir la bóveda.
+    Las lecturas de una sola fila solo comprueban su etiqueta.
+
+    La base de datos se abre en modo WAL: los lectores no esperan a los
+    escritores y cada escritura es una transacción que solo toca sus
+    filas.  :meth:`save` compara los resúmenes y solo vuelve a cifrar y
+    escribir las entradas que cambiaron.  Las entradas se devuelven en
+    el orden en que se añadieron por primera vez.
+    """
+
+    name = "sqlite"
+
+    def matches(self, vault_file: str) -> bool:
+        if not os.path.isfile(vault_file):
+            return False
+        with open(vault_file, 'rb') as f:
+            return f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+
+    @contextmanager
+    def _connect(self, vault_file: str, transaction: Optional[str] = "DEFERRED") -> Iterator[sqlite3.Connection]:
+        """
+        Conexión en modo WAL dentro de una transacción.
+
+        Las lecturas usan una transacción ``DEFERRED`` para que la cabecera
+        y las filas se lean en la misma instantánea; las escrituras, una
+        ``IMMEDIATE`` que toma el bloqueo de escritura al empezar.  Con
+        ``transaction=None`` no se abre ninguna.  Un bloqueo que no se
+        libera en :data:`core.LOCK_TIMEOUT` segundos se traduce en
+        :class:`core.VaultConflictError`.
+        """
+        connection = sqlite3.connect(vault_file, timeout=LOCK_TIMEOUT, isolation_level=None)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=FULL")
+            if transaction is None:
+                yield connection
+                return
+            connection.execute(f"BEGIN {transaction}")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        except sqlite3.OperationalError as exc:
+            if "locked" in str(exc) or "busy" in str(exc):
+                raise VaultConflictError("La bóveda está bloqueada por otro proceso") from exc
+            raise ValueError(f"Base de datos de la bóveda corrupta: {exc}") from exc
+        except sqlite3.DatabaseError as exc:
+            raise ValueError(f"Base de datos de la bóveda corrupta: {exc}") from exc
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _header(connection: sqlite3.Connection) -> Dict[str, Any]:
+        row = connection.execute("SELECT value FROM vault WHERE name = 'header'").fetchone()
+        if row is None:
+            raise ValueError("Base de datos de la bóveda corrupta: falta la cabecera")
+        try:
+            header = json.loads(row[0])
+        except ValueError as exc:
+            raise ValueError("Cabecera de la bóveda corrupta") from exc
+        if not isinstance(header, dict):
+            raise ValueError("Cabecera de la bóveda corrupta")
+        return header
+
+    @classmethod
+    def _cipher(cls, connection: sqlite3.Connection, key: bytes, expected_version: Optional[int] = None) -> Tuple[Dict[str, Any], _RowCipher]:
+        """Cabecera y cifrador de filas, comprobando la clave y, si se indica, la versión."""
+        header = cls._header(connection)
+        if not hmac.compare_digest(str(header.get("kcv", "")), key_check(key)):
+            raise VaultConflictError("La bóveda fue reescrita con otra clave por otro proceso")
+        if expected_version is not None and int(header.get("version", 0)) != expected_version:
+            raise VaultConflictError("La bóveda cambió desde que se leyó")
+        return header, _RowCipher(key, header)
+
+    @staticmethod
+    def _state(connection: sqlite3.Connection, header: Dict[str, Any], cipher: _RowCipher) -> Tuple[Dict[str, Any], int]:
+        """Metadatos y resumen de las filas, autenticados con la versión de ``header``."""
+        row = connection.execute("SELECT value FROM vault WHERE name = 'meta'").fetchone()
+        if row is None:
+            raise VaultIntegrityError("Datos de la bóveda manipulados o corruptos")
+        return cipher.open_meta(row[0], int(header.get("version", 0)))
+
+    @staticmethod
+    def _commit(connection: sqlite3.Connection, header: Dict[str, Any], cipher: _RowCipher, meta: Dict[str, Any], rows: int) -> None:
+        """
+        Incrementa la versión y vuelve a sellar los metadatos con ella y con el resumen ``rows``.
+
+        La versión no cambia el resumen de la cabecera (ver
+        :data:`crypto.MAC_EXCLUDED`), pero la etiqueta de los metadatos la
+        cubre: no se puede volver a una versión ni a unas filas anteriores.
+        """
+        header["version"] = int(header.get("version", 0)) + 1
+        connection.execute("UPDATE vault SET value = ? WHERE name = 'meta'", (cipher.seal_meta(meta, header["version"], rows),))
+        connection.execute("UPDATE vault SET value = ? WHERE name = 'header'", (json.dumps(header),))
+
+    def _create(self, vault_file: str, key: bytes, salt: bytes, kdf: Dict[str, Any], derived: bytes) -> None:
+        header = {
+            "salt": salt.hex(),
+            "kdf": kdf,
+            "slots": [wrap_key(derived, key)],
+            "kcv": key_check(key),
+            "suite": DEFAULT_SUITE,
+            "serializer": DEFAULT_SERIALIZER,
+            "mac": MAC_ALGORITHM,
+            "version": 1,
+            "vault_id": os.urandom(16).hex(),
+        }
+        with self._connect(vault_file, transaction="IMMEDIATE") as connection:
+            if connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'vault'").fetchone():
+                raise VaultConflictError("Otro proceso creó la bóveda a la vez")
+            for statement in filter(str.strip, _SCHEMA.split(";")):
+                connection.execute(statement)
+            connection.execute("INSERT INTO vault VALUES ('header', ?)", (json.dumps(header),))
+            connection.execute("INSERT INTO vault VALUES ('meta', ?)", (_RowCipher(key, header).seal_meta({}, 1, 0),))
+
+    def load(self, vault_file, password, *, kdf=None):
+        if not os.path.exists(vault_file):
+            salt = os.urandom(16)
+            params = normalize_kdf(kdf)
+            derived = derive_key(password, salt, **params)
+            key = os.urandom(DATA_KEY_SIZE)
+            try:
+                self._create(vault_file, key, salt, params, derived)
+            except VaultConflictError:
+                pass  # Otro proceso la creó a la vez: se abre la suya
+            else:
+                key_cache.put(password, salt, derived, **params)
+                return {"entries": []}, key
+        with self._connect(vault_file) as connection:
+            header = self._header(connection)
+            key, derived, cached = unlock_key(header, password)
+            cipher = _RowCipher(key, header)
+            vault_data, expected = self._state(connection, header, cipher)
+            entries = []
+            rows = 0
+            for row in connection.execute(f"SELECT {_OPEN_COLUMNS} FROM entries ORDER BY position"):
+                entries.append(cipher.open(*row))
+                rows ^= cipher.mark(row[1], row[-1])
+            # Una fila anterior repuesta, borrada o añadida cambia el resumen
+            if rows != expected:
+                raise VaultIntegrityError("Datos de la bóveda manipulados o corruptos")
+            vault_data["entries"] = entries
+        if not cached:
+            key_cache.put(password, bytes.fromhex(header["salt"]), derived, **normalize_kdf(header.get("kdf")))
+        return vault_data, key
+
+    def save(self, vault_file, vault_data, key, salt=None, *, expected_version=None, **options) -> None:
+        unsupported = sorted(name for name, value in options.items() if value is not None)
+        if unsupported:
+            raise ValueError(f"Opciones no soportadas por el backend sqlite: {', '.join(unsupported)}")
+        if not os.path.exists(vault_file):
+            raise ValueError("Cree la bóveda con load_or_create_vault(..., backend='sqlite')")
+        with self._connect(vault_file, transaction="IMMEDIATE") as connection:
+            header, cipher = self._cipher(connection, key, expected_version)
+            _, rows = self._state(connection, header, cipher)
+            stored = {
+                id_hash: (position, digest, tag)
+                for id_hash, position, digest, tag in connection.execute("SELECT id_hash, position, digest, tag FROM entries")
+            }
+            # Las entradas nuevas van detrás de todas las existentes
+            next_position = max((value[0] for value in stored.values()), default=0) + 1
+            kept = set()
+            changed = []
+            for entry in vault_data.get("entries", []):
+                plaintext = cipher.serializer.dumps(entry)
+                id_hash = cipher.lookup("id", ensure_entry_id(entry))
+                digest = cipher.digest(plaintext)
+                kept.add(id_hash)
+                previous = stored.get(id_hash)
+                if previous is None or previous[1] != digest:
+                    if previous is None:
+                        position, next_position = next_position, next_position + 1
+                    else:
+                        position = previous[0]
+                        rows ^= cipher.mark(id_hash, previous[2])
+                    row = cipher.row(entry, position, plaintext, id_hash, digest)
+                    rows ^= cipher.mark(id_hash, row[-1])
+                    stored[id_hash] = (position, digest, row[-1])
+                    changed.append(row)
+            deleted = [id_hash for id_hash in stored if id_hash not in kept]
+            for id_hash in deleted:
+                rows ^= cipher.mark(id_hash, stored[id_hash][2])
+            connection.executemany(_UPSERT, changed)
+            connection.executemany("DELETE FROM entries WHERE id_hash = ?", [(id_hash,) for id_hash in deleted])
+            meta = {k: v for k, v in vault_data.items() if k != "entries"}
+            self._commit(connection, header, cipher, meta, rows)
+
+    def version(self, vault_file: str) -> int:
+        with self._connect(vault_file) as connection:
+            return int(self._header(connection).get("version", 0))
+
+    def get_entry(self, vault_file, key, entry_id):
+        with self._connect(vault_file) as connection:
+            _, cipher = self._cipher(connection, key)
+            id_hash = cipher.lookup("id", entry_id)
+            row = connection.execute(f"SELECT {_OPEN_COLUMNS} FROM entries WHERE id_hash = ?", (id_hash,)).fetchone()
+            return None if row is None else cipher.open(*row)
+
+    def put_entry(self, vault_file, key, entry, *, expected_version=None) -> str:
+        entry_id = ensure_entry_id(entry)
+        with self._connect(vault_file, transaction="IMMEDIATE") as connection:
+            header, cipher = self._cipher(connection, key, expected_version)
+            meta, rows = self._state(connection, header, cipher)
+            id_hash = cipher.lookup("id", entry_id)
+            previous = connection.execute("SELECT position, tag FROM entries WHERE id_hash = ?", (id_hash,)).fetchone()
+            if previous is None:
+                position = connection.execute("SELECT COALESCE(MAX(position), 0) + 1 FROM entries").fetchone()[0]
+            else:
+                position = previous[0]
+                rows ^= cipher.mark(id_hash, previous[1])
+            row = cipher.row(entry, position, id_hash=id_hash)
+            connection.execute(_UPSERT, row)
+            self._commit(connection, header, cipher, meta, rows ^ cipher.mark(id_hash, row[-1]))
+        return entry_id
+
+    def delete_entry(self, vault_file, key, entry_id, *, expected_version=None) -> None:
+        with self._connect(vault_file, transaction="IMMEDIATE") as connection:
+            header, cipher = self._cipher(connection, key, expected_version)
+            meta, rows = self._state(connection, header, cipher)
+            id_hash = cipher.lookup("id", entry_id)
+            previous = connection.execute("SELECT tag FROM entries WHERE id_hash = ?", (id_hash,)).fetchone()
+            if previous is not None:
+                rows ^= cipher.mark(id_hash, previous[0])
+                connection.execute("DELETE FROM entries WHERE id_hash = ?", (id_hash,))
+            self._commit(connection, header, cipher, meta, rows)
+
+    def find_entries(self, vault_file, key, field, value):
+        _check_field(field)
+        with self._connect(vault_file) as connection:
+            _, cipher = self._cipher(connection, key)
+            wanted = _normalize(value)
+            token = cipher.lookup(field, wanted)
+            if token is None:
+                return []
+            rows = connection.execute(
+                f"SELECT {_OPEN_COLUMNS} FROM entries WHERE {field}_hash = ? ORDER BY position", (token,)
+            )
+            # Las fichas solo preseleccionan: el valor se comprueba sobre la entrada descifrada
+            entries = (cipher.open(*row) for row in rows)
+            return [entry for entry in entries if _lookup_value(entry, field) == wanted]
+
+    def copy(self, source: str, destination: str) -> None:
+        """
+        Copia la bóveda ``source`` en ``destination`` sustituyéndola de forma atómica.
+
+        La copia se hace con la API de copia de seguridad de SQLite, que
+        incluye lo escrito en el WAL y ve una única instantánea aunque
+        otro proceso escriba a la vez.  El WAL del destino se elimina
+        para que no se aplique sobre la base de datos nueva.  Como
+        :func:`shutil.copy2`, la copia conserva la fecha de modificación
+        (la más reciente entre la base de datos y su WAL).
+        """
+        mtime = max(os.path.getmtime(path) for path in (source, source + WAL_SUFFIXES[0]) if os.path.exists(path))
+        directory, name = os.path.split(os.path.abspath(destination))
+        fd, tmp_file = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+        os.close(fd)
+        try:
+            with self._connect(source, transaction=None) as connection:
+                target = sqlite3.connect(tmp_file)
+                try:
+                    connection.backup(target)
+                finally:
+                    target.close()
+            os.utime(tmp_file, (mtime, mtime))
+            for suffix in WAL_SUFFIXES:
+                if os.path.exists(destination + suffix):
+                    os.remove(destination + suffix)
+            os.replace(tmp_file, destination)
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+
+
+BACKENDS: Dict[str, StorageBackend] = {
+    "file": FileBackend(),
+    "sqlite": SQLiteBackend(),
+}
+DEFAULT_BACKEND = "file"
+
+
+def get_backend(name: str) -> StorageBackend:
+    """Devuelve el backend registrado con ``name`` o lanza ``ValueError``."""
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Backend de almacenamiento no soportado: {name}") from None
+
+
+def detect_backend(vault_file: str) -> StorageBackend:
+    """Backend de una bóveda existente, o :data:`DEFAULT_BACKEND` si no existe."""
+    for backend in BACKENDS.values():
+        if backend.name != DEFAULT_BACKEND and backend.matches(vault_file):
+            return backend
+    return BACKENDS[DEFAULT_BACKEND]
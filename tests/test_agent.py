@@ -0,0 +1,93 @@
+import os
+import socket
+import stat
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from password_vault import agent
+from password_vault.core import VaultSession, load_or_create_vault, search_vault
+
+
+@unittest.skipUnless(hasattr(socket, "AF_UNIX"), "requiere sockets Unix")
+class TestAgent(unittest.TestCase):
+    """Pruebas unitarias para el agente de desbloqueo."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.vault_file = os.path.join(self.tmpdir.name, "vault.json")
+        load_or_create_vault(self.vault_file, "maestra")
+        self.server = agent.VaultAgent(os.path.join(self.tmpdir.name, "agent.sock"), idle_timeout=60)
+        thread = threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_unlock_list_get_add(self):
+        self.assertEqual(stat.S_IMODE(os.stat(self.server.path).st_mode), 0o600)
+        with agent.connect(self.server.path) as client:
+            with self.assertRaises(agent.AgentError) as ctx:
+                client.list(self.vault_file)
+            self.assertEqual(ctx.exception.code, "locked")
+            with self.assertRaises(ValueError):
+                client.unlock(self.vault_file, "otra")
+            self.assertEqual(client.unlock(self.vault_file, "maestra"), 0)
+            client.add(self.vault_file, {"title": "GitHub", "username": "ana", "password": "Secreta#123"})
+            client.add(self.vault_file, {"title": "Correo", "username": "ana", "password": "x"})
+            self.assertEqual([s["title"] for s in client.list(self.vault_file)], ["GitHub", "Correo"])
+            self.assertEqual(client.get(self.vault_file, "GitHub")[0]["password"], "Secreta#123")
+            # Mismas coincidencias que la búsqueda sin agente
+            for query in ("git", "ana github", "ANA", "correo banco", ""):
+                self.assertEqual(client.get(self.vault_file, query), search_vault(self.vault_file, "maestra", query))
+            # Los cambios de otros procesos se incorporan sin volver a desbloquear
+            with VaultSession.open(self.vault_file, "maestra") as session:
+                session.add_entry({"title": "Banco", "password": "y"})
+            self.assertEqual(len(client.list(self.vault_file)), 3)
+            client.lock()
+            with self.assertRaises(agent.AgentError):
+                client.get(self.vault_file, "github")
+        data, _ = load_or_create_vault(self.vault_file, "maestra")
+        self.assertEqual(len(data["entries"]), 3)
+
+    def test_idle_sessions_expire_and_second_agent_is_rejected(self):
+        with self.assertRaises(agent.AgentError):
+            agent.VaultAgent(self.server.path)
+        with agent.connect(self.server.path) as client:
+            client.unlock(self.vault_file, "maestra")
+            self.assertEqual(self.server.expire_idle(), 0)
+            self.server.idle_timeout = 0
+            self.assertEqual(self.server.expire_idle(), 1)
+            self.assertEqual(client.request("ping")["vaults"], [])
+        self.assertIsNone(agent.connect(os.path.join(self.tmpdir.name, "missing.sock")))
+
+    def test_slow_unlock_does_not_block_other_vaults(self):
+        other = os.path.join(self.tmpdir.name, "otra.json")
+        load_or_create_vault(other, "maestra")
+        started, release = threading.Event(), threading.Event()
+        real_open = VaultSession.open
+
+        def slow_open(path, password):
+            if path == os.path.realpath(self.vault_file):
+                started.set()
+                release.wait(10)
+            return real_open(path, password)
+
+        with agent.connect(self.server.path) as client:
+            client.unlock(other, "maestra")
+            with mock.patch.object(agent.VaultSession, "open", side_effect=slow_open):
+                with agent.connect(self.server.path) as slow:
+                    thread = threading.Thread(target=slow.unlock, args=(self.vault_file, "maestra"))
+                    thread.start()
+                    self.assertTrue(started.wait(10))
+                    # Mientras se deriva la clave de una bóveda, las demás responden
+                    self.assertEqual(client.request("ping")["vaults"], [os.path.realpath(other)])
+                    self.assertEqual(client.list(other), [])
+                    release.set()
+                    thread.join(10)
+            self.assertEqual(len(client.request("ping")["vaults"]), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from password_vault import aio
+from password_vault.auth import create_user
+from password_vault.cloud import LocalCloudSync
+
+
+class TestAio(unittest.TestCase):
+    """Pruebas unitarias para la API asíncrona."""
+
+    def tearDown(self):
+        aio.configure(max_concurrency=aio.DEFAULT_CONCURRENCY)
+
+    def test_coroutines_wrap_blocking_api(self):
+        async def scenario(tmpdir):
+            vault_file = os.path.join(tmpdir, "vault.json")
+            data, key = await aio.aload_vault(vault_file, "clave")
+            data["entries"].append({"title": "Async"})
+            await aio.asave_vault(vault_file, data, key)
+            loaded, _ = await aio.aload_vault(vault_file, "clave")
+            self.assertEqual(loaded["entries"][0]["title"], "Async")
+            db_file = os.path.join(tmpdir, "users.json")
+            create_user("ana", "secreta123", db_file)
+            self.assertTrue(await aio.aauthenticate("ana", "secreta123", db_file))
+            self.assertFalse(await aio.aauthenticate("ana", "otra", db_file))
+            sync = LocalCloudSync(os.path.join(tmpdir, "nube"))
+            self.assertTrue(await aio.async_sync_vault(sync, vault_file))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            asyncio.run(scenario(tmpdir))
+
+    def test_concurrency_is_bounded_and_survives_cancellation(self):
+        state = {"running": 0, "peak": 0}
+        lock = threading.Lock()
+
+        def slow_load(vault_file, password):
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            time.sleep(0.05)
+            with lock:
+                state["running"] -= 1
+            return {"entries": []}, b"k"
+
+        async def scenario():
+            aio.configure(max_concurrency=2)
+            with mock.patch.object(aio, "load_or_create_vault", slow_load):
+                # Una carga cancelada mantiene su plaza hasta terminar
+                task = asyncio.ensure_future(aio.aload_vault("a", "p"))
+                await asyncio.sleep(0.01)
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+                results = await asyncio.gather(*(aio.aload_vault(str(i), "p") for i in range(6)))
+            self.assertEqual(len(results), 6)
+            self.assertEqual(state["peak"], 2)
+
+        asyncio.run(scenario())
+
+
+if __name__ == '__main__':
+    unittest.main()
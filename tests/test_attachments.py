@@ -0,0 +1,67 @@
+"""Pruebas de los adjuntos cifrados por fragmentos."""
+
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from password_vault import attachments, core
+from password_vault.core import VaultIntegrityError, load_or_create_vault, save_vault
+
+
+class TestAttachments(unittest.TestCase):
+    def test_attachments_are_chunked_deduplicated_and_never_loaded(self):
+        """Los fragmentos iguales se guardan una vez y abrir la bóveda no los lee."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vault_file = os.path.join(tmpdir, "vault.json")
+            data, key = load_or_create_vault(vault_file, "maestra")
+            size = attachments.ATTACHMENT_CHUNK_SIZE
+            content = os.urandom(size) * 3 + b"final"
+            source = os.path.join(tmpdir, "id_ed25519")
+            with open(source, "wb") as f:
+                f.write(content)
+            ref = attachments.store_attachment(vault_file, key, source)
+            self.assertEqual((ref["name"], ref["size"], len(ref["chunks"])), ("id_ed25519", len(content), 4))
+            # Tres fragmentos idénticos y el final: dos archivos
+            self.assertEqual(len(attachments.list_chunks(attachments.chunk_dir(vault_file))), 2)
+            copy = attachments.store_attachment(vault_file, key, io.BytesIO(content), name="copia")
+            self.assertEqual(copy["chunks"], ref["chunks"])
+            self.assertEqual(len(attachments.list_chunks(attachments.chunk_dir(vault_file))), 2)
+            with open(attachments.chunk_path(vault_file, ref["chunks"][0][0]), "rb") as f:
+                self.assertNotIn(content[:64], f.read())
+
+            data["entries"] = [{"id": "1", "title": "Servidor", "attachments": [ref]}]
+            save_vault(vault_file, data, key)
+            with mock.patch.object(attachments, "_read_chunk", side_effect=AssertionError("adjunto leído")):
+                loaded, _ = load_or_create_vault(vault_file, "maestra")
+            loaded_ref = loaded["entries"][0]["attachments"][0]
+            self.assertEqual(attachments.read_attachment(vault_file, loaded_ref), content)
+            # Las referencias conservan sus claves tras cambiar la contraseña
+            core.change_password(vault_file, "maestra", "nueva")
+            target = os.path.join(tmpdir, "extraido")
+            attachments.extract_attachment(vault_file, loaded_ref, target)
+            with open(target, "rb") as f:
+                self.assertEqual(f.read(), content)
+
+            # Un fragmento manipulado se rechaza
+            path = attachments.chunk_path(vault_file, ref["chunks"][-1][0])
+            with open(path, "r+b") as f:
+                f.seek(-1, os.SEEK_END)
+                last = f.read(1)
+                f.seek(-1, os.SEEK_END)
+                f.write(bytes([last[0] ^ 1]))
+            with self.assertRaises(VaultIntegrityError):
+                attachments.read_attachment(vault_file, ref)
+            # Y también uno truncado antes de su etiqueta
+            with open(path, "r+b") as f:
+                f.truncate(len(attachments.CHUNK_MAGIC) + 8)
+            with self.assertRaises(ValueError):
+                attachments.read_attachment(vault_file, ref)
+            # Sin referencias, los fragmentos se eliminan
+            self.assertEqual(attachments.prune_chunks(vault_file, [{"id": "1"}]), 2)
+            self.assertEqual(attachments.list_chunks(attachments.chunk_dir(vault_file)), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,14 @@
+import io
 import os
 import tempfile
 import time
 import unittest
+from unittest import mock
 
+from password_vault import attachments
 from password_vault.cloud import LocalCloudSync
+from password_vault.core import journal_path, load_or_create_vault, save_vault, vault_lock
+from password_vault.storage import WAL_SUFFIXES
 
 
 class TestCloud(unittest.TestCase):
@@ -47,6 +52,96 @@ class TestCloud(unittest.TestCase):
             with open(vault_file, "rb") as f:
                 self.assertEqual(f.read(), remote_contents_3)
 
+    def test_journal_travels_with_vault(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vault_file = os.path.join(tmpdir, "vault.json")
+            with open(vault_file, "wb") as f:
+                f.write(b"instantanea")
+            with open(journal_path(vault_file), "wb") as f:
+                f.write(b"diario")
+            sync = LocalCloudSync(os.path.join(tmpdir, "cloud"))
+            self.assertTrue(sync.upload_vault(vault_file))
+            remote_journal = journal_path(os.path.join(tmpdir, "cloud", "vault.json"))
+            with open(remote_journal, "rb") as f:
+                self.assertEqual(f.read(), b"diario")
+            # Al subir una bóveda sin diario se elimina el diario remoto obsoleto
+            os.remove(journal_path(vault_file))
+            self.assertTrue(sync.upload_vault(vault_file))
+            self.assertFalse(os.path.exists(remote_journal))
+
+    def test_switching_backends_removes_stale_companions(self):
+        """Subir una bóveda SQLite sobre una v2 elimina su diario, y al revés su WAL."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            sync = LocalCloudSync(os.path.join(tmpdir, "cloud"))
+            remote = os.path.join(tmpdir, "cloud", "vault.db")
+            file_vault = os.path.join(tmpdir, "archivo", "vault.db")
+            sqlite_vault = os.path.join(tmpdir, "sqlite", "vault.db")
+            os.makedirs(os.path.dirname(file_vault))
+            os.makedirs(os.path.dirname(sqlite_vault))
+            with open(file_vault, "wb") as f:
+                f.write(b"instantanea")
+            with open(journal_path(file_vault), "wb") as f:
+                f.write(b"diario")
+            self.assertTrue(sync.upload_vault(file_vault))
+            data, key = load_or_create_vault(sqlite_vault, "maestra", backend="sqlite")
+            data["entries"] = [{"id": "1", "title": "Correo"}]
+            save_vault(sqlite_vault, data, key)
+            os.utime(sqlite_vault, (time.time() + 10, time.time() + 10))
+            self.assertTrue(sync.upload_vault(sqlite_vault))
+            self.assertFalse(os.path.exists(journal_path(remote)))
+            self.assertEqual(load_or_create_vault(remote, "maestra")[0]["entries"], data["entries"])
+
+            for suffix in WAL_SUFFIXES:
+                with open(remote + suffix, "wb") as f:
+                    f.write(b"obsoleto")
+            os.utime(file_vault, (time.time() + 20, time.time() + 20))
+            self.assertTrue(sync.upload_vault(file_vault))
+            self.assertFalse(any(os.path.exists(remote + suffix) for suffix in WAL_SUFFIXES))
+            with open(remote, "rb") as f:
+                self.assertEqual(f.read(), b"instantanea")
+
+    def test_upload_and_download_lock_in_the_same_order(self):
+        """Subir y bajar toman los bloqueos en el mismo orden para no esperarse mutuamente."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vault_file = os.path.join(tmpdir, "vault.json")
+            with open(vault_file, "wb") as f:
+                f.write(b"instantanea")
+            sync = LocalCloudSync(os.path.join(tmpdir, "cloud"))
+            acquired = []
+
+            def recording_lock(path, exclusive=False):
+                acquired.append(os.path.realpath(path))
+                return vault_lock(path, exclusive=exclusive)
+
+            with mock.patch("password_vault.cloud.vault_lock", side_effect=recording_lock):
+                sync.upload_vault(vault_file)
+                upload = acquired[:]
+                del acquired[:]
+                sync.download_vault(vault_file)
+            self.assertEqual(acquired, upload)
+
+    def test_only_missing_chunks_are_copied(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vault_file = os.path.join(tmpdir, "vault.json")
+            with open(vault_file, "wb") as f:
+                f.write(b"instantanea")
+            key = os.urandom(32)
+            first = attachments.store_attachment(vault_file, key, io.BytesIO(b"certificado"), name="a.pem")
+            sync = LocalCloudSync(os.path.join(tmpdir, "cloud"))
+            self.assertTrue(sync.upload_vault(vault_file))
+            remote_file = os.path.join(tmpdir, "cloud", "vault.json")
+            remote_chunk = attachments.chunk_path(remote_file, first["chunks"][0][0])
+            inode = os.stat(remote_chunk).st_ino
+            second = attachments.store_attachment(vault_file, key, io.BytesIO(b"clave ssh"), name="id")
+            self.assertTrue(sync.upload_vault(vault_file))
+            # El fragmento que ya estaba en la nube no se vuelve a copiar
+            self.assertEqual(os.stat(remote_chunk).st_ino, inode)
+            self.assertEqual(attachments.read_attachment(remote_file, second), b"clave ssh")
+            # Y la descarga trae los fragmentos a otra copia local
+            download = os.path.join(tmpdir, "otra.json")
+            self.assertTrue(sync.download_vault(download, "vault.json"))
+            self.assertEqual(attachments.read_attachment(download, first), b"certificado")
+
 
 if __name__ == '__main__':
     unittest.main()
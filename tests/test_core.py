@@ -1,14 +1,40 @@
+import io
 import os
 import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
 
+from password_vault import core, crypto
 from password_vault.core import (
     derive_key,
     encrypt_data,
     decrypt_data,
     load_or_create_vault,
     save_vault,
+    iter_vault_entries,
+    VaultReader,
+    VaultWriter,
+    VAULT_MAGIC,
+    KeyCache,
+    key_cache,
+    VaultSession,
+    Vault,
+    append_journal,
+    journal_path,
+    LazyEntries,
+    entry_summaries,
+    load_vaults_parallel,
+    calibrate,
+    vault_lock,
+    vault_version,
+    VaultConflictError,
+    SeekableCipher,
+    _keystream,
+    _xor_bytes,
 )
+from password_vault.bench import _legacy_keystream, _legacy_xor
 
 
 class TestCore(unittest.TestCase):
@@ -44,6 +70,662 @@ class TestCore(unittest.TestCase):
             data3, _ = load_or_create_vault(vault_file, "clave")
             self.assertEqual(len(data3["entries"]), 1)
 
+    def test_bulk_cipher_matches_legacy_output(self):
+        """El motor en bloque debe producir exactamente los mismos bytes que el original."""
+        key = os.urandom(32)
+        nonce = os.urandom(16)
+        for length in (0, 1, 31, 32, 33, 1000):
+            stream = _keystream(key, nonce, length)
+            self.assertEqual(bytes(stream), _legacy_keystream(key, nonce, length))
+            data = os.urandom(length)
+            self.assertEqual(_xor_bytes(data, stream), _legacy_xor(data, stream))
+
+    def test_chunked_format_roundtrip(self):
+        """Las entradas deben repartirse en varios fragmentos y recuperarse en orden."""
+        key = os.urandom(32)
+        salt = os.urandom(16)
+        entries = [{"title": f"Sitio {i}", "password": "x" * i} for i in range(200)]
+        buffer = io.BytesIO()
+        with VaultWriter(buffer, key, salt, {"version": 1}, chunk_size=512) as writer:
+            for entry in entries:
+                writer.write_entry(entry)
+        self.assertTrue(buffer.getvalue().startswith(VAULT_MAGIC))
+        buffer.seek(0)
+        reader = VaultReader(buffer, key=key)
+        self.assertEqual(reader.salt, salt)
+        self.assertEqual(reader.meta, {"version": 1})
+        self.assertEqual(list(reader), entries)
+        # Una clave incorrecta se detecta al leer los metadatos
+        buffer.seek(0)
+        with self.assertRaises(ValueError):
+            VaultReader(buffer, key=os.urandom(32))
+
+    def test_v1_file_is_detected_and_migrated(self):
+        """Un archivo v1 se lee correctamente y se reescribe como v2 al guardar."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vault_file = os.path.join(tmpdir, "legacy.json")
+            salt = os.urandom(16)
+            key = derive_key("clave", salt)
+            with open(vault_file, "wb") as f:
+                f.write(encrypt_data({"entries": [{"title": "A", "password": "1"}]}, key, salt))
+            data, key2 = load_or_create_vault(vault_file, "clave")
+            self.assertEqual(key2, key)
+            self.assertEqual(list(iter_vault_entries(vault_file, "clave")), data["entries"])
+            save_vault(vault_file, data, key2)
+            with open(vault_file, "rb") as f:
+                self.assertEqual(f.read(len(VAULT_MAGIC)), VAULT_MAGIC)
+            data2, key3 = load_or_create_vault(vault_file, "clave")
+            self.assertEqual(data2, data)
+            self.assertEqual(key3, key)
+
+    def test_key_cache_ttl_lru_and_forget(self):
+        """La caché expira, expulsa por uso y borra las claves olvidadas."""
+        cache = KeyCache(max_size=2, ttl=60)
+        salt_a, salt_b, salt_c = os.urandom(16), os.urandom(16), os.urandom(16)
+        cache.put("pw", salt_a, b"a" * 32, iterations=1)
+        cache.put("pw", salt_b, b"b" * 32, iterations=1)
+        self.assertEqual(cache.get("pw", salt_a, iterations=1), b"a" * 32)
+        # Parámetros o contraseña distintos no coinciden
+        self.assertIsNone(cache.get("pw", salt_a, iterations=2))
+        self.assertIsNone(cache.get("otra", salt_a, iterations=1))
+        # salt_b es la menos usada y se expulsa; su búfer queda a cero
+        buffer_b = cache._entries[next(iter(cache._entries))][2]
+        cache.put("pw", salt_c, b"c" * 32, iterations=1)
+        self.assertIsNone(cache.get("pw", salt_b, iterations=1))
+        self.assertEqual(buffer_b, bytearray(32))
+        cache.forget(salt_a)
+        self.assertIsNone(cache.get("pw", salt_a, iterations=1))
+        self.assertEqual(len(cache), 1)
+        with mock.patch("password_vault.core.time.monotonic", return_value=time.monotonic() + 61):
+            self.assertIsNone(cache.get("pw", salt_c, iterations=1))
+        self.assertEqual(len(cache), 0)
+
+    def test_reopening_vault_uses_cached_key(self):
+        """Reabrir una bóveda con la misma contraseña no ejecuta PBKDF2."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vault_file = os.path.join(tmpdir, "vault.json")
+            load_or_create_vault(vault_file, "clave")
+            with mock.patch("password_vault.core.derive_key") as derive:
+                load_or_create_vault(vault_file, "clave")
+                derive.assert_not_called()
+            key_cache.forget()
+            with mock.patch("password_vault.core.derive_key", wraps=derive_key) as derive:
+                load_or_create_vault(vault_file, "clave")
+                derive.assert_called_once()
+
+    def test_session_coalesces_writes(self):
+        """Varias modificaciones seguidas producen una sola escritura."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vault_file = os.path.join(tmpdir, "vault.json")
+            session = VaultSession.open(vault_file, "clave", delay=0.05)
+            with mock.patch("password_vault.core.append_journal", wraps=append_journal) as write:
+                for i in range(20):
+                    session.add_entry({"title": f"Sitio {i}", "password": "x"})
+                session.update_entry(0, {"title": "Editado", "password": "y"})
+                session.delete_entry(1)
+                self.assertTrue(session.is_dirty)
+                self.assertEqual(len(session.dirty), 20)
+                deadline = time.monotonic() + 5
+                while session.is_dirty and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                self.assertEqual(write.call_count, 1)
+            self.assertFalse(session.is_dirty)
+            first_id = session.entries[0]["id"]
+            session.update_entry(0, {"title": "Otra vez", "password": "z"})
+            self.assertEqual(session.entries[0]["id"], first_id)
+            # Cerrar la sesión escribe lo pendiente sin esperar al temporizador
+            session.delay = 60
+            session.add_entry({"title": "Final", "password": "w"})
+            session.close()
+            data, _ = load_or_create_vault(vault_file, "clave")
+            self.assertEqual(len(data["entries"]), 20)
+            self.assertEqual(data["entries"][0]["title"], "Otra vez")
+            with self.assertRaises(ValueError):
+                session.add_entry({"title": "Tarde"})
+
+    def test_journal_appends_small_records_and_compacts(self):
+        """Una edición añade un registro al diario sin reescribir la instantánea."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vault_file = os.path.join(tmpdir, "vault.json")
+            data, key = load_or_create_vault(vault_file, "clave")
+            data["entries"] = [{"id": str(i), "title": f"Sitio {i}", "password": "x" * 50} for i in range(500)]
+            save_vault(vault_file, data, key)
+            with open(vault_file, "rb") as f:
+                snapshot = f.read()
+            session = VaultSession.open(vault_file, "clave", delay=60)
+            session.update_entry(3, {"title": "Editado", "password": "nueva"})
+            session.delete_entry(0)
+            session.add_entry({"title": "Nuevo", "password": "otra"})
+            session.flush()
+            with open(vault_file, "rb") as f:
+                self.assertEqual(f.read(), snapshot)
+            self.assertLess(os.path.getsize(journal_path(vault_file)), 1024)
+            # Un registro final incompleto (escritura interrumpida) se ignora
+            with open(journal_path(vault_file), "ab") as f:
+                f.write(b"\x00\x00\x01\x00basura")
+            expected = [dict(e) for e in session.entries]
+            reloaded, _ = load_or_create_vault(vault_file, "clave")
+            self.assertEqual(reloaded["entries"], expected)
+            self.assertEqual(list(iter_vault_entries(vault_file, "clave")), expected)
+            # La compactación integra el diario y lo elimina
+            self.assertTrue(session.compact())
+            self.assertFalse(os.path.exists(journal_path(vault_file)))
+            session.close()
+            reloaded, _ = load_or_create_vault(vault_file, "clave")
+            self.assertEqual(reloaded["entries"], expected)
+            # Un diario de una instantánea anterior no se aplica
+            append_journal(vault_file, key, "otra-instantanea", [{"op": "delete", "id": "5"}])
+            reloaded, _ = load_or_create_vault(vault_file, "clave")
+            self.assertEqual(reloaded["entries"], expected)
+
+    def test_records_layout_decrypts_lazily(self):
+        """En la disposición 'records' solo se descifran las entradas accedidas."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vault_file = os.path.join(tmpdir, "vault.json")
+            data, key = load_or_create_vault(vault_file, "clave")
+            data["entries"] = [{"title": f"Sitio {i}", "username": "u", "password": "Abc123!x" * (i % 3 + 1)} for i in range(50)]
+            save_vault(vault_file, data, key, layout="records")
+            with mock.patch("password_vault.core._read_record", wraps=core._read_record) as read:
+                loaded, _ = load_or_create_vault(vault_file, "clave")
+                entries = loaded["entries"]
+                self.assertIsInstance(entries, LazyEntries)
+                summaries = entry_summaries(entries)
+                self.assertEqual([s["title"] for s in summaries], [e["title"] for e in data["entries"]])
+                self.assertEqual(read.call_count, 0)
+                self.assertEqual(entries[7]["password"], data["entries"][7]["password"])
+                self.assertEqual(read.call_count, 1)
+                # Guardar copia los registros intactos sin descifrarlos
+                entries[7] = {"title": "Editado", "password": "nueva"}
+                del entries[0]
+                save_vault(vault_file, loaded, key)
+                self.assertEqual(read.call_count, 1)
+                # Las referencias siguen siendo válidas tras reescribir el archivo
+                self.assertEqual(entries[10]["title"], "Sitio 11")
+            reloaded, _ = load_or_create_vault(vault_file, "clave")
+            self.assertEqual(len(reloaded["entries"]), 49)
+            self.assertEqual(reloaded["entries"][6]["title"], "Editado")
+            self.assertEqual([e["title"] for e in iter_vault_entries(vault_file, "clave")],
+                             [e["title"] for e in reloaded["entries"]])
+            key_cache.forget()
+            with self.assertRaises(ValueError):
+                load_or_create_vault(vault_file, "otra")
+
+    def test_compression_codecs_roundtrip(self):
+        """Cada compresor se anota en la cabecera y se respeta al leer y reescribir."""
+        entries = [{"title": f"Sitio {i}", "username": "usuario", "password": "x" * 20} for i in range(200)]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            sizes = {}
+            for codec in core.CODECS:
+                for layout in ("stream", "records"):
+                    vault_file = os.path.join(tmpdir, f"{codec}-{layout}.vault")
+                    data, key = load_or_create_vault(vault_file, "clave")
+                    data["entries"] = entries
+                    save_vault(vault_file, data, key, layout=layout, codec=codec, level=1 if codec != "none" else None)
+                    header = core.read_file_header(vault_file)
+                    self.assertEqual((header["codec"], header["layout"]), (codec, layout))
+                    loaded, _ = load_or_create_vault(vault_file, "clave")
+                    self.assertEqual(list(loaded["entries"]), entries)
+                    # Sin indicar compresor se conserva el del archivo
+                    save_vault(vault_file, loaded, key)
+                    self.assertEqual(core.read_file_header(vault_file)["codec"], codec)
+                    self.assertEqual(list(iter_vault_entries(vault_file, "clave")), entries)
+                    sizes[codec, layout] = os.path.getsize(vault_file)
+            self.assertLess(sizes["zlib", "stream"], sizes["none", "stream"])
+
+    def test_load_vaults_parallel_reports_each_vault(self):
+        """Las bóvedas se abren en paralelo y los fallos se informan por bóveda."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            jobs = []
+            for i in range(3):
+                vault_file = os.path.join(tmpdir, f"u{i}_vault.json")
+                data, key = load_or_create_vault(vault_file, f"clave{i}")
+                data["entries"].append({"title": f"Sitio {i}", "password": "x"})
+                save_vault(vault_file, data, key)
+                jobs.append((vault_file, f"clave{i}"))
+            key_cache.forget()
+            jobs.append((jobs[0][0], "incorrecta"))
+            jobs.append((os.path.join(tmpdir, "falta_vault.json"), "clave"))
+            results = list(load_vaults_parallel(jobs, workers=3))
+            self.assertEqual(len(results), 5)
+            ok = {r.path: r for r in results if r.ok}
+            self.assertEqual(len(ok), 3)
+            for i, (path, _) in enumerate(jobs[:3]):
+                self.assertEqual(ok[path].data["entries"][0]["title"], f"Sitio {i}")
+                self.assertGreater(ok[path].seconds, 0)
+            errors = [r for r in results if not r.ok]
+            self.assertTrue(all(isinstance(r.error, ValueError) for r in errors))
+            self.assertFalse(os.path.exists(jobs[4][0]))
+
+    def test_kdf_parameters_are_stored_and_vaults_can_be_rekeyed(self):
+        """Los parámetros del KDF viajan en la cabecera y una sesión puede migrarlos."""
+        self.assertEqual(calibrate(0.001, sample_iterations=1000, repeat=1)["iterations"], core.MIN_KDF_ITERATIONS)
+        self.assertGreater(calibrate(10_000, sample_iterations=1000, repeat=1)["iterations"], core.MIN_KDF_ITERATIONS)
+        fast = {"algorithm": "sha256", "iterations": 120_000, "key_length": 32}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vault_file = os.path.join(tmpdir, "vault.json")
+            data, key = load_or_create_vault(vault_file, "clave", kdf=fast)
+            self.assertEqual(core.read_file_header(vault_file)["kdf"], fast)
+            data["entries"].append({"title": "Sitio", "password": "x"})
+            save_vault(vault_file, data, key)
+            key_cache.forget()
+            loaded, loaded_key = load_or_create_vault(vault_file, "clave")
+            self.assertEqual(loaded_key, key)
+            # Migrar a otros parámetros en la próxima escritura
+            slower = dict(fast, iterations=150_000)
+            with VaultSession.open(vault_file, "clave", kdf=slower) as session:
+                self.assertTrue(session.is_dirty)
+                self.assertEqual(core.read_file_header(vault_file)["kdf"], fast)
+            self.assertEqual(core.read_file_header(vault_file)["kdf"], slower)
+            key_cache.forget()
+            reloaded, _ = load_or_create_vault(vault_file, "clave")
+            self.assertEqual(reloaded["entries"][0]["title"], "Sitio")
+            with self.assertRaises(ValueError):
+                save_vault(vault_file, reloaded, key, kdf={"iterations": 10})
+
+    def test_version_checks_reject_concurrent_writers(self):
+        """Un escritor con una versión obsoleta falla en lugar de sobrescribir."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vault_file = os.path.join(tmpdir, "vault.json")
+            data, key = load_or_create_vault(vault_file, "clave")
+            self.assertEqual(vault_version(vault_file), 1)
+            first = VaultSession.open(vault_file, "clave", delay=60)
+            second = VaultSession.open(vault_file, "clave", delay=60)
+            first.add_entry({"title": "Primero"})
+            first.flush()
+            self.assertEqual(vault_version(vault_file), 2)
+            second.add_entry({"title": "Segundo"})
+            with self.assertRaises(VaultConflictError):
+                second.flush()
+            self.assertTrue(second.is_dirty)
+            with self.assertRaises(VaultConflictError):
+                second.close()
+            first.add_entry({"title": "Otro"})
+            first.flush(compact=True)
+            first.close()
+            self.assertEqual(vault_version(vault_file), 3)
+            loaded, _ = load_or_create_vault(vault_file, "clave")
+            self.assertEqual([e["title"] for e in loaded["entries"]], ["Primero", "Otro"])
+            with self.assertRaises(VaultConflictError):
+                save_vault(vault_file, data, key, expected_version=1)
+            save_vault(vault_file, loaded, key, expected_version=3)
+            self.assertEqual(vault_version(vault_file), 4)
+
+    def test_vault_lock_shares_readers_and_excludes_writers(self):
+        """Los lectores no se bloquean entre sí y un escritor espera a todos."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vault_file = os.path.join(tmpdir, "vault.json")
+            with vault_lock(vault_file):
+                with vault_lock(vault_file, timeout=0.05):
+                    pass
+                with self.assertRaises(VaultConflictError):
+                    with vault_lock(vault_file, exclusive=True, timeout=0.05):
+                        pass
+            with vault_lock(vault_file, exclusive=True):
+                with self.assertRaises(VaultConflictError):
+                    with vault_lock(vault_file, timeout=0.05):
+                        pass
+
+    def test_wrong_password_and_tampering_are_rejected_early(self):
+        """El KCV rechaza la contraseña sin descifrar y el MAC detecta manipulaciones."""
+        entries = [{"title": f"Sitio {i}", "password": os.urandom(8).hex()} for i in range(300)]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for layout in ("stream", "records"):
+                vault_file = os.path.join(tmpdir, f"{layout}.vault")
+                data, key = load_or_create_vault(vault_file, "clave")
+                data["entries"] = [dict(e) for e in entries]
+                save_vault(vault_file, data, key, layout=layout, codec="none")
+                key_cache.forget()
+                with mock.patch("password_vault.crypto.keystream", wraps=crypto.keystream) as stream:
+                    with self.assertRaises(ValueError):
+                        load_or_create_vault(vault_file, "otra")
+                    self.assertEqual(stream.call_count, 0)
+                with open(vault_file, 'rb') as f:
+                    original = f.read()
+                # Un bit cambiado en el cuerpo cifrado
+                body_offset = len(original) // 2
+                tampered = bytearray(original)
+                tampered[body_offset] ^= 0x01
+                with open(vault_file, 'wb') as f:
+                    f.write(tampered)
+                with self.assertRaises(core.VaultIntegrityError):
+                    loaded, _ = load_or_create_vault(vault_file, "clave")
+                    list(loaded["entries"])
+                # Un campo de la cabecera cubierto por el MAC
+                with open(vault_file, 'wb') as f:
+                    f.write(original.replace(b'"chunk_size": 65536', b'"chunk_size": 65535', 1))
+                with self.assertRaises(ValueError):
+                    loaded, _ = load_or_create_vault(vault_file, "clave")
+                    list(loaded["entries"])
+                # Sin el campo "mac" las etiquetas no pueden dejar de comprobarse
+                stripped = original.replace(b', "mac": "hmac-sha256"', b' ' * len(b', "mac": "hmac-sha256"'), 1)
+                self.assertNotEqual(stripped, original)
+                with open(vault_file, 'wb') as f:
+                    f.write(stripped)
+                with self.assertRaises(core.VaultIntegrityError):
+                    load_or_create_vault(vault_file, "clave")
+                with open(vault_file, 'wb') as f:
+                    f.write(original)
+            # Registros del diario
+            with VaultSession.open(vault_file, "clave", delay=60) as session:
+                session.add_entry({"title": "Diario"})
+            journal = journal_path(vault_file)
+            with open(journal, 'rb') as f:
+                raw = bytearray(f.read())
+            original = bytes(raw)
+            raw[-40] ^= 0x01
+            with open(journal, 'wb') as f:
+                f.write(raw)
+            with self.assertRaises(core.VaultIntegrityError):
+                load_or_create_vault(vault_file, "clave")
+            # Ni un diario sin "mac" para leer ni para añadirle registros
+            field = b', "mac": "hmac-sha256"'
+            with open(journal, 'wb') as f:
+                f.write(original.replace(field, b' ' * len(field), 1))
+            with self.assertRaises(core.VaultIntegrityError):
+                load_or_create_vault(vault_file, "clave")
+            with self.assertRaises(core.VaultIntegrityError):
+                append_journal(vault_file, key, core.read_file_header(vault_file)["snapshot"], [{"op": "delete", "id": "x"}])
+
+    def test_seekable_cipher_decrypts_arbitrary_ranges(self):
+        """Cualquier rango se descifra empezando en su bloque del contador."""
+        key, nonce = os.urandom(32), os.urandom(16)
+        plaintext = os.urandom(5000)
+        ciphertext = SeekableCipher(key, nonce).encrypt_range(0, plaintext)
+        self.assertEqual(ciphertext, _xor_bytes(plaintext, _keystream(key, nonce, len(plaintext))))
+        stored = b"cabecera" + ciphertext
+        from_bytes = SeekableCipher(key, nonce, stored, base=8)
+        from_file = SeekableCipher(key, nonce, io.BytesIO(stored), base=8)
+        for offset, length in ((0, 0), (0, 31), (5, 27), (31, 2), (32, 64), (1000, 1234), (4990, 10)):
+            expected = plaintext[offset:offset + length]
+            self.assertEqual(from_bytes.decrypt_range(offset, length), expected)
+            self.assertEqual(from_file.decrypt_range(offset, length), expected)
+            self.assertEqual(SeekableCipher(key, nonce).encrypt_range(offset, expected), ciphertext[offset:offset + length])
+        with mock.patch("password_vault.crypto.keystream", wraps=crypto.keystream) as stream:
+            from_file.decrypt_range(4000, 40)
+            self.assertLessEqual(stream.call_args.args[2], 40 + 31)
+        with self.assertRaises(ValueError):
+            from_bytes.decrypt_range(4990, 20)
+        with self.assertRaises(ValueError):
+            SeekableCipher(key, nonce).decrypt_range(0, 1)
+
+    def test_in_place_decrypt_wipes_buffers(self):
+        """El descifrado v1 y por ventanas trabaja en el sitio y borra el búfer."""
+        key, nonce = os.urandom(32), os.urandom(16)
+        plaintext = os.urandom(3 * core.CHUNK_SIZE + 100)
+        buffer = bytearray(SeekableCipher(key, nonce).encrypt_range(7, plaintext))
+        SeekableCipher(key, nonce).decrypt_into(7, buffer)
+        self.assertEqual(buffer, plaintext)
+        salt = os.urandom(16)
+        data = {"entries": [{"title": "Uno", "password": "s3creta"}]}
+        encrypted = encrypt_data(data, derive_key("maestra", salt), salt)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vault_file = os.path.join(tmpdir, "v1.vault")
+            with open(vault_file, 'wb') as f:
+                f.write(encrypted)
+            with mock.patch("password_vault.core._wipe", wraps=core._wipe) as wipe:
+                loaded, _ = load_or_create_vault(vault_file, "maestra")
+            self.assertEqual(loaded, data)
+            self.assertTrue(wipe.called)
+        buffer = bytearray(encrypted)
+        with self.assertRaises(ValueError):
+            core._decrypt_buffer(buffer, "otra")
+        self.assertEqual(buffer, b"")
+
+    def test_cipher_suites_are_seekable_and_vaults_migrate_on_save(self):
+        """Cada suite admite acceso aleatorio y las bóvedas migran a la suite por defecto."""
+        key, nonce = os.urandom(32), os.urandom(16)
+        for suite in core.CIPHER_SUITES:
+            cipher = SeekableCipher(key, nonce, suite=suite)
+            full = cipher.keystream(0, 3 * 65536)
+            for offset, length in ((0, 10), (65530, 20), (100000, 70000)):
+                self.assertEqual(cipher.keystream(offset, length), full[offset:offset + length])
+        with self.assertRaises(ValueError):
+            SeekableCipher(key, nonce, suite="rot13")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vault_file = os.path.join(tmpdir, "vault.json")
+            data, key = load_or_create_vault(vault_file, "maestra")
+            data["entries"] = [{"id": str(i), "title": f"T{i}", "password": "x"} for i in range(3)]
+            save_vault(vault_file, data, key, layout="records", suite=core.LEGACY_SUITE)
+            self.assertEqual(core.read_file_header(vault_file)["suite"], "sha256-ctr")
+            data, key = load_or_create_vault(vault_file, "maestra")
+            save_vault(vault_file, data, key)
+            self.assertEqual(core.read_file_header(vault_file)["suite"], core.DEFAULT_SUITE)
+            append_journal(vault_file, key, core.read_file_header(vault_file)["snapshot"],
+                           [{"op": "put", "entry": {"id": "9", "title": "Nueva"}}])
+            loaded, _ = load_or_create_vault(vault_file, "maestra")
+            self.assertEqual([e["title"] for e in loaded["entries"]], ["T0", "T1", "T2", "Nueva"])
+
+    def test_blind_index_decrypts_only_matching_records(self):
+        """La búsqueda con índice solo descifra los registros que coinciden."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vault_file = os.path.join(tmpdir, "vault.json")
+            data, key = load_or_create_vault(vault_file, "maestra")
+            data["entries"] = [
+                {"id": "1", "title": "GitHub personal", "username": "ana", "url": "https://www.github.com/login"},
+                {"id": "2", "title": "Correo", "username": "ana@example.com", "url": "https://mail.example.com"},
+                {"id": "3", "title": "Banco", "username": "ana", "url": ""},
+            ]
+            save_vault(vault_file, data, key, layout="records", index=True)
+            self.assertEqual(core.read_file_header(vault_file)["index"], core.INDEX_ALGORITHM)
+            with mock.patch.object(core, "_read_record", wraps=core._read_record) as read_record:
+                found = core.search_vault(vault_file, "maestra", "github")
+            self.assertEqual([e["id"] for e in found], ["1"])
+            self.assertEqual(read_record.call_count, 1)
+            self.assertEqual([e["id"] for e in core.search_vault(vault_file, "maestra", "ANA banco")], ["3"])
+            with self.assertRaises(ValueError):
+                core.search_vault(vault_file, "incorrecta", "github")
+            # El diario se aplica sobre los candidatos y el índice sobrevive a los guardados
+            with VaultSession.open(vault_file, "maestra", journal=True) as session:
+                session.add_entry({"id": "4", "title": "GitHub trabajo", "username": "ana"})
+                session.delete_entry(0)
+            self.assertEqual([e["id"] for e in core.search_vault(vault_file, "maestra", "github")], ["4"])
+            data, key = load_or_create_vault(vault_file, "maestra")
+            save_vault(vault_file, data, key)
+            self.assertIn("index", core.read_file_header(vault_file))
+            self.assertEqual([e["id"] for e in core.search_vault(vault_file, "maestra", "github")], ["4"])
+            # Manipular el índice se detecta
+            with open(vault_file, 'r+b') as f:
+                f.seek(-16, os.SEEK_END)
+                (offset,) = core._FOOTER.unpack(f.read(8))
+                f.seek(offset + core._FRAME.size + 2)
+                f.write(b"X")
+            with self.assertRaises(core.VaultIntegrityError):
+                core.search_vault(vault_file, "maestra", "github")
+            # Sin índice se recorre la bóveda completa
+            plain = os.path.join(tmpdir, "plain.json")
+            data, key = load_or_create_vault(plain, "maestra")
+            data["entries"] = [{"id": "1", "title": "GitHub", "username": "ana"}]
+            save_vault(plain, data, key)
+            self.assertEqual([e["id"] for e in core.search_vault(plain, "maestra", "github")], ["1"])
+
+    def test_change_password_rewrites_only_the_header(self):
+        """Cambiar la contraseña solo reescribe la cabecera y conserva la clave de datos."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vault_file = os.path.join(tmpdir, "vault.json")
+            data, key = load_or_create_vault(vault_file, "vieja")
+            data["entries"] = [{"id": str(i), "title": f"Sitio {i}", "password": os.urandom(8).hex()} for i in range(200)]
+            save_vault(vault_file, data, key, layout="records")
+            session = VaultSession.open(vault_file, "vieja", delay=60)
+            session.add_entry({"id": "nueva", "title": "Diario"})
+            session.flush()
+            with open(vault_file, 'rb') as f:
+                _, _, header_len = core._PREAMBLE.unpack(f.read(core._PREAMBLE.size))
+                header_size = core._PREAMBLE.size + header_len
+                body = f.read()[header_len:]
+            with mock.patch.object(core, "_read_record", wraps=core._read_record) as read_record:
+                core.change_password(vault_file, "vieja", "nueva", kdf={"iterations": 150_000})
+            read_record.assert_not_called()
+            with open(vault_file, 'rb') as f:
+                self.assertEqual(f.read()[header_size:], body)
+            key_cache.forget()
+            with self.assertRaises(ValueError):
+                load_or_create_vault(vault_file, "vieja")
+            loaded, loaded_key = load_or_create_vault(vault_file, "nueva")
+            self.assertEqual(loaded_key, key)
+            self.assertEqual(len(loaded["entries"]), 201)
+            self.assertEqual(core.read_file_header(vault_file)["kdf"]["iterations"], 150_000)
+            # Otra sesión abierta recarga sin la contraseña y puede seguir escribiendo
+            session.reload()
+            session.add_entry({"id": "otra", "title": "Tras el cambio"})
+            session.close()
+            self.assertEqual(len(load_or_create_vault(vault_file, "nueva")[0]["entries"]), 202)
+
+    def test_vault_file_is_read_and_its_header_updated_with_the_data_key(self):
+        """Con la clave de datos se leen cabecera, datos y versión, y se cambian campos no autenticados."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vault_file = os.path.join(tmpdir, "vault.json")
+            data, key = load_or_create_vault(vault_file, "maestra")
+            data["entries"] = [{"id": "1", "title": "Correo"}]
+            save_vault(vault_file, data, key)
+            append_journal(vault_file, key, core.read_file_header(vault_file)["snapshot"],
+                           [{"op": "put", "entry": {"id": "2", "title": "Banco"}}])
+            header, loaded, version = core.read_vault_file(vault_file, key)
+            self.assertEqual([e["id"] for e in loaded["entries"]], ["1", "2"])
+            self.assertEqual((header["kcv"], version), (crypto.key_check(key), vault_version(vault_file)))
+            with self.assertRaises(ValueError):
+                core.read_vault_file(vault_file, os.urandom(crypto.DATA_KEY_SIZE))
+            with self.assertRaises(ValueError):
+                core.update_header(vault_file, key, lambda current: {"suite": "otra"})
+            with self.assertRaises(VaultConflictError):
+                core.update_header(vault_file, key, lambda current: {"rotate": True}, expected_version=version - 1)
+            self.assertTrue(core.update_header(vault_file, key, lambda current: {"rotate": True})["rotate"])
+            self.assertEqual(core.read_vault_file(vault_file, key)[1]["entries"], loaded["entries"])
+            # Las bóvedas anteriores a la clave de datos también se actualizan
+            legacy = os.path.join(tmpdir, "legacy.json")
+            salt = os.urandom(16)
+            legacy_key = derive_key("vieja", salt)
+            save_vault(legacy, {"entries": [{"title": "A"}]}, legacy_key, salt)
+            self.assertNotIn("slots", core.read_file_header(legacy))
+            core.change_password(legacy, "vieja", "nueva")
+            loaded, loaded_key = load_or_create_vault(legacy, "nueva")
+            self.assertEqual((loaded["entries"][0]["title"], loaded_key), ("A", legacy_key))
+
+    def test_sharded_vault_rewrites_only_changed_shards(self):
+        """Las bóvedas 'sharded' se leen en paralelo y solo reescriben los fragmentos modificados."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vault_file = os.path.join(tmpdir, "vault.json")
+            data, key = load_or_create_vault(vault_file, "maestra")
+            data["entries"] = [{"id": str(i), "title": f"Sitio {i}", "password": os.urandom(8).hex()} for i in range(300)]
+            save_vault(vault_file, data, key, shards=4)
+            shards = core.shards_path(vault_file)
+            self.assertEqual(len(os.listdir(shards)), 4)
+            # Con varios núcleos los fragmentos se descifran en otros procesos
+            with mock.patch.object(core, "_PARALLEL_SHARD_BYTES", 0), mock.patch("os.cpu_count", return_value=2):
+                loaded, _ = load_or_create_vault(vault_file, "maestra")
+            by_id = {entry["id"]: entry for entry in loaded["entries"]}
+            self.assertEqual([by_id[entry["id"]] for entry in data["entries"]], data["entries"])
+            before = {}
+            for name in os.listdir(shards):
+                with open(os.path.join(shards, name), "rb") as f:
+                    before[name] = f.read()
+            loaded["entries"][0]["title"] = "Modificado"
+            with mock.patch.object(core, "VaultWriter", wraps=core.VaultWriter) as writer:
+                save_vault(vault_file, loaded, key)
+            # Un fragmento y el manifiesto
+            self.assertEqual(writer.call_count, 2)
+            after = set(os.listdir(shards))
+            (old,), (new,) = set(before) - after, after - set(before)
+            self.assertEqual(old[:3], new[:3])
+            self.assertEqual(sum(1 for _ in iter_vault_entries(vault_file, "maestra")), 300)
+            # Un fragmento sustituido por su versión anterior se rechaza
+            with open(os.path.join(shards, new), "wb") as f:
+                f.write(before[old])
+            with self.assertRaises(core.VaultIntegrityError):
+                load_or_create_vault(vault_file, "maestra")
+            save_vault(vault_file, data, key, layout="stream")
+            self.assertFalse(os.path.exists(shards))
+            self.assertEqual(load_or_create_vault(vault_file, "maestra")[0]["entries"], data["entries"])
+
+    def test_vault_readers_see_consistent_snapshots(self):
+        """Los lectores recorren versiones completas sin cerrojos mientras los lotes se publican."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vault_file = os.path.join(tmpdir, "vault.json")
+            vault = Vault.open(vault_file, "clave", delay=60)
+            with vault.batch() as batch:
+                ids = [batch.add({"title": f"Sitio {i}", "password": "p0"}) for i in range(200)]
+            before = vault.snapshot()
+            with self.assertRaises(TypeError):
+                before[0]["password"] = "x"
+            stop = threading.Event()
+            torn = []
+
+            def reader():
+                while not stop.is_set():
+                    passwords = {entry["password"] for entry in vault.snapshot()}
+                    if len(passwords) != 1:
+                        torn.append(passwords)
+
+            readers = [threading.Thread(target=reader) for _ in range(4)]
+            for thread in readers:
+                thread.start()
+            try:
+                for generation in range(1, 30):
+                    with vault.batch() as batch:
+                        for entry_id in ids:
+                            batch.update(entry_id, {**batch.get(entry_id), "password": f"p{generation}"})
+            finally:
+                stop.set()
+                for thread in readers:
+                    thread.join()
+            self.assertEqual(torn, [])
+            # Las versiones anteriores no cambian y un lote fallido no se publica
+            self.assertEqual({entry["password"] for entry in before}, {"p0"})
+            with self.assertRaises(KeyError):
+                with vault.batch() as batch:
+                    batch.delete(ids[0])
+                    batch.delete("no-existe")
+            self.assertEqual(len(vault.snapshot()), 200)
+            removed = vault.delete_entry(ids[0])
+            self.assertEqual(removed["password"], "p29")
+            self.assertIsNone(vault.snapshot().get(ids[0]))
+            self.assertEqual(vault.snapshot().revision, before.revision + 30)
+
+            # La sesión escribe los lotes y reload publica lo guardado en disco
+            vault.flush()
+            data, _ = load_or_create_vault(vault_file, "clave")
+            by_id = {entry["id"]: entry for entry in data["entries"]}
+            self.assertEqual(by_id, {entry["id"]: dict(entry) for entry in vault.snapshot()})
+            data["entries"].append({"id": "externo", "title": "Otro proceso"})
+            save_vault(vault_file, data, vault.session.key)
+            self.assertEqual(vault.reload().get("externo")["title"], "Otro proceso")
+            vault.close()
+
+    def test_vault_batches_keep_records_encrypted_and_versions_private(self):
+        """Un lote solo descifra en la sesión las entradas que cambia y no comparte diccionarios con la versión."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vault_file = os.path.join(tmpdir, "vault.json")
+            data, key = load_or_create_vault(vault_file, "clave")
+            data["entries"] = [{"id": str(i), "title": f"Sitio {i}", "password": "p"} for i in range(50)]
+            save_vault(vault_file, data, key, layout="records")
+            vault = Vault.open(vault_file, "clave", delay=60)
+
+            def encrypted():
+                return sum(isinstance(item, core._RecordRef) for item in vault.session.entries._items)
+
+            self.assertEqual(encrypted(), 50)
+            with vault.batch() as batch:
+                batch.update("3", {"title": "Cambiado", "password": "q"})
+                batch.delete("7")
+                batch.add({"id": "nuevo", "title": "Nuevo"})
+                batch.meta["tags"] = ["trabajo"]
+            self.assertEqual(encrypted(), 48)
+            self.assertEqual(core._entry_ids(vault.session.entries)[-1], "nuevo")
+            snapshot = vault.snapshot()
+            # Ni el lote ni la sesión pueden alterar la versión publicada
+            batch.meta["tags"] = ["otro"]
+            vault.session.entries[3]["title"] = "Alterado"
+            self.assertEqual(snapshot.meta["tags"], ["trabajo"])
+            self.assertEqual(snapshot.get("3")["title"], "Cambiado")
+            vault.session.entries[3]["title"] = "Cambiado"
+            vault.flush(compact=True)
+            reloaded, _ = load_or_create_vault(vault_file, "clave")
+            self.assertEqual(reloaded["tags"], ["trabajo"])
+            self.assertEqual(
+                {entry["id"]: entry for entry in reloaded["entries"]},
+                {entry["id"]: dict(entry) for entry in snapshot},
+            )
+            vault.close()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,39 @@
+"""Pruebas de las primitivas criptográficas."""
+
+import os
+import unittest
+
+from password_vault import crypto
+
+
+class TestKeySlots(unittest.TestCase):
+    def test_wrapped_key_opens_only_with_its_wrapping_key(self):
+        """Una ranura devuelve la clave de datos con su clave y rechaza cualquier otra o una manipulación."""
+        wrapping, data_key = os.urandom(32), os.urandom(crypto.DATA_KEY_SIZE)
+        slot = crypto.wrap_key(wrapping, data_key)
+        self.assertEqual(slot["type"], crypto.PASSWORD_SLOT)
+        self.assertNotIn(data_key.hex(), slot.values())
+        self.assertEqual(crypto.unwrap_key(wrapping, slot), data_key)
+        with self.assertRaises(ValueError):
+            crypto.unwrap_key(os.urandom(32), slot)
+        with self.assertRaises(ValueError):
+            crypto.unwrap_key(wrapping, dict(slot, key="00" * crypto.DATA_KEY_SIZE))
+        with self.assertRaises(ValueError):
+            crypto.unwrap_key(wrapping, {"type": crypto.PASSWORD_SLOT})
+
+    def test_open_data_key_checks_slots_and_kcv(self):
+        """La clave de datos sale de la ranura de la contraseña y debe coincidir con el KCV."""
+        derived, data_key = os.urandom(32), os.urandom(crypto.DATA_KEY_SIZE)
+        header = {"slots": [crypto.wrap_key(derived, data_key)], "kcv": crypto.key_check(data_key)}
+        self.assertEqual(crypto.open_data_key(header, derived), data_key)
+        # Sin ranuras la clave derivada es la de datos
+        self.assertEqual(crypto.open_data_key({"kcv": crypto.key_check(derived)}, derived), derived)
+        with self.assertRaises(ValueError):
+            crypto.open_data_key(dict(header, kcv=crypto.key_check(derived)), derived)
+        shared = {"slots": [dict(header["slots"][0], type="recipient")]}
+        with self.assertRaises(ValueError):
+            crypto.open_data_key(shared, derived)
+
+
+if __name__ == '__main__':
+    unittest.main()
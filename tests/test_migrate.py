@@ -0,0 +1,90 @@
+"""Pruebas de la migración masiva de bóvedas."""
+
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+from password_vault import core, migrate
+from password_vault.core import derive_key, encrypt_data, load_or_create_vault, save_vault
+
+
+class TestMigrate(unittest.TestCase):
+    def test_migration_resumes_from_checkpoint(self):
+        """Las bóvedas migradas se anotan y una ejecución interrumpida se reanuda sin repetirlas."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            source = os.path.join(tmpdir, "vaults")
+            os.makedirs(source)
+            # Una bóveda v1 y tres v2 'stream'
+            salt = os.urandom(16)
+            with open(os.path.join(source, "v0.json"), "wb") as f:
+                f.write(encrypt_data({"entries": [{"title": "Antigua"}]}, derive_key("clave0", salt), salt))
+            for i in range(1, 4):
+                path = os.path.join(source, f"v{i}.json")
+                data, key = load_or_create_vault(path, f"clave{i}")
+                data["entries"] = [{"id": str(n), "title": f"Sitio {n}"} for n in range(20)]
+                save_vault(path, data, key)
+            credentials = os.path.join(tmpdir, "claves.json")
+            with open(credentials, "w") as f:
+                json.dump({"v0.json": "clave0", "v1.json": "clave1", "v2.json": "clave2"}, f)
+            checkpoint = os.path.join(tmpdir, "progreso.jsonl")
+            common = [source, "--credentials", credentials, "--checkpoint", checkpoint, "--workers", "1"]
+            args = common + ["--layout", "records", "--kdf-iterations", "150000"]
+
+            # La primera ejecución se interrumpe tras migrar dos bóvedas
+            real = migrate._migrate_one
+            calls = []
+
+            def interrupted(path, *rest):
+                if len(calls) == 2:
+                    raise KeyboardInterrupt
+                calls.append(path)
+                return real(path, *rest)
+
+            with mock.patch.object(migrate, "_migrate_one", side_effect=interrupted), redirect_stdout(io.StringIO()):
+                with self.assertRaises(KeyboardInterrupt):
+                    migrate.main(args)
+            # La segunda solo migra las que faltan; v3 no tiene contraseña
+            with mock.patch.object(migrate, "_migrate_one", wraps=real) as migrate_one, redirect_stdout(io.StringIO()) as out:
+                self.assertEqual(migrate.main(args), 1)
+            self.assertEqual(
+                sorted(os.path.basename(call.args[0]) for call in migrate_one.call_args_list),
+                sorted({"v0.json", "v1.json", "v2.json", "v3.json"} - {os.path.basename(p) for p in calls}),
+            )
+            self.assertIn("2 ya migradas", out.getvalue())
+            self.assertIn("No hay contraseña", out.getvalue())
+            for i in range(3):
+                path = os.path.join(source, f"v{i}.json")
+                header = core.read_file_header(path)
+                self.assertEqual((header["layout"], header["kdf"]["iterations"]), ("records", 150_000))
+                self.assertIn("slots", header)
+                self.assertTrue(load_or_create_vault(path, f"clave{i}")[0]["entries"])
+            # Reanudar con otras opciones no mezcla formatos
+            with redirect_stdout(io.StringIO()):
+                self.assertEqual(migrate.main(common + ["--layout", "stream"]), 2)
+
+    def test_sqlite_vaults_are_migrated_with_their_backend(self):
+        """Las bóvedas SQLite se guardan con su backend y sus archivos WAL no se toman por bóvedas."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            source = os.path.join(tmpdir, "vaults")
+            os.makedirs(source)
+            path = os.path.join(source, "vault.db")
+            data, key = load_or_create_vault(path, "maestra", backend="sqlite")
+            data["entries"] = [{"id": str(n), "title": f"Sitio {n}"} for n in range(5)]
+            save_vault(path, data, key)
+            for suffix in ("-wal", "-shm"):
+                with open(path + suffix, "wb"):
+                    pass
+            self.assertEqual(migrate.discover_vaults(source), [path])
+
+            version = core.vault_version(path)
+            migrate.migrate_vault(path, "maestra", {"iterations": 150_000}, layout="records")
+            self.assertEqual(core.vault_version(path), version + 1)
+            self.assertEqual(load_or_create_vault(path, "maestra"), (data, key))
+
+
+if __name__ == '__main__':
+    unittest.main()
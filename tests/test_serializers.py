@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+
+from password_vault.core import load_or_create_vault, save_vault, iter_vault_entries, read_file_header
+from password_vault.serializers import SERIALIZERS, Serializer, get_serializer
+
+
+class TestSerializers(unittest.TestCase):
+    """Pruebas unitarias para los serializadores de entradas."""
+
+    ENTRIES = [
+        {"id": "a1", "title": "Correo", "username": "ana", "password": "ñandú€", "score": 42, "tags": ["x", "y"]},
+        {"title": "Sin id", "campo_propio": None, "activo": True, "ratio": 0.5, "grande": 2**70, "notes": "línea\nnueva"},
+        {},
+    ]
+
+    def test_each_serializer_roundtrips_entries_and_chunks(self):
+        for name, serializer in SERIALIZERS.items():
+            encoded = [serializer.dumps(entry) for entry in self.ENTRIES]
+            self.assertEqual([serializer.loads(item) for item in encoded], self.ENTRIES, name)
+            chunk = serializer.pack(encoded)
+            self.assertEqual([serializer.loads(item) for item in serializer.unpack(chunk)], self.ENTRIES, name)
+        binary = get_serializer("binary")
+        self.assertLess(len(binary.dumps(self.ENTRIES[0])), len(get_serializer("compact").dumps(self.ENTRIES[0])))
+        with self.assertRaises(ValueError):
+            binary.loads(binary.dumps(self.ENTRIES[0])[:-3])
+        with self.assertRaises(ValueError):
+            get_serializer("xml")
+
+    def test_incomplete_serializers_cannot_be_created(self):
+        """Un serializador sin todas sus operaciones falla al instanciarse, no al usarlo."""
+        class OnlyDumps(Serializer):
+            name = "incompleto"
+
+            def dumps(self, entry):
+                return b""
+
+        with self.assertRaises(TypeError):
+            OnlyDumps()
+
+    def test_serializer_is_recorded_in_header(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for layout in ("stream", "records"):
+                vault_file = os.path.join(tmpdir, f"{layout}.vault")
+                data, key = load_or_create_vault(vault_file, "clave")
+                data["entries"] = [dict(entry, id=f"e{i}") for i, entry in enumerate(self.ENTRIES)]
+                save_vault(vault_file, data, key, layout=layout, serializer="binary")
+                self.assertEqual(read_file_header(vault_file)["serializer"], "binary")
+                loaded, _ = load_or_create_vault(vault_file, "clave")
+                self.assertEqual(list(loaded["entries"]), data["entries"])
+                save_vault(vault_file, loaded, key)
+                self.assertEqual(read_file_header(vault_file)["serializer"], "binary")
+                self.assertEqual(list(iter_vault_entries(vault_file, "clave")), data["entries"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""Pruebas de las bóvedas compartidas entre usuarios."""
+
+import os
+import tempfile
+import unittest
+
+from password_vault import core, sharing
+from password_vault.auth import create_user, ensure_user_keys, load_user_db
+from password_vault.core import VaultConflictError, load_or_create_vault, save_vault
+
+
+def _body(vault_file):
+    """Bytes del archivo tras la cabecera (el cuerpo cifrado)."""
+    with open(vault_file, 'rb') as f:
+        _, _, header_len = core._PREAMBLE.unpack(f.read(core._PREAMBLE.size))
+        f.seek(header_len, os.SEEK_CUR)
+        return f.read()
+
+
+class TestSharing(unittest.TestCase):
+    def test_members_are_added_and_removed_without_touching_the_body(self):
+        """Las altas y bajas solo reescriben la cabecera y las bajas rotan la clave de forma diferida."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_file = os.path.join(tmpdir, "users.json")
+            for user in ("ana", "luis", "eva"):
+                create_user(user, f"clave-{user}", db_file)
+            # El registro no crea el par de claves
+            self.assertFalse(any("public_key" in record for record in load_user_db(db_file).values()))
+            vault_file = os.path.join(tmpdir, "equipo.vault")
+            data, key = load_or_create_vault(vault_file, "maestra")
+            data["entries"] = [{"id": str(i), "title": f"Sitio {i}", "password": os.urandom(8).hex()} for i in range(50)]
+            save_vault(vault_file, data, key)
+            with self.assertRaises(ValueError):
+                sharing.share_vault(vault_file, "maestra", "ana", db_file, ["luis"])
+            # El primer intento de apertura crea las claves aunque aún no sea miembro
+            with self.assertRaises(ValueError):
+                sharing.open_shared_vault(vault_file, "luis", "clave-luis", db_file)
+            with self.assertRaises(ValueError):
+                ensure_user_keys("eva", "otra", db_file)
+            ensure_user_keys("eva", "clave-eva", db_file)
+            self.assertEqual(sorted(u for u, r in load_user_db(db_file).items() if "public_key" in r), ["eva", "luis"])
+            body = _body(vault_file)
+            sharing.share_vault(vault_file, "maestra", "ana", db_file, members=["luis"], owner_password="clave-ana")
+            self.assertEqual(sharing.vault_members(vault_file), ["ana", "luis"])
+            self.assertEqual(_body(vault_file), body)
+            with self.assertRaises(ValueError):
+                load_or_create_vault(vault_file, "maestra")
+            loaded, luis_key = sharing.open_shared_vault(vault_file, "luis", "clave-luis", db_file)
+            self.assertEqual((luis_key, len(loaded["entries"])), (key, 50))
+            with self.assertRaises(ValueError):
+                sharing.open_shared_vault(vault_file, "luis", "otra", db_file)
+            with self.assertRaises(ValueError):
+                sharing.open_shared_vault(vault_file, "eva", "clave-eva", db_file)
+
+            # Un miembro guarda cambios con la clave de datos y conserva las ranuras
+            loaded["entries"].append({"id": "nuevo", "title": "Compartido"})
+            save_vault(vault_file, loaded, luis_key)
+            body = _body(vault_file)
+            self.assertEqual(sharing.add_members(vault_file, "luis", "clave-luis", db_file, ["eva", "ana"]), ["eva"])
+            self.assertEqual(_body(vault_file), body)
+            self.assertEqual(len(sharing.open_shared_vault(vault_file, "eva", "clave-eva", db_file)[0]["entries"]), 51)
+
+            # La baja solo quita la ranura; la rotación llega con la siguiente apertura
+            self.assertEqual(sharing.remove_members(vault_file, "ana", "clave-ana", db_file, ["luis"]), ["luis"])
+            self.assertEqual(_body(vault_file), body)
+            self.assertTrue(core.read_file_header(vault_file)["rotate"])
+            with self.assertRaises(ValueError):
+                sharing.open_shared_vault(vault_file, "luis", "clave-luis", db_file)
+            loaded, new_key = sharing.open_shared_vault(vault_file, "eva", "clave-eva", db_file)
+            self.assertNotEqual(new_key, key)
+            self.assertNotIn("rotate", core.read_file_header(vault_file))
+            self.assertEqual(sharing.vault_members(vault_file), ["ana", "eva"])
+            self.assertEqual(sharing.open_shared_vault(vault_file, "ana", "clave-ana", db_file)[1], new_key)
+            self.assertEqual(len(loaded["entries"]), 51)
+            # La clave antigua ya no abre la bóveda ni puede sobrescribirla
+            with self.assertRaises(VaultConflictError):
+                save_vault(vault_file, loaded, luis_key)
+            with self.assertRaises(ValueError):
+                sharing.remove_members(vault_file, "ana", "clave-ana", db_file, ["ana", "eva"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+"""Pruebas de los backends de almacenamiento."""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from password_vault import storage
+from password_vault.core import (
+    VaultConflictError,
+    VaultIntegrityError,
+    VaultSession,
+    load_or_create_vault,
+    save_vault,
+    vault_version,
+)
+
+
+class TestSQLiteBackend(unittest.TestCase):
+    def test_rows_are_encrypted_and_updated_one_by_one(self):
+        """Cada entrada es una fila cifrada con fichas de búsqueda y solo se reescriben las que cambian."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vault_file = os.path.join(tmpdir, "vault.db")
+            data, key = load_or_create_vault(vault_file, "maestra", backend="sqlite")
+            data["entries"] = [
+                {"id": str(i), "title": f"Sitio {i}", "username": "ana", "url": f"https://www.s{i % 5}.com/login"}
+                for i in range(20)
+            ]
+            data["tags"] = ["personal"]
+            save_vault(vault_file, data, key)
+            loaded, loaded_key = load_or_create_vault(vault_file, "maestra")
+            self.assertEqual((loaded, loaded_key), (data, key))
+            with self.assertRaises(ValueError):
+                load_or_create_vault(vault_file, "otra")
+            with self.assertRaises(ValueError):
+                save_vault(vault_file, data, key, layout="records")
+            with self.assertRaises(ValueError):
+                VaultSession.open(vault_file, "maestra")
+            with open(vault_file, "rb") as f:
+                raw = f.read()
+            self.assertNotIn(b"Sitio", raw)
+            self.assertNotIn(b"ana", raw)
+
+            # Un guardado solo vuelve a cifrar las filas modificadas
+            def rows():
+                with sqlite3.connect(vault_file) as connection:
+                    return dict(connection.execute("SELECT id_hash, nonce FROM entries"))
+
+            before = rows()
+            version = vault_version(vault_file)
+            loaded["entries"][3]["title"] = "Cambiado"
+            del loaded["entries"][0]
+            save_vault(vault_file, loaded, key, expected_version=version)
+            after = rows()
+            self.assertEqual(len(after), 19)
+            self.assertEqual(sum(before[id_hash] != nonce for id_hash, nonce in after.items()), 1)
+            with self.assertRaises(VaultConflictError):
+                save_vault(vault_file, loaded, key, expected_version=version)
+
+            backend = storage.get_backend("sqlite")
+            self.assertEqual(backend.get_entry(vault_file, key, "3")["title"], "Cambiado")
+            self.assertIsNone(backend.get_entry(vault_file, key, "0"))
+            entry_id = backend.put_entry(vault_file, key, {"title": "GitHub", "url": "github.com"})
+            self.assertEqual(vault_version(vault_file), version + 2)
+            self.assertEqual([e["id"] for e in backend.find_entries(vault_file, key, "domain", "GITHUB.com")], [entry_id])
+            self.assertEqual(len(backend.find_entries(vault_file, key, "username", "Ana")), 19)
+            backend.delete_entry(vault_file, key, "5")
+            self.assertEqual(len(load_or_create_vault(vault_file, "maestra")[0]["entries"]), 19)
+
+            # Una fila movida a otro id no supera la autenticación
+            with sqlite3.connect(vault_file) as connection:
+                (nonce, data_, tag), = connection.execute(
+                    "SELECT nonce, data, tag FROM entries ORDER BY position LIMIT 1"
+                )
+                connection.execute(
+                    "UPDATE entries SET nonce = ?, data = ?, tag = ? WHERE position = (SELECT MAX(position) FROM entries)",
+                    (nonce, data_, tag),
+                )
+            with self.assertRaises(VaultIntegrityError):
+                load_or_create_vault(vault_file, "maestra")
+
+    def test_old_rows_and_versions_cannot_be_restored(self):
+        """Reponer una fila o una versión anteriores, o borrar una fila, se detecta al abrir la bóveda."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vault_file = os.path.join(tmpdir, "vault.db")
+            data, key = load_or_create_vault(vault_file, "maestra", backend="sqlite")
+            data["entries"] = [{"id": str(i), "password": f"antigua-{i}"} for i in range(5)]
+            save_vault(vault_file, data, key)
+            backend = storage.get_backend("sqlite")
+
+            def snapshot():
+                with sqlite3.connect(vault_file) as connection:
+                    return (
+                        connection.execute("SELECT nonce, data, tag FROM entries WHERE position = 2").fetchone(),
+                        connection.execute("SELECT value FROM vault WHERE name = 'header'").fetchone()[0],
+                        connection.execute("SELECT value FROM vault WHERE name = 'meta'").fetchone()[0],
+                    )
+
+            old_row, old_header, old_meta = snapshot()
+            # Las posiciones empiezan en 1: la fila 2 es la del id "1"
+            backend.put_entry(vault_file, key, {"id": "1", "password": "nueva"})
+            _, header, meta = snapshot()
+            self.assertEqual(load_or_create_vault(vault_file, "maestra")[0]["entries"][1]["password"], "nueva")
+            tampering = [
+                ("UPDATE entries SET nonce = ?, data = ?, tag = ? WHERE position = 2", old_row),
+                ("UPDATE vault SET value = ? WHERE name = 'header'", (old_header,)),
+                ("UPDATE vault SET value = ? WHERE name = 'meta'", (old_meta,)),
+                ("DELETE FROM entries WHERE position = 4", ()),
+            ]
+            for statement, params in tampering:
+                with self.subTest(statement=statement):
+                    with sqlite3.connect(vault_file) as connection:
+                        saved = connection.execute("SELECT * FROM entries").fetchall()
+                        connection.execute(statement, params)
+                    with self.assertRaises(VaultIntegrityError):
+                        load_or_create_vault(vault_file, "maestra")
+                    with sqlite3.connect(vault_file) as connection:
+                        connection.execute("DELETE FROM entries")
+                        connection.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", saved)
+                        connection.execute("UPDATE vault SET value = ? WHERE name = 'header'", (header,))
+                        connection.execute("UPDATE vault SET value = ? WHERE name = 'meta'", (meta,))
+                    self.assertEqual(len(load_or_create_vault(vault_file, "maestra")[0]["entries"]), 5)
+
+    def test_lookup_tokens_and_positions_are_authenticated(self):
+        """Mover una ficha de búsqueda o una posición a otra fila no devuelve la entrada equivocada."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vault_file = os.path.join(tmpdir, "vault.db")
+            data, key = load_or_create_vault(vault_file, "maestra", backend="sqlite")
+            data["entries"] = [
+                {"id": "1", "title": "GitHub", "password": "GITHUBPW"},
+                {"id": "2", "title": "Bank", "password": "BANKPW"},
+            ]
+            save_vault(vault_file, data, key)
+            backend = storage.get_backend("sqlite")
+            self.assertEqual([e["password"] for e in backend.find_entries(vault_file, key, "title", "github")], ["GITHUBPW"])
+            with sqlite3.connect(vault_file) as connection:
+                tokens = dict(connection.execute("SELECT position, title_hash FROM entries"))
+                connection.execute("UPDATE entries SET title_hash = NULL WHERE position = 1")
+                connection.execute("UPDATE entries SET title_hash = ? WHERE position = 2", (tokens[1],))
+            with self.assertRaises(VaultIntegrityError):
+                backend.find_entries(vault_file, key, "title", "github")
+            with self.assertRaises(VaultIntegrityError):
+                load_or_create_vault(vault_file, "maestra")
+            with sqlite3.connect(vault_file) as connection:
+                connection.executemany(
+                    "UPDATE entries SET title_hash = ? WHERE position = ?", [(token, position) for position, token in tokens.items()]
+                )
+            self.assertEqual(len(load_or_create_vault(vault_file, "maestra")[0]["entries"]), 2)
+
+            # Intercambiar las posiciones tampoco supera la autenticación
+            with sqlite3.connect(vault_file) as connection:
+                connection.execute("UPDATE entries SET position = 3 WHERE position = 1")
+                connection.execute("UPDATE entries SET position = 1 WHERE position = 2")
+                connection.execute("UPDATE entries SET position = 2 WHERE position = 3")
+            with self.assertRaises(VaultIntegrityError):
+                load_or_create_vault(vault_file, "maestra")
+
+    def test_file_backend_is_the_default(self):
+        """Las bóvedas nuevas usan el archivo cifrado y sus escrituras por entrada van al diario."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vault_file = os.path.join(tmpdir, "vault.json")
+            data, key = load_or_create_vault(vault_file, "maestra")
+            data["entries"] = [{"id": "1", "title": "Correo", "url": "mail.example.com"}]
+            save_vault(vault_file, data, key)
+            self.assertEqual(storage.detect_backend(vault_file).name, "file")
+            with self.assertRaises(ValueError):
+                load_or_create_vault(vault_file, "maestra", backend="sqlite")
+            backend = storage.get_backend("file")
+            backend.put_entry(vault_file, key, {"id": "2", "title": "Banco", "url": "https://Mail.example.com/x"})
+            self.assertEqual(len(backend.find_entries(vault_file, key, "domain", "mail.example.com")), 2)
+            self.assertEqual(backend.get_entry(vault_file, key, "2")["title"], "Banco")
+            with self.assertRaises(ValueError):
+                storage.get_backend("redis")
+
+    def test_incomplete_backends_cannot_be_created(self):
+        """Un backend que no implementa todas las operaciones falla al instanciarse."""
+        class ReadOnly(storage.StorageBackend):
+            name = "solo-lectura"
+
+            def matches(self, vault_file):
+                return False
+
+        with self.assertRaises(TypeError):
+            ReadOnly()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,7 +4,7 @@ from tkinter import messagebox, simpledialog
 import os
 import threading
 import time
-from vault_core import load_or_create_vault, save_vault
+from vault_core import Vault, entry_summaries, key_cache
 from password_generator import generate_password, check_password_strength
 from cloud_sync import LocalCloudSync
 from security_audit import SecurityAudit, SecureClipboard
@@ -15,7 +15,8 @@ ctk.set_default_color_theme("blue")
 
 class PasswordVaultComplete:
     def __init__(self):
-        self.vault_data = None
+        # Bóveda compartida entre hilos: cada lectura recorre una versión inmutable
+        self.vault = None
         self.vault_key = None
         self.vault_file = "password_vault_complete.json"
         self.master_password = None
@@ -42,6 +43,8 @@ class PasswordVaultComplete:
         # Bind eventos para detectar actividad
         self.root.bind('<Key>', self.update_activity)
         self.root.bind('<Button>', self.update_activity)
+        # Garantizar que los cambios pendientes se escriben al cerrar
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         self.setup_login_screen()
         self.start_auto_lock_timer()
@@ -54,7 +57,7 @@ class PasswordVaultComplete:
         """Inicia el temporizador de auto-bloqueo"""
         def check_auto_lock():
             while True:
-                if self.vault_data is not None:  # Solo si hay sesión activa
+                if self.vault is not None:  # Solo si hay sesión activa
                     time_since_activity = time.time() - self.last_activity
                     if time_since_activity > (self.auto_lock_minutes * 60):
                         # Auto-bloquear
@@ -67,7 +70,7 @@ class PasswordVaultComplete:
         
     def auto_lock(self):
         """Bloquea automáticamente la aplicación"""
-        if self.vault_data is not None:
+        if self.vault is not None:
             messagebox.showinfo("Auto-bloqueo", f"La aplicación se ha bloqueado automáticamente después de {self.auto_lock_minutes} minutos de inactividad.")
             self.logout()
         
@@ -148,6 +151,17 @@ class PasswordVaultComplete:
         self.password_entry.bind("<Return>", lambda event: self.login())
         self.password_entry.focus()
         
+    def open_session(self, password):
+        """Abre la bóveda con escritura diferida y publica sus datos"""
+        if self.vault is not None:
+            self.vault.close()
+        self.vault = Vault.open(self.vault_file, password, on_error=self.on_save_error)
+        self.vault_key = self.vault.session.key
+
+    def on_save_error(self, error):
+        """Notifica un fallo de la escritura en segundo plano"""
+        self.root.after(0, lambda: messagebox.showerror("Error", f"Error al guardar la bóveda: {str(error)}"))
+
     def login(self):
         """Maneja el proceso de inicio de sesión normal"""
         password = self.password_entry.get()
@@ -157,7 +171,7 @@ class PasswordVaultComplete:
             return
             
         try:
-            self.vault_data, self.vault_key = load_or_create_vault(self.vault_file, password)
+            self.open_session(password)
             self.master_password = password
             self.update_activity()
             self.setup_main_screen()
@@ -197,7 +211,7 @@ class PasswordVaultComplete:
                 else:
                     messagebox.showwarning("Advertencia", "No se pudo sincronizar, usando versión local")
                 
-                self.vault_data, self.vault_key = load_or_create_vault(self.vault_file, password)
+                self.open_session(password)
                 self.master_password = password
                 self.update_activity()
                 self.setup_main_screen()
@@ -284,7 +298,7 @@ class PasswordVaultComplete:
         
         def audit_thread():
             try:
-                results = self.security_audit.audit_vault(self.vault_data)
+                results = self.security_audit.audit_vault(self.vault.snapshot().to_dict())
                 progress_dialog.destroy()
                 self.show_audit_results(results)
                 self.update_security_status()
@@ -412,7 +426,8 @@ class PasswordVaultComplete:
     
     def update_security_status(self):
         """Actualiza el estado de seguridad basado en la última auditoría"""
-        if not self.vault_data or not self.vault_data.get("entries"):
+        snapshot = self.vault.snapshot() if self.vault is not None else None
+        if not snapshot:
             self.security_status_label.configure(text="🛡️ Sin datos para auditar")
             return
         
@@ -421,7 +436,7 @@ class PasswordVaultComplete:
         duplicate_passwords = set()
         passwords_seen = set()
         
-        for entry in self.vault_data["entries"]:
+        for entry in snapshot:
             password = entry.get("password", "")
             strength = check_password_strength(password)
             
@@ -451,7 +466,11 @@ class PasswordVaultComplete:
                 success = self.cloud_sync.sync_vault(self.vault_file)
                 
                 if success:
-                    self.vault_data, self.vault_key = load_or_create_vault(self.vault_file, self.master_password)
+                    try:
+                        self.vault.reload()
+                    except ValueError:
+                        # La copia descargada usa otra clave: abrirla de nuevo con la contraseña
+                        self.open_session(self.master_password)
                     self.refresh_entries_list()
                     self.sync_status_label.configure(text="✅ Sincronizado")
                     messagebox.showinfo("Éxito", "Sincronización completada")
@@ -491,15 +510,17 @@ class PasswordVaultComplete:
         for widget in self.entries_frame.winfo_children():
             widget.destroy()
             
-        if not self.vault_data["entries"]:
+        # Toda la lista se construye a partir de una misma versión de la bóveda
+        snapshot = self.vault.snapshot()
+        if not snapshot:
             empty_label = ctk.CTkLabel(self.entries_frame, 
                                       text="No hay contraseñas guardadas.\n¡Agrega tu primera entrada!", 
                                       font=ctk.CTkFont(size=16))
             empty_label.pack(pady=50)
             return
             
-        # Crear entradas
-        for i, entry in enumerate(self.vault_data["entries"]):
+        # Crear entradas a partir de los resúmenes, sin descifrar contraseñas
+        for entry in entry_summaries(snapshot):
             entry_frame = ctk.CTkFrame(self.entries_frame)
             entry_frame.pack(fill="x", padx=5, pady=5)
             
@@ -516,12 +537,11 @@ class PasswordVaultComplete:
             username_label.pack(anchor="w")
             
             # Mostrar fortaleza de la contraseña
-            strength = check_password_strength(entry["password"])
             strength_color = {"Muy Fuerte": "green", "Fuerte": "blue", "Moderada": "orange", "Débil": "red"}
             strength_label = ctk.CTkLabel(info_frame, 
-                                           text=f"Fortaleza: {strength['strength']} ({strength['score']}/8)", 
+                                           text=f"Fortaleza: {entry['strength']} ({entry['score']}/8)", 
                                            font=ctk.CTkFont(size=10),
-                                           text_color=strength_color.get(strength['strength'], "gray"))
+                                           text_color=strength_color.get(entry['strength'], "gray"))
             strength_label.pack(anchor="w")
             
             # Botones de acción
@@ -529,25 +549,28 @@ class PasswordVaultComplete:
             action_frame.pack(side="right", padx=10, pady=10)
             
             copy_button = ctk.CTkButton(action_frame, text="📋 Copiar", width=80,
-                                           command=lambda idx=i: self.copy_password_secure(idx))
+                                           command=lambda entry_id=entry["id"]: self.copy_password_secure(entry_id))
             copy_button.pack(side="top", pady=2)
             
             view_button = ctk.CTkButton(action_frame, text="👁️ Ver", width=80,
-                                           command=lambda idx=i: self.view_password(idx))
+                                           command=lambda entry_id=entry["id"]: self.view_password(entry_id))
             view_button.pack(side="top", pady=2)
             
             edit_button = ctk.CTkButton(action_frame, text="✏️ Editar", width=80,
-                                           command=lambda idx=i: self.edit_entry(idx))
+                                           command=lambda entry_id=entry["id"]: self.edit_entry(entry_id))
             edit_button.pack(side="top", pady=2)
             
             delete_button = ctk.CTkButton(action_frame, text="🗑️ Eliminar", width=80,
-                                             command=lambda idx=i: self.delete_entry(idx))
+                                             command=lambda entry_id=entry["id"]: self.delete_entry(entry_id))
             delete_button.pack(side="top", pady=2)
     
-    def copy_password_secure(self, index):
+    def copy_password_secure(self, entry_id):
         """Copia la contraseña de forma segura con auto-limpieza"""
         self.update_activity()
-        password = self.vault_data["entries"][index]["password"]
+        entry = self.vault.snapshot().get(entry_id)
+        if entry is None:
+            return
+        password = entry["password"]
         
         # Intentar copia segura, si falla usar método básico
         if hasattr(self.secure_clipboard, 'copy'):
@@ -567,32 +590,33 @@ class PasswordVaultComplete:
         self.update_activity()
         self.entry_dialog()
         
-    def edit_entry(self, index):
+    def edit_entry(self, entry_id):
         """Edita la entrada especificada"""
         self.update_activity()
-        self.entry_dialog(edit_index=index)
+        self.entry_dialog(edit_id=entry_id)
         
-    def delete_entry(self, index):
+    def delete_entry(self, entry_id):
         """Elimina la entrada especificada"""
         self.update_activity()
-        entry = self.vault_data["entries"][index]
+        entry = self.vault.snapshot().get(entry_id)
+        if entry is None:
+            return
         if messagebox.askyesno("Confirmar", f"¿Estás seguro de eliminar '{entry['title']}'?"):
-            del self.vault_data["entries"][index]
-            self.save_vault()
+            self.vault.delete_entry(entry_id)
             self.refresh_entries_list()
             self.update_sync_status()
             self.update_security_status()
         
-    def entry_dialog(self, edit_index=None):
+    def entry_dialog(self, edit_id=None):
         """Diálogo para agregar/editar entradas"""
         dialog = ctk.CTkToplevel(self.root)
-        dialog.title("Agregar Entrada" if edit_index is None else "Editar Entrada")
+        dialog.title("Agregar Entrada" if edit_id is None else "Editar Entrada")
         dialog.geometry("500x500")
         dialog.transient(self.root)
         dialog.grab_set()
         
         # Datos existentes si estamos editando
-        existing_data = self.vault_data["entries"][edit_index] if edit_index is not None else {}
+        existing_data = (self.vault.snapshot().get(edit_id) or {}) if edit_id is not None else {}
         
         # Campos del formulario
         ctk.CTkLabel(dialog, text="Título:", font=ctk.CTkFont(size=14, weight="bold")).pack(pady=5)
@@ -660,12 +684,11 @@ class PasswordVaultComplete:
                 "password": pwd
             }
             
-            if edit_index is not None:
-                self.vault_data["entries"][edit_index] = entry_data
+            if edit_id is not None:
+                self.vault.update_entry(edit_id, entry_data)
             else:
-                self.vault_data["entries"].append(entry_data)
+                self.vault.add_entry(entry_data)
             
-            self.save_vault()
             self.refresh_entries_list()
             self.update_sync_status()
             self.update_security_status()
@@ -691,7 +714,7 @@ class PasswordVaultComplete:
         strength_label.configure(text=f"Fortaleza: {strength['strength']} ({strength['score']}/8)",
                                  text_color=strength_color.get(strength['strength'], "gray"))
     
-    def save_entry(self, dialog, title_entry, username_entry, password_entry, edit_index):
+    def save_entry(self, dialog, title_entry, username_entry, password_entry, edit_id):
         """Guarda la entrada en la bóveda"""
         title = title_entry.get().strip()
         username = username_entry.get().strip()
@@ -707,21 +730,22 @@ class PasswordVaultComplete:
             "password": password
         }
         
-        if edit_index is not None:
-            self.vault_data["entries"][edit_index] = entry_data
+        if edit_id is not None:
+            self.vault.update_entry(edit_id, entry_data)
         else:
-            self.vault_data["entries"].append(entry_data)
+            self.vault.add_entry(entry_data)
             
-        self.save_vault()
         self.refresh_entries_list()
         self.update_sync_status()
         self.update_security_status()
         dialog.destroy()
         
-    def view_password(self, index):
+    def view_password(self, entry_id):
         """Muestra la contraseña en un diálogo"""
         self.update_activity()
-        entry = self.vault_data["entries"][index]
+        entry = self.vault.snapshot().get(entry_id)
+        if entry is None:
+            return
         strength = check_password_strength(entry["password"])
         
         message = f"Título: {entry['title']}\n"
@@ -734,24 +758,39 @@ class PasswordVaultComplete:
         messagebox.showinfo("Detalles de la Entrada", message)
         
     def save_vault(self):
-        """Guarda la bóveda en el archivo"""
+        """Escribe inmediatamente los cambios pendientes de la sesión"""
+        if self.vault is None:
+            return
         try:
-            save_vault(self.vault_file, self.vault_data, self.vault_key)
+            self.vault.flush()
         except Exception as e:
             messagebox.showerror("Error", f"Error al guardar la bóveda: {str(e)}")
             
     def logout(self):
         """Cierra sesión y vuelve a la pantalla de login"""
-        if self.vault_data is not None:
+        if self.vault is not None:
             if messagebox.askyesno("Sincronizar", "¿Deseas sincronizar tus cambios con la nube antes de salir?"):
                 self.manual_sync()
         
-        self.vault_data = None
+        if self.vault is not None:
+            self.save_vault()
+            self.vault.close()
+            self.vault = None
         self.vault_key = None
         self.master_password = None
         self.selected_entry = None
+        # Olvidar las claves derivadas que la caché mantenía para recargas
+        key_cache.forget()
         self.setup_login_screen()
         
+    def on_close(self):
+        """Guarda los cambios pendientes y cierra la aplicación"""
+        if self.vault is not None:
+            self.save_vault()
+            self.vault.close()
+            self.vault = None
+        self.root.destroy()
+
     def run(self):
         """Inicia la aplicación"""
         self.root.mainloop()
@@ -8,10 +8,22 @@ derivar claves de cifrado.  De este modo, la interfaz de escritorio
 o móvil existente puede seguir importando ``vault_core`` sin cambios.
 """
 
-from password_vault.core import derive_key, load_or_create_vault, save_vault  # noqa: F401
+from password_vault.core import (  # noqa: F401
+    Vault,
+    VaultSession,
+    derive_key,
+    entry_summaries,
+    key_cache,
+    load_or_create_vault,
+    save_vault,
+)
 
 __all__ = [
+    "Vault",
+    "VaultSession",
     "derive_key",
+    "entry_summaries",
+    "key_cache",
     "load_or_create_vault",
     "save_vault",
 ]
\ No newline at end of file